@@ -150,6 +150,8 @@ min_day_sell_price = 15.0  # Daytime minimum energy sell (Export) price in cents
 always_sell_price = 75.0  # The price to sell (Export) regardless of remaining storage in cents / kWh
 min_sell_soc = 10  # The minimum battery State of Charge to make a sell decision 10 = 10%
 max_day_opportunistic_buy_price = 5.0  # Max price to pay to opportunistically grid-charge batteries in daytime
+min_arbitrage_margin = 0.0  # Forecast buy-low/sell-high margin (discounted, in cents / kWh) needed to import for it
+max_round_trips = 2  # Round trips to plan within the forecast when there is a buy-low/sell-high opportunity
 
 # Forecast Adjustments
 # Minimum house power usage to accept in the forecast (in Wh) in the event reported house_power is missing
@@ -183,6 +185,7 @@ min_house_power = [
 uncertainty_discount = 0.10  # 0.05 is 5% per hour. Larger values are more conservative.
 
 future_forecast_hours = 8.0  # Future forecast hours to consider. Forecasts beyond the battery's capacity are less useful.
+forecast_step_hours = 0.5  # buy_forecast and sell_forecast are half-hourly
 
 desired_daytime_battery_soc = 50.0  # noqa Desired daytime battery SOC
 
@@ -218,6 +221,150 @@ def update_reason(facility_name, buy_price, sell_price, lowest_buy_price, highes
     # Trim the reason to ensure it does not exceed 256 characters
     return reason[:256]
 
+# BEGIN FORECAST FEATURES (same block in david_edit_of_script.py and 20250307_refactor_script.py)
+# Everything the rules read from buy_forecast and sell_forecast, worked out in one pass over
+# each list, so the rules and update_reason read fields instead of re-scanning the lists,
+# and the buy-low/sell-high round trips found in them.
+# The discount factors (1 +/- uncertainty_discount) ** i are a table kept in user_cache.
+DISCOUNT_POWERS_KEY = "discount_powers_v1"
+
+
+def discount_powers(steps):
+    """([(1 + d) ** i], [(1 - d) ** i]) for i < steps and d = uncertainty_discount, from user_cache if unchanged."""
+    key = [uncertainty_discount, steps]
+    try:
+        cached = user_cache.get(DISCOUNT_POWERS_KEY)
+    except (NameError, AttributeError):
+        cached = None
+    if cached and cached["key"] == key:
+        return cached["buy"], cached["sell"]
+    buy_powers = [(1 + uncertainty_discount) ** i for i in range(steps)]
+    sell_powers = [(1 - uncertainty_discount) ** i for i in range(steps)]
+    try:
+        user_cache[DISCOUNT_POWERS_KEY] = {"key": key, "buy": buy_powers, "sell": sell_powers}
+    except (NameError, TypeError):
+        pass
+    return buy_powers, sell_powers
+
+
+def discounted(prices, powers):
+    """prices[i] * powers[i] over the first len(powers) prices, or None if any price is <= 0."""
+    if any(price <= 0 for price in prices):
+        return None
+    return [price * power for price, power in zip(prices, powers)]
+
+
+def forecast_features(buy_forecast, sell_forecast, steps):
+    """
+    Features of the first steps of the discounted forecasts. If either forecast is missing,
+    not a list or has a price <= 0, they are those of flat fallback forecasts instead.
+
+        buy, sell                   the discounted forecasts
+        buy_min, buy_argmin         cheapest discounted buy and its step (the first if tied)
+        sell_max, sell_argmax       dearest discounted sell and its step (the first if tied)
+        sell_suffix_max             dearest discounted sell at or after each step
+    """
+    buy_powers, sell_powers = discount_powers(steps)
+    buy = sell = None
+    if buy_forecast and isinstance(buy_forecast, list) and sell_forecast and isinstance(sell_forecast, list):
+        buy = discounted(buy_forecast, buy_powers)
+        sell = discounted(sell_forecast, sell_powers) if buy is not None else None
+    if buy is None or sell is None:
+        buy, sell = [100000] * steps, [1] * steps
+
+    low, low_at = None, None
+    for i, price in enumerate(buy):
+        if low is None or price < low:
+            low, low_at = price, i
+
+    high, high_at, suffix = None, None, [0.0] * len(sell)
+    for i in range(len(sell) - 1, -1, -1):
+        price = sell[i]
+        if high is None or price >= high:  # >= keeps the first step of a tie
+            high, high_at = price, i
+        suffix[i] = high
+
+    return {"buy": buy, "sell": sell, "buy_min": low, "buy_argmin": low_at, "sell_max": high,
+            "sell_argmax": high_at, "sell_suffix_max": suffix}
+
+
+def best_round_trip(features):
+    """
+    (buy step, sell step, margin c/kWh) of the most profitable single buy-then-sell pair in the
+    discounted forecasts, from the suffix maxima in O(n); None if no later sell beats a buy.
+    """
+    buy, suffix = features["buy"], features["sell_suffix_max"]
+    best = None
+    for i in range(min(len(buy), len(suffix)) - 1):
+        margin = suffix[i + 1] - buy[i]
+        if margin > 0 and (best is None or margin > best[2]):
+            best = (i, None, margin)
+    if best is None:
+        return None
+    return best[0], features["sell"].index(suffix[best[0] + 1], best[0] + 1), best[2]
+
+
+def round_trips(features, k, headroom_kWh, step_kWh):
+    """
+    Up to k round trips with the largest total value within the battery's limits, in time
+    order. A trip charges at one or more buy steps and then discharges at later sell steps;
+    a step moves at most step_kWh (a forecast step at max_charge_rate_kW) and no more than
+    headroom_kWh is held at once. Buying again after selling starts the next trip. Energy
+    still held at the end of the horizon is worth nothing. Dynamic programming over
+    (energy held, trips started, charging) at each step, O(n * k * headroom / step).
+    Returns [(buy steps, sell steps, value in cents)].
+    """
+    buy, sell = features["buy"], features["sell"]
+    if k <= 0 or headroom_kWh <= 0 or step_kWh <= 0:
+        return []
+    held = [0.0]  # energy held at each level: full steps, the last one partial
+    while held[-1] < headroom_kWh:
+        held.append(min(held[-1] + step_kWh, headroom_kWh))
+    top = len(held) - 1
+    best = {(0, 0, False): 0.0}
+    moves = []  # per step, {state: (state before, +1 buy / -1 sell / 0)}
+    for t in range(min(len(buy), len(sell))):
+        reached, came_from = {}, {}
+        for state, value in best.items():
+            level, used, charging = state
+            options = [(state, value, 0)]
+            if level < top and (charging or used < k):
+                options.append(((level + 1, used + (not charging), True),
+                                value - buy[t] * (held[level + 1] - held[level]), 1))
+            if level > 0:
+                options.append(((level - 1, used, False), value + sell[t] * (held[level] - held[level - 1]), -1))
+            for new_state, new_value, move in options:
+                if new_state not in reached or new_value > reached[new_state]:
+                    reached[new_state] = new_value
+                    came_from[new_state] = (state, move)
+        best = reached
+        moves.append(came_from)
+
+    state = max(best, key=best.get)
+    if best[state] <= 0:
+        return []
+    path = []
+    for t in range(len(moves) - 1, -1, -1):
+        state, move = moves[t][state]
+        path.append((t, state, move))
+    trips = []
+    for t, (level, used, charging), move in reversed(path):
+        if move > 0:
+            if not charging:
+                trips.append(([], [], 0.0))
+            trips[-1][0].append(t)
+            value = -buy[t] * (held[level + 1] - held[level])
+        elif move < 0:
+            trips[-1][1].append(t)
+            value = sell[t] * (held[level] - held[level - 1])
+        else:
+            continue
+        buys, sells, total = trips[-1]
+        trips[-1] = (buys, sells, total + value)
+    return trips
+# END FORECAST FEATURES
+
+
 # Initialize the code tracking variable
 code = ''
 
@@ -317,30 +464,11 @@ required_min_soc = reserve_factor * (estimated_consumption_kW / battery_capacity
 # Add scaling factor to code for logging
 code += f'Scale: {consumption_scaling:.2f}, '
 
-# Initialize the forecasts with default values
-discounted_buy_forecast = []
-discounted_sell_forecast = []
+# Discounted forecasts and everything the rules read from them (see FORECAST FEATURES)
+features = forecast_features(buy_forecast, sell_forecast, int(future_forecast_hours))
+discounted_buy_forecast = features["buy"]
+discounted_sell_forecast = features["sell"]
 
-try:
-    # Check if buy_forecast and sell_forecast are valid
-    if not buy_forecast or not isinstance(buy_forecast, list) or any(v <= 0 for v in buy_forecast):
-        raise ValueError("Invalid buy_forecast")
-    if not sell_forecast or not isinstance(sell_forecast, list) or any(v <= 0 for v in sell_forecast):
-        raise ValueError("Invalid sell_forecast")
-
-    # Apply the discount to forecasted buy prices up to future_forecast_hours
-    for i in range(int(future_forecast_hours)):
-        if i < len(buy_forecast):
-            discounted_buy_forecast.append(buy_forecast[i] * ((1 + uncertainty_discount) ** i))
-
-    # Apply the discount to forecasted sell prices up to future_forecast_hours
-    for i in range(int(future_forecast_hours)):
-        if i < len(sell_forecast):
-            discounted_sell_forecast.append(sell_forecast[i] * ((1 - uncertainty_discount) ** i))
-except ValueError as e:  # noqa
-    # If an error occurs, assign default values
-    discounted_buy_forecast = [100000] * int(future_forecast_hours)
-    discounted_sell_forecast = [1] * int(future_forecast_hours)
 # Calculate the index of the cutoff period for future forecasts based on sunrise and solar active hours
 cutoff_index = min(len(discounted_buy_forecast), int(solar_active_hours)) # noqa
 
@@ -357,8 +485,8 @@ if daytime:
     solar = 'export'
     code += 'Day, '
     reason = update_reason(
-        facility_name, buy_price, sell_price, min(discounted_buy_forecast), max(discounted_sell_forecast),
-        discounted_buy_forecast.index(min(discounted_buy_forecast)), discounted_sell_forecast.index(max(discounted_sell_forecast)),
+        facility_name, buy_price, sell_price, features["buy_min"], features["sell_max"],
+        features["buy_argmin"], features["sell_argmax"],
         effective_house_power, sunrise_plus_active, sunset_minus_active, 'Daytime Default: No other rule applies',
         required_min_soc, code, hours_until_sunrise_plus_active, hours_until_sunset_minus_active, local_time,
         est_consumption_kW=estimated_consumption_kW
@@ -369,8 +497,8 @@ else:
     solar = 'export'
     code += 'Night, '
     reason = update_reason(
-        facility_name, buy_price, sell_price, min(discounted_buy_forecast), max(discounted_sell_forecast),
-        discounted_buy_forecast.index(min(discounted_buy_forecast)), discounted_sell_forecast.index(max(discounted_sell_forecast)),
+        facility_name, buy_price, sell_price, features["buy_min"], features["sell_max"],
+        features["buy_argmin"], features["sell_argmax"],
         effective_house_power, sunrise_plus_active, sunset_minus_active, 'Night Default: No other rule applies',
         required_min_soc, code, hours_until_sunrise_plus_active, hours_until_sunset_minus_active, local_time,
         est_consumption_kW=estimated_consumption_kW
@@ -382,8 +510,8 @@ if battery_soc < full_battery and (start_charging_time <= current_hour < peak_ti
     solar = 'export'
     code += 'IMPORT to fill battery before peak'
     reason = update_reason(
-        facility_name, buy_price, sell_price, min(discounted_buy_forecast), max(discounted_sell_forecast),
-        discounted_buy_forecast.index(min(discounted_buy_forecast)), discounted_sell_forecast.index(max(discounted_sell_forecast)),
+        facility_name, buy_price, sell_price, features["buy_min"], features["sell_max"],
+        features["buy_argmin"], features["sell_argmax"],
         effective_house_power, sunrise_plus_active, sunset_minus_active,
         'IMPORT to reach full battery by 4 PM',
         required_min_soc, code, hours_until_sunrise_plus_active, hours_until_sunset_minus_active, interval_time,
@@ -396,8 +524,8 @@ if battery_soc < full_battery and (buy_price <= max_day_opportunistic_buy_price)
     solar = 'export'
     code += 'Opportunistic Buy, '
     reason = update_reason(
-        facility_name, buy_price, sell_price, min(discounted_buy_forecast), max(discounted_sell_forecast),
-        discounted_buy_forecast.index(min(discounted_buy_forecast)), discounted_sell_forecast.index(max(discounted_sell_forecast)),
+        facility_name, buy_price, sell_price, features["buy_min"], features["sell_max"],
+        features["buy_argmin"], features["sell_argmax"],
         effective_house_power, sunrise_plus_active, sunset_minus_active,
         'Opportunistic Buy',
         required_min_soc, code, hours_until_sunrise_plus_active, hours_until_sunset_minus_active, interval_time,
@@ -409,8 +537,8 @@ elif sell_price >= always_sell_price and battery_soc > min_sell_soc:
     solar = 'export'
     code += 'Always Sell, '
     reason = update_reason(
-        facility_name, buy_price, sell_price, min(discounted_buy_forecast), max(discounted_sell_forecast),
-        discounted_buy_forecast.index(min(discounted_buy_forecast)), discounted_sell_forecast.index(max(discounted_sell_forecast)),
+        facility_name, buy_price, sell_price, features["buy_min"], features["sell_max"],
+        features["buy_argmin"], features["sell_argmax"],
         effective_house_power, sunrise_plus_active, sunset_minus_active,
         'Sell price exceeds the always sell price',
         required_min_soc, code, hours_until_sunrise_plus_active, hours_until_sunset_minus_active, local_time,
@@ -423,8 +551,8 @@ elif buy_price <= 0.0 and battery_soc < full_battery:
     solar = 'curtail'
     code += 'Neg FiT Import, '
     reason = update_reason(
-        facility_name, buy_price, sell_price, min(discounted_buy_forecast), max(discounted_sell_forecast),
-        discounted_buy_forecast.index(min(discounted_buy_forecast)), discounted_sell_forecast.index(max(discounted_sell_forecast)),
+        facility_name, buy_price, sell_price, features["buy_min"], features["sell_max"],
+        features["buy_argmin"], features["sell_argmax"],
         effective_house_power, sunrise_plus_active, sunset_minus_active,
         'Negative FiT: If buy price is <= 0, IMPORT electricity and CURTAIL solar', required_min_soc, code, hours_until_sunrise_plus_active,
         hours_until_sunset_minus_active, local_time,
@@ -437,8 +565,8 @@ elif sell_price < 0.0 and buy_price < abs(sell_price) and battery_soc > full_bat
     solar = 'curtail'
     code += 'Neg FiT Auto, '
     reason = update_reason(
-        facility_name, buy_price, sell_price, min(discounted_buy_forecast), max(discounted_sell_forecast),
-        discounted_buy_forecast.index(min(discounted_buy_forecast)), discounted_sell_forecast.index(max(discounted_sell_forecast)),
+        facility_name, buy_price, sell_price, features["buy_min"], features["sell_max"],
+        features["buy_argmin"], features["sell_argmax"],
         effective_house_power, sunrise_plus_active, sunset_minus_active,
         'Negative FiT: If EXPORT is more expensive than buy, action CHARGE and CURTAIL solar', required_min_soc, code,
         hours_until_sunrise_plus_active, hours_until_sunset_minus_active, local_time,
@@ -451,8 +579,8 @@ elif sell_price < 0.0 and battery_soc > full_battery:
     solar = 'curtail'
     code += 'Neg FiT Neg Sell, '
     reason = update_reason(
-        facility_name, buy_price, sell_price, min(discounted_buy_forecast), max(discounted_sell_forecast),
-        discounted_buy_forecast.index(min(discounted_buy_forecast)), discounted_sell_forecast.index(max(discounted_sell_forecast)),
+        facility_name, buy_price, sell_price, features["buy_min"], features["sell_max"],
+        features["buy_argmin"], features["sell_argmax"],
         effective_house_power, sunrise_plus_active, sunset_minus_active,
         'Negative FiT: If sell price < 0, action CHARGE and CURTAIL solar', required_min_soc, code, hours_until_sunrise_plus_active,
         hours_until_sunset_minus_active, local_time,
@@ -466,8 +594,8 @@ elif daytime:
         solar = 'export'
         code += 'Daytime and hi SoC, '
         reason = update_reason(
-            facility_name, buy_price, sell_price, min(discounted_buy_forecast), max(discounted_sell_forecast),
-            discounted_buy_forecast.index(min(discounted_buy_forecast)), discounted_sell_forecast.index(max(discounted_sell_forecast)),
+            facility_name, buy_price, sell_price, features["buy_min"], features["sell_max"],
+            features["buy_argmin"], features["sell_argmax"],
             effective_house_power, sunrise_plus_active, sunset_minus_active,
             'PV > 0 and high SoC: EXPORT excess',
             required_min_soc, code, hours_until_sunrise_plus_active, hours_until_sunset_minus_active, local_time,
@@ -478,8 +606,8 @@ elif daytime:
         solar = 'export'
         code += 'PV > 0 and lo SoC, '
         reason = update_reason(
-            facility_name, buy_price, sell_price, min(discounted_buy_forecast), max(discounted_sell_forecast),
-            discounted_buy_forecast.index(min(discounted_buy_forecast)), discounted_sell_forecast.index(max(discounted_sell_forecast)),
+            facility_name, buy_price, sell_price, features["buy_min"], features["sell_max"],
+            features["buy_argmin"], features["sell_argmax"],
             effective_house_power, sunrise_plus_active, sunset_minus_active,
             'PV > 0 and low SoC or low Sell Price',
             required_min_soc, code, hours_until_sunrise_plus_active, hours_until_sunset_minus_active, local_time,
@@ -492,15 +620,15 @@ else:
     if (
         buy_price < max_buy_price and
         battery_soc > required_min_soc and
-        sell_price >= max(discounted_sell_forecast) and
+        sell_price >= features["sell_max"] and
         sell_price >= min_sell_price
     ):
         action = 'export'
         solar = 'export'
         code += 'Sell Now, '
         reason = update_reason(
-            facility_name, buy_price, sell_price, min(discounted_buy_forecast), max(discounted_sell_forecast),
-            discounted_buy_forecast.index(min(discounted_buy_forecast)), discounted_sell_forecast.index(max(discounted_sell_forecast)),
+            facility_name, buy_price, sell_price, features["buy_min"], features["sell_max"],
+            features["buy_argmin"], features["sell_argmax"],
             effective_house_power, sunrise_plus_active, sunset_minus_active,
             'Fcst: Max sell price now; EXPORT if SOC > required', required_min_soc, code, hours_until_sunrise_plus_active,
             hours_until_sunset_minus_active, local_time,
@@ -508,11 +636,11 @@ else:
         )
 
     # If could have sold, but battery SoC is too low, say so:
-    elif sell_price >= max(discounted_sell_forecast) and sell_price >= min_sell_price:
+    elif sell_price >= features["sell_max"] and sell_price >= min_sell_price:
         code += 'Could Sell; lo SoC, '
         reason = update_reason(
-            facility_name, buy_price, sell_price, min(discounted_buy_forecast), max(discounted_sell_forecast),
-            discounted_buy_forecast.index(min(discounted_buy_forecast)), discounted_sell_forecast.index(max(discounted_sell_forecast)),
+            facility_name, buy_price, sell_price, features["buy_min"], features["sell_max"],
+            features["buy_argmin"], features["sell_argmax"],
             effective_house_power, sunrise_plus_active, sunset_minus_active,
             'Fcst: Max sell price now; SoC < required', required_min_soc, code, hours_until_sunrise_plus_active,
             hours_until_sunset_minus_active, local_time,
@@ -522,7 +650,7 @@ else:
     # If the buy price for the current period is the lowest in the forecast,
     # the battery SOC is less than the min SOC, and the buy price is <= max_buy_price, charge only at night
     elif (not daytime and
-          buy_price == min(discounted_buy_forecast) and
+          buy_price == features["buy_min"] and
           battery_soc < required_min_soc and
           buy_price <= max_buy_price and
           not (peak_time <= current_hour < peak_time_end)):
@@ -530,8 +658,8 @@ else:
         solar = 'export'
         code += 'Buy Now, min SoC, '
         reason = update_reason(
-            facility_name, buy_price, sell_price, min(discounted_buy_forecast), max(discounted_sell_forecast),
-            discounted_buy_forecast.index(min(discounted_buy_forecast)), discounted_sell_forecast.index(max(discounted_sell_forecast)),
+            facility_name, buy_price, sell_price, features["buy_min"], features["sell_max"],
+            features["buy_argmin"], features["sell_argmax"],
             effective_house_power, sunrise_plus_active, sunset_minus_active,
             'Fcst: Low buy price now; IMPORT if SOC < required and price <= max', required_min_soc, code, hours_until_sunrise_plus_active,
             hours_until_sunset_minus_active, local_time,
@@ -539,25 +667,24 @@ else:
         )
 
     else:
-        # Check if there's any future buy price lower than any future sell price within the forecast
-        buy_sell_opportunity_exists = False
-        for i in range(len(discounted_buy_forecast)):
-            for j in range(i + 1, len(discounted_sell_forecast)):
-                if discounted_buy_forecast[i] < discounted_sell_forecast[j]:
-                    buy_sell_opportunity_exists = True
-                    break
-            if buy_sell_opportunity_exists:
-                break
+        # Check if there's any future buy price lower than a later sell price within the forecast,
+        # and what the best round trips would make (see FORECAST FEATURES)
+        best_trip = best_round_trip(features)
+        buy_sell_opportunity_exists = best_trip is not None and best_trip[2] > min_arbitrage_margin
 
         if buy_sell_opportunity_exists and not (peak_time <= current_hour < peak_time_end):
             action = 'import'
             solar = 'export'
+            trips = round_trips(features, max_round_trips, remaining_energy_kWh,
+                                max_charge_rate_kW * forecast_step_hours)
+            trips_value = sum(value for _, _, value in trips) / 100
             code += 'Buy Low, Sell High, '
             reason = update_reason(
-                facility_name, buy_price, sell_price, min(discounted_buy_forecast), max(discounted_sell_forecast),
-                discounted_buy_forecast.index(min(discounted_buy_forecast)), discounted_sell_forecast.index(max(discounted_sell_forecast)),
+                facility_name, buy_price, sell_price, features["buy_min"], features["sell_max"],
+                features["buy_argmin"], features["sell_argmax"],
                 effective_house_power, sunrise_plus_active, sunset_minus_active,
-                f'Fcst: {sell_price} Buy low, sell high opportunity exists', required_min_soc, code, hours_until_sunrise_plus_active,
+                f'Fcst: {sell_price} Buy low, sell high opportunity exists: step {best_trip[0]} to {best_trip[1]} '
+                f'+{best_trip[2]:.1f}c, {len(trips)} trips ${trips_value:.2f}', required_min_soc, code, hours_until_sunrise_plus_active,
                 hours_until_sunset_minus_active, local_time,
                 est_consumption_kW=estimated_consumption_kW
             )
@@ -568,8 +695,8 @@ else:
                 solar = 'export'
                 code += 'Buy Low Battery, '
                 reason = update_reason(
-                    facility_name, buy_price, sell_price, min(discounted_buy_forecast), max(discounted_sell_forecast),
-                    discounted_buy_forecast.index(min(discounted_buy_forecast)), discounted_sell_forecast.index(max(discounted_sell_forecast)),
+                    facility_name, buy_price, sell_price, features["buy_min"], features["sell_max"],
+                    features["buy_argmin"], features["sell_argmax"],
                     effective_house_power, sunrise_plus_active, sunset_minus_active,
                     'Fcst: Buy Low Battery', required_min_soc, code, hours_until_sunrise_plus_active,
                     hours_until_sunset_minus_active, local_time,
@@ -159,296 +159,138 @@ for i in range(0, 24):  # Note: range(0, 24) instead of range(0, 23) to include
 
 
 
-# this is historical data from 2023-2024 - use this for rrp and for z score.
-
-QLD_HISTORICAL_PRICES = {1: {0: {'Average_RRP': 98.94, 'SD_RRP': 36.99},
-     1: {'Average_RRP': 89.85, 'SD_RRP': 32.51},
-     2: {'Average_RRP': 85.61, 'SD_RRP': 27.22},
-     3: {'Average_RRP': 83.0, 'SD_RRP': 25.91},
-     4: {'Average_RRP': 89.98, 'SD_RRP': 26.86},
-     5: {'Average_RRP': 98.2, 'SD_RRP': 37.22},
-     6: {'Average_RRP': 66.86, 'SD_RRP': 50.52},
-     7: {'Average_RRP': 49.48, 'SD_RRP': 48.82},
-     8: {'Average_RRP': 50.33, 'SD_RRP': 51.48},
-     9: {'Average_RRP': 52.52, 'SD_RRP': 57.15},
-     10: {'Average_RRP': 41.97, 'SD_RRP': 35.56},
-     11: {'Average_RRP': 46.0, 'SD_RRP': 40.69},
-     12: {'Average_RRP': 51.4, 'SD_RRP': 46.79},
-     13: {'Average_RRP': 64.98, 'SD_RRP': 55.76},
-     14: {'Average_RRP': 76.92, 'SD_RRP': 55.3},
-     15: {'Average_RRP': 104.05, 'SD_RRP': 388.42},
-     16: {'Average_RRP': 103.07, 'SD_RRP': 89.2},
-     17: {'Average_RRP': 242.15, 'SD_RRP': 1056.05},
-     18: {'Average_RRP': 890.99, 'SD_RRP': 2837.32},
-     19: {'Average_RRP': 225.82, 'SD_RRP': 601.69},
-     20: {'Average_RRP': 148.25, 'SD_RRP': 75.91},
-     21: {'Average_RRP': 126.08, 'SD_RRP': 53.83},
-     22: {'Average_RRP': 120.31, 'SD_RRP': 55.72},
-     23: {'Average_RRP': 106.04, 'SD_RRP': 43.46}},
- 2: {0: {'Average_RRP': 92.95, 'SD_RRP': 33.07},
-     1: {'Average_RRP': 85.94, 'SD_RRP': 27.85},
-     2: {'Average_RRP': 79.23, 'SD_RRP': 25.83},
-     3: {'Average_RRP': 76.41, 'SD_RRP': 20.67},
-     4: {'Average_RRP': 81.63, 'SD_RRP': 21.59},
-     5: {'Average_RRP': 104.99, 'SD_RRP': 37.37},
-     6: {'Average_RRP': 94.37, 'SD_RRP': 45.93},
-     7: {'Average_RRP': 52.65, 'SD_RRP': 49.16},
-     8: {'Average_RRP': 39.5, 'SD_RRP': 41.04},
-     9: {'Average_RRP': 38.84, 'SD_RRP': 42.73},
-     10: {'Average_RRP': 34.24, 'SD_RRP': 38.97},
-     11: {'Average_RRP': 36.06, 'SD_RRP': 38.12},
-     12: {'Average_RRP': 47.37, 'SD_RRP': 50.59},
-     13: {'Average_RRP': 55.31, 'SD_RRP': 53.25},
-     14: {'Average_RRP': 70.63, 'SD_RRP': 68.67},
-     15: {'Average_RRP': 80.43, 'SD_RRP': 78.08},
-     16: {'Average_RRP': 100.49, 'SD_RRP': 84.52},
-     17: {'Average_RRP': 278.4, 'SD_RRP': 1215.57},
-     18: {'Average_RRP': 411.39, 'SD_RRP': 1348.6},
-     19: {'Average_RRP': 195.68, 'SD_RRP': 453.77},
-     20: {'Average_RRP': 135.93, 'SD_RRP': 59.26},
-     21: {'Average_RRP': 114.78, 'SD_RRP': 46.89},
-     22: {'Average_RRP': 106.32, 'SD_RRP': 43.26},
-     23: {'Average_RRP': 95.32, 'SD_RRP': 29.58}},
- 3: {0: {'Average_RRP': 83.03, 'SD_RRP': 17.58},
-     1: {'Average_RRP': 77.14, 'SD_RRP': 16.56},
-     2: {'Average_RRP': 73.8, 'SD_RRP': 15.82},
-     3: {'Average_RRP': 74.29, 'SD_RRP': 16.28},
-     4: {'Average_RRP': 78.58, 'SD_RRP': 18.62},
-     5: {'Average_RRP': 93.13, 'SD_RRP': 25.21},
-     6: {'Average_RRP': 113.36, 'SD_RRP': 52.83},
-     7: {'Average_RRP': 59.18, 'SD_RRP': 39.31},
-     8: {'Average_RRP': 49.44, 'SD_RRP': 60.69},
-     9: {'Average_RRP': 42.5, 'SD_RRP': 61.49},
-     10: {'Average_RRP': 36.95, 'SD_RRP': 62.4},
-     11: {'Average_RRP': 32.21, 'SD_RRP': 63.77},
-     12: {'Average_RRP': 39.51, 'SD_RRP': 61.89},
-     13: {'Average_RRP': 60.39, 'SD_RRP': 72.38},
-     14: {'Average_RRP': 70.02, 'SD_RRP': 69.19},
-     15: {'Average_RRP': 81.95, 'SD_RRP': 57.52},
-     16: {'Average_RRP': 99.63, 'SD_RRP': 69.16},
-     17: {'Average_RRP': 256.39, 'SD_RRP': 1064.22},
-     18: {'Average_RRP': 413.53, 'SD_RRP': 1617.79},
-     19: {'Average_RRP': 137.0, 'SD_RRP': 63.32},
-     20: {'Average_RRP': 109.81, 'SD_RRP': 41.6},
-     21: {'Average_RRP': 96.66, 'SD_RRP': 25.61},
-     22: {'Average_RRP': 96.97, 'SD_RRP': 25.06},
-     23: {'Average_RRP': 90.57, 'SD_RRP': 22.03}},
- 4: {0: {'Average_RRP': 109.3, 'SD_RRP': 37.96},
-     1: {'Average_RRP': 98.73, 'SD_RRP': 31.95},
-     2: {'Average_RRP': 92.79, 'SD_RRP': 30.37},
-     3: {'Average_RRP': 91.99, 'SD_RRP': 28.09},
-     4: {'Average_RRP': 96.04, 'SD_RRP': 32.2},
-     5: {'Average_RRP': 105.02, 'SD_RRP': 39.95},
-     6: {'Average_RRP': 131.08, 'SD_RRP': 58.35},
-     7: {'Average_RRP': 68.72, 'SD_RRP': 49.48},
-     8: {'Average_RRP': 27.19, 'SD_RRP': 40.74},
-     9: {'Average_RRP': 14.26, 'SD_RRP': 43.92},
-     10: {'Average_RRP': 7.48, 'SD_RRP': 47.61},
-     11: {'Average_RRP': 11.01, 'SD_RRP': 47.55},
-     12: {'Average_RRP': 18.7, 'SD_RRP': 48.62},
-     13: {'Average_RRP': 32.29, 'SD_RRP': 48.12},
-     14: {'Average_RRP': 57.06, 'SD_RRP': 57.87},
-     15: {'Average_RRP': 74.86, 'SD_RRP': 49.01},
-     16: {'Average_RRP': 130.29, 'SD_RRP': 70.7},
-     17: {'Average_RRP': 259.28, 'SD_RRP': 172.02},
-     18: {'Average_RRP': 255.18, 'SD_RRP': 567.3},
-     19: {'Average_RRP': 140.33, 'SD_RRP': 44.09},
-     20: {'Average_RRP': 135.97, 'SD_RRP': 51.6},
-     21: {'Average_RRP': 124.43, 'SD_RRP': 42.96},
-     22: {'Average_RRP': 132.54, 'SD_RRP': 47.13},
-     23: {'Average_RRP': 122.34, 'SD_RRP': 46.75}},
- 5: {0: {'Average_RRP': 129.54, 'SD_RRP': 58.45},
-     1: {'Average_RRP': 111.25, 'SD_RRP': 49.42},
-     2: {'Average_RRP': 99.51, 'SD_RRP': 43.45},
-     3: {'Average_RRP': 97.83, 'SD_RRP': 40.13},
-     4: {'Average_RRP': 108.65, 'SD_RRP': 43.98},
-     5: {'Average_RRP': 130.39, 'SD_RRP': 53.8},
-     6: {'Average_RRP': 222.31, 'SD_RRP': 535.64},
-     7: {'Average_RRP': 152.35, 'SD_RRP': 112.53},
-     8: {'Average_RRP': 37.16, 'SD_RRP': 52.35},
-     9: {'Average_RRP': 16.83, 'SD_RRP': 50.89},
-     10: {'Average_RRP': -0.66, 'SD_RRP': 42.42},
-     11: {'Average_RRP': 2.03, 'SD_RRP': 44.49},
-     12: {'Average_RRP': 9.11, 'SD_RRP': 49.46},
-     13: {'Average_RRP': 21.26, 'SD_RRP': 52.19},
-     14: {'Average_RRP': 48.42, 'SD_RRP': 52.22},
-     15: {'Average_RRP': 85.22, 'SD_RRP': 62.97},
-     16: {'Average_RRP': 182.49, 'SD_RRP': 74.22},
-     17: {'Average_RRP': 533.67, 'SD_RRP': 1783.82},
-     18: {'Average_RRP': 310.91, 'SD_RRP': 985.13},
-     19: {'Average_RRP': 175.24, 'SD_RRP': 61.72},
-     20: {'Average_RRP': 169.73, 'SD_RRP': 61.55},
-     21: {'Average_RRP': 149.77, 'SD_RRP': 59.9},
-     22: {'Average_RRP': 159.31, 'SD_RRP': 59.02},
-     23: {'Average_RRP': 138.8, 'SD_RRP': 50.85}},
- 6: {0: {'Average_RRP': 108.88, 'SD_RRP': 51.72},
-     1: {'Average_RRP': 98.35, 'SD_RRP': 43.74},
-     2: {'Average_RRP': 90.57, 'SD_RRP': 42.08},
-     3: {'Average_RRP': 88.14, 'SD_RRP': 42.78},
-     4: {'Average_RRP': 95.65, 'SD_RRP': 48.92},
-     5: {'Average_RRP': 111.49, 'SD_RRP': 61.84},
-     6: {'Average_RRP': 178.26, 'SD_RRP': 578.21},
-     7: {'Average_RRP': 165.45, 'SD_RRP': 103.86},
-     8: {'Average_RRP': 73.33, 'SD_RRP': 58.91},
-     9: {'Average_RRP': 41.9, 'SD_RRP': 56.88},
-     10: {'Average_RRP': 18.28, 'SD_RRP': 54.71},
-     11: {'Average_RRP': 10.65, 'SD_RRP': 51.86},
-     12: {'Average_RRP': 6.87, 'SD_RRP': 53.81},
-     13: {'Average_RRP': 17.3, 'SD_RRP': 56.04},
-     14: {'Average_RRP': 49.04, 'SD_RRP': 63.47},
-     15: {'Average_RRP': 80.9, 'SD_RRP': 63.83},
-     16: {'Average_RRP': 162.3, 'SD_RRP': 76.19},
-     17: {'Average_RRP': 354.72, 'SD_RRP': 1042.38},
-     18: {'Average_RRP': 248.9, 'SD_RRP': 535.02},
-     19: {'Average_RRP': 174.07, 'SD_RRP': 75.16},
-     20: {'Average_RRP': 159.48, 'SD_RRP': 70.58},
-     21: {'Average_RRP': 135.4, 'SD_RRP': 66.85},
-     22: {'Average_RRP': 134.43, 'SD_RRP': 64.34},
-     23: {'Average_RRP': 123.23, 'SD_RRP': 60.68}},
- 7: {0: {'Average_RRP': 90.68, 'SD_RRP': 31.2},
-     1: {'Average_RRP': 79.86, 'SD_RRP': 23.62},
-     2: {'Average_RRP': 74.84, 'SD_RRP': 24.69},
-     3: {'Average_RRP': 73.12, 'SD_RRP': 27.09},
-     4: {'Average_RRP': 79.18, 'SD_RRP': 29.03},
-     5: {'Average_RRP': 120.68, 'SD_RRP': 639.55},
-     6: {'Average_RRP': 149.04, 'SD_RRP': 76.03},
-     7: {'Average_RRP': 163.86, 'SD_RRP': 88.45},
-     8: {'Average_RRP': 69.0, 'SD_RRP': 63.05},
-     9: {'Average_RRP': 39.02, 'SD_RRP': 57.36},
-     10: {'Average_RRP': 16.81, 'SD_RRP': 55.94},
-     11: {'Average_RRP': 8.81, 'SD_RRP': 55.88},
-     12: {'Average_RRP': 2.55, 'SD_RRP': 54.87},
-     13: {'Average_RRP': 9.6, 'SD_RRP': 57.76},
-     14: {'Average_RRP': 25.94, 'SD_RRP': 50.92},
-     15: {'Average_RRP': 56.09, 'SD_RRP': 50.8},
-     16: {'Average_RRP': 121.43, 'SD_RRP': 72.15},
-     17: {'Average_RRP': 242.64, 'SD_RRP': 374.77},
-     18: {'Average_RRP': 294.69, 'SD_RRP': 736.98},
-     19: {'Average_RRP': 157.32, 'SD_RRP': 68.62},
-     20: {'Average_RRP': 142.21, 'SD_RRP': 55.49},
-     21: {'Average_RRP': 117.78, 'SD_RRP': 45.64},
-     22: {'Average_RRP': 118.14, 'SD_RRP': 47.92},
-     23: {'Average_RRP': 102.52, 'SD_RRP': 38.82}},
- 8: {0: {'Average_RRP': 96.81, 'SD_RRP': 39.81},
-     1: {'Average_RRP': 87.58, 'SD_RRP': 34.92},
-     2: {'Average_RRP': 82.45, 'SD_RRP': 32.67},
-     3: {'Average_RRP': 80.96, 'SD_RRP': 32.52},
-     4: {'Average_RRP': 87.94, 'SD_RRP': 41.93},
-     5: {'Average_RRP': 105.18, 'SD_RRP': 49.24},
-     6: {'Average_RRP': 162.33, 'SD_RRP': 177.73},
-     7: {'Average_RRP': 103.79, 'SD_RRP': 113.27},
-     8: {'Average_RRP': 18.75, 'SD_RRP': 54.08},
-     9: {'Average_RRP': 4.7, 'SD_RRP': 65.25},
-     10: {'Average_RRP': -8.72, 'SD_RRP': 67.68},
-     11: {'Average_RRP': -10.09, 'SD_RRP': 53.63},
-     12: {'Average_RRP': -12.85, 'SD_RRP': 49.84},
-     13: {'Average_RRP': -8.73, 'SD_RRP': 50.8},
-     14: {'Average_RRP': 6.87, 'SD_RRP': 58.12},
-     15: {'Average_RRP': 31.92, 'SD_RRP': 62.96},
-     16: {'Average_RRP': 104.63, 'SD_RRP': 75.38},
-     17: {'Average_RRP': 385.71, 'SD_RRP': 1549.03},
-     18: {'Average_RRP': 384.2, 'SD_RRP': 1220.3},
-     19: {'Average_RRP': 176.7, 'SD_RRP': 323.18},
-     20: {'Average_RRP': 140.48, 'SD_RRP': 58.02},
-     21: {'Average_RRP': 122.4, 'SD_RRP': 49.56},
-     22: {'Average_RRP': 120.65, 'SD_RRP': 48.71},
-     23: {'Average_RRP': 109.32, 'SD_RRP': 41.78}},
- 9: {0: {'Average_RRP': 75.26, 'SD_RRP': 18.66},
-     1: {'Average_RRP': 68.46, 'SD_RRP': 17.16},
-     2: {'Average_RRP': 63.43, 'SD_RRP': 14.53},
-     3: {'Average_RRP': 63.63, 'SD_RRP': 14.84},
-     4: {'Average_RRP': 66.68, 'SD_RRP': 16.72},
-     5: {'Average_RRP': 74.32, 'SD_RRP': 21.04},
-     6: {'Average_RRP': 72.4, 'SD_RRP': 45.76},
-     7: {'Average_RRP': 3.89, 'SD_RRP': 36.46},
-     8: {'Average_RRP': -18.95, 'SD_RRP': 28.61},
-     9: {'Average_RRP': -31.24, 'SD_RRP': 27.73},
-     10: {'Average_RRP': -35.1, 'SD_RRP': 23.71},
-     11: {'Average_RRP': -36.31, 'SD_RRP': 38.26},
-     12: {'Average_RRP': -34.33, 'SD_RRP': 26.7},
-     13: {'Average_RRP': -30.37, 'SD_RRP': 29.33},
-     14: {'Average_RRP': -15.51, 'SD_RRP': 39.95},
-     15: {'Average_RRP': -1.2, 'SD_RRP': 37.69},
-     16: {'Average_RRP': 45.99, 'SD_RRP': 84.8},
-     17: {'Average_RRP': 206.53, 'SD_RRP': 952.37},
-     18: {'Average_RRP': 209.56, 'SD_RRP': 912.55},
-     19: {'Average_RRP': 107.96, 'SD_RRP': 34.5},
-     20: {'Average_RRP': 91.69, 'SD_RRP': 26.08},
-     21: {'Average_RRP': 83.69, 'SD_RRP': 25.0},
-     22: {'Average_RRP': 90.43, 'SD_RRP': 27.5},
-     23: {'Average_RRP': 84.3, 'SD_RRP': 22.02}},
- 10: {0: {'Average_RRP': 82.87, 'SD_RRP': 37.28},
-      1: {'Average_RRP': 79.54, 'SD_RRP': 39.67},
-      2: {'Average_RRP': 73.29, 'SD_RRP': 28.36},
-      3: {'Average_RRP': 73.96, 'SD_RRP': 29.18},
-      4: {'Average_RRP': 79.17, 'SD_RRP': 33.4},
-      5: {'Average_RRP': 88.55, 'SD_RRP': 45.48},
-      6: {'Average_RRP': 33.53, 'SD_RRP': 47.92},
-      7: {'Average_RRP': -8.72, 'SD_RRP': 36.93},
-      8: {'Average_RRP': -21.65, 'SD_RRP': 32.23},
-      9: {'Average_RRP': -30.31, 'SD_RRP': 25.07},
-      10: {'Average_RRP': -32.88, 'SD_RRP': 23.75},
-      11: {'Average_RRP': -33.18, 'SD_RRP': 24.34},
-      12: {'Average_RRP': -31.47, 'SD_RRP': 25.23},
-      13: {'Average_RRP': -23.95, 'SD_RRP': 32.47},
-      14: {'Average_RRP': -5.49, 'SD_RRP': 48.82},
-      15: {'Average_RRP': 17.13, 'SD_RRP': 52.4},
-      16: {'Average_RRP': 55.22, 'SD_RRP': 50.77},
-      17: {'Average_RRP': 188.3, 'SD_RRP': 676.65},
-      18: {'Average_RRP': 193.63, 'SD_RRP': 370.89},
-      19: {'Average_RRP': 123.31, 'SD_RRP': 56.59},
-      20: {'Average_RRP': 104.0, 'SD_RRP': 51.34},
-      21: {'Average_RRP': 90.49, 'SD_RRP': 45.35},
-      22: {'Average_RRP': 106.19, 'SD_RRP': 62.29},
-      23: {'Average_RRP': 93.23, 'SD_RRP': 52.49}},
- 11: {0: {'Average_RRP': 114.86, 'SD_RRP': 57.83},
-      1: {'Average_RRP': 101.03, 'SD_RRP': 45.29},
-      2: {'Average_RRP': 98.18, 'SD_RRP': 47.76},
-      3: {'Average_RRP': 100.52, 'SD_RRP': 78.47},
-      4: {'Average_RRP': 106.67, 'SD_RRP': 57.82},
-      5: {'Average_RRP': 110.18, 'SD_RRP': 91.96},
-      6: {'Average_RRP': 61.14, 'SD_RRP': 164.28},
-      7: {'Average_RRP': 48.68, 'SD_RRP': 66.19},
-      8: {'Average_RRP': 36.55, 'SD_RRP': 65.94},
-      9: {'Average_RRP': 24.06, 'SD_RRP': 67.11},
-      10: {'Average_RRP': 13.31, 'SD_RRP': 52.42},
-      11: {'Average_RRP': 14.55, 'SD_RRP': 53.46},
-      12: {'Average_RRP': 17.81, 'SD_RRP': 53.97},
-      13: {'Average_RRP': 31.83, 'SD_RRP': 60.51},
-      14: {'Average_RRP': 50.5, 'SD_RRP': 73.51},
-      15: {'Average_RRP': 80.04, 'SD_RRP': 381.49},
-      16: {'Average_RRP': 152.94, 'SD_RRP': 671.25},
-      17: {'Average_RRP': 486.75, 'SD_RRP': 1779.55},
-      18: {'Average_RRP': 561.1, 'SD_RRP': 2185.45},
-      19: {'Average_RRP': 257.61, 'SD_RRP': 1110.25},
-      20: {'Average_RRP': 143.83, 'SD_RRP': 64.95},
-      21: {'Average_RRP': 133.56, 'SD_RRP': 68.4},
-      22: {'Average_RRP': 133.21, 'SD_RRP': 64.71},
-      23: {'Average_RRP': 126.51, 'SD_RRP': 65.15}},
- 12: {0: {'Average_RRP': 117.8, 'SD_RRP': 55.83},
-      1: {'Average_RRP': 115.38, 'SD_RRP': 56.7},
-      2: {'Average_RRP': 104.74, 'SD_RRP': 54.44},
-      3: {'Average_RRP': 102.0, 'SD_RRP': 51.72},
-      4: {'Average_RRP': 106.39, 'SD_RRP': 52.22},
-      5: {'Average_RRP': 99.87, 'SD_RRP': 58.16},
-      6: {'Average_RRP': 43.74, 'SD_RRP': 49.63},
-      7: {'Average_RRP': 38.89, 'SD_RRP': 57.73},
-      8: {'Average_RRP': 31.96, 'SD_RRP': 62.99},
-      9: {'Average_RRP': 21.26, 'SD_RRP': 63.02},
-      10: {'Average_RRP': 17.31, 'SD_RRP': 58.53},
-      11: {'Average_RRP': 19.52, 'SD_RRP': 62.58},
-      12: {'Average_RRP': 22.63, 'SD_RRP': 67.77},
-      13: {'Average_RRP': 42.46, 'SD_RRP': 76.22},
-      14: {'Average_RRP': 69.43, 'SD_RRP': 178.38},
-      15: {'Average_RRP': 82.62, 'SD_RRP': 89.0},
-      16: {'Average_RRP': 108.96, 'SD_RRP': 94.92},
-      17: {'Average_RRP': 237.31, 'SD_RRP': 934.73},
-      18: {'Average_RRP': 521.94, 'SD_RRP': 1841.67},
-      19: {'Average_RRP': 245.34, 'SD_RRP': 682.66},
-      20: {'Average_RRP': 162.76, 'SD_RRP': 74.22},
-      21: {'Average_RRP': 138.45, 'SD_RRP': 59.74},
-      22: {'Average_RRP': 144.83, 'SD_RRP': 66.86},
-      23: {'Average_RRP': 133.67, 'SD_RRP': 63.06}}}
+# BEGIN HISTORICAL PRICES (generated by historical_prices_qld/make_dictionary.py)
+# Historical data from 2023-2024 - use this for rrp and for z score.
+# Flat tables indexed by (month - 1) * 24 + hour. Median and 1.4826 * MAD
+# are not inflated by spike intervals like SD_RRP is.
+QLD_AVERAGE_RRP = (
+    98.94, 89.85, 85.61, 83.0, 89.98, 98.2, 66.86, 49.48, 50.33, 52.52, 41.97, 46.0,
+    51.4, 64.98, 76.92, 104.05, 103.07, 242.15, 890.99, 225.82, 148.25, 126.08, 120.31, 106.04,
+    92.95, 85.94, 79.23, 76.41, 81.63, 104.99, 94.37, 52.65, 39.5, 38.84, 34.24, 36.06,
+    47.37, 55.31, 70.63, 80.43, 100.49, 278.4, 411.39, 195.68, 135.93, 114.78, 106.32, 95.32,
+    83.03, 77.14, 73.8, 74.29, 78.58, 93.13, 113.36, 59.18, 49.44, 42.5, 36.95, 32.21,
+    39.51, 60.39, 70.02, 81.95, 99.63, 256.39, 413.53, 137.0, 109.81, 96.66, 96.97, 90.57,
+    109.3, 98.73, 92.79, 91.99, 96.04, 105.02, 131.08, 68.72, 27.19, 14.26, 7.48, 11.01,
+    18.7, 32.29, 57.06, 74.86, 130.29, 259.28, 255.18, 140.33, 135.97, 124.43, 132.54, 122.34,
+    129.54, 111.25, 99.51, 97.83, 108.65, 130.39, 222.31, 152.35, 37.16, 16.83, -0.66, 2.03,
+    9.11, 21.26, 48.42, 85.22, 182.49, 533.67, 310.91, 175.24, 169.73, 149.77, 159.31, 138.8,
+    108.88, 98.35, 90.57, 88.14, 95.65, 111.49, 178.26, 165.45, 73.33, 41.9, 18.28, 10.65,
+    6.87, 17.3, 49.04, 80.9, 162.3, 354.72, 248.9, 174.07, 159.48, 135.4, 134.43, 123.23,
+    90.68, 79.86, 74.84, 73.12, 79.18, 120.68, 149.04, 163.86, 69.0, 39.02, 16.81, 8.81,
+    2.55, 9.6, 25.94, 56.09, 121.43, 242.64, 294.69, 157.32, 142.21, 117.78, 118.14, 102.52,
+    96.81, 87.58, 82.45, 80.96, 87.94, 105.18, 162.33, 103.79, 18.75, 4.7, -8.72, -10.09,
+    -12.85, -8.73, 6.87, 31.92, 104.63, 385.71, 384.2, 176.7, 140.48, 122.4, 120.65, 109.32,
+    75.26, 68.46, 63.43, 63.63, 66.68, 74.32, 72.4, 3.89, -18.95, -31.24, -35.1, -36.31,
+    -34.33, -30.37, -15.51, -1.2, 45.99, 206.53, 209.56, 107.96, 91.69, 83.69, 90.43, 84.3,
+    82.87, 79.54, 73.29, 73.96, 79.17, 88.55, 33.53, -8.72, -21.65, -30.31, -32.88, -33.18,
+    -31.47, -23.95, -5.49, 17.13, 55.22, 188.3, 193.63, 123.31, 104.0, 90.49, 106.19, 93.23,
+    114.86, 101.03, 98.18, 100.52, 106.67, 110.18, 61.14, 48.68, 36.55, 24.06, 13.31, 14.55,
+    17.81, 31.83, 50.5, 80.04, 152.94, 486.75, 561.1, 257.61, 143.83, 133.56, 133.21, 126.51,
+    117.8, 115.38, 104.74, 102.0, 106.39, 99.87, 43.74, 38.89, 31.96, 21.26, 17.31, 19.52,
+    22.63, 42.46, 69.43, 82.62, 108.96, 237.31, 521.94, 245.34, 162.76, 138.45, 144.83, 133.67,
+)
+QLD_SD_RRP = (
+    36.99, 32.51, 27.22, 25.91, 26.86, 37.22, 50.52, 48.82, 51.48, 57.15, 35.56, 40.69,
+    46.79, 55.76, 55.3, 388.42, 89.2, 1056.05, 2837.32, 601.69, 75.91, 53.83, 55.72, 43.46,
+    33.07, 27.85, 25.83, 20.67, 21.59, 37.37, 45.93, 49.16, 41.04, 42.73, 38.97, 38.12,
+    50.59, 53.25, 68.67, 78.08, 84.52, 1215.57, 1348.6, 453.77, 59.26, 46.89, 43.26, 29.58,
+    17.58, 16.56, 15.82, 16.28, 18.62, 25.21, 52.83, 39.31, 60.69, 61.49, 62.4, 63.77,
+    61.89, 72.38, 69.19, 57.52, 69.16, 1064.22, 1617.79, 63.32, 41.6, 25.61, 25.06, 22.03,
+    37.96, 31.95, 30.37, 28.09, 32.2, 39.95, 58.35, 49.48, 40.74, 43.92, 47.61, 47.55,
+    48.62, 48.12, 57.87, 49.01, 70.7, 172.02, 567.3, 44.09, 51.6, 42.96, 47.13, 46.75,
+    58.45, 49.42, 43.45, 40.13, 43.98, 53.8, 535.64, 112.53, 52.35, 50.89, 42.42, 44.49,
+    49.46, 52.19, 52.22, 62.97, 74.22, 1783.82, 985.13, 61.72, 61.55, 59.9, 59.02, 50.85,
+    51.72, 43.74, 42.08, 42.78, 48.92, 61.84, 578.21, 103.86, 58.91, 56.88, 54.71, 51.86,
+    53.81, 56.04, 63.47, 63.83, 76.19, 1042.38, 535.02, 75.16, 70.58, 66.85, 64.34, 60.68,
+    31.2, 23.62, 24.69, 27.09, 29.03, 639.55, 76.03, 88.45, 63.05, 57.36, 55.94, 55.88,
+    54.87, 57.76, 50.92, 50.8, 72.15, 374.77, 736.98, 68.62, 55.49, 45.64, 47.92, 38.82,
+    39.81, 34.92, 32.67, 32.52, 41.93, 49.24, 177.73, 113.27, 54.08, 65.25, 67.68, 53.63,
+    49.84, 50.8, 58.12, 62.96, 75.38, 1549.03, 1220.3, 323.18, 58.02, 49.56, 48.71, 41.78,
+    18.66, 17.16, 14.53, 14.84, 16.72, 21.04, 45.76, 36.46, 28.61, 27.73, 23.71, 38.26,
+    26.7, 29.33, 39.95, 37.69, 84.8, 952.37, 912.55, 34.5, 26.08, 25.0, 27.5, 22.02,
+    37.28, 39.67, 28.36, 29.18, 33.4, 45.48, 47.92, 36.93, 32.23, 25.07, 23.75, 24.34,
+    25.23, 32.47, 48.82, 52.4, 50.77, 676.65, 370.89, 56.59, 51.34, 45.35, 62.29, 52.49,
+    57.83, 45.29, 47.76, 78.47, 57.82, 91.96, 164.28, 66.19, 65.94, 67.11, 52.42, 53.46,
+    53.97, 60.51, 73.51, 381.49, 671.25, 1779.55, 2185.45, 1110.25, 64.95, 68.4, 64.71, 65.15,
+    55.83, 56.7, 54.44, 51.72, 52.22, 58.16, 49.63, 57.73, 62.99, 63.02, 58.53, 62.58,
+    67.77, 76.22, 178.38, 89.0, 94.92, 934.73, 1841.67, 682.66, 74.22, 59.74, 66.86, 63.06,
+)
+QLD_MEDIAN_RRP = (
+    89.31, 85.59, 85.53, 81.98, 85.75, 92.41, 65.52, 55.65, 54.51, 53.64, 49.68, 50.06,
+    54.55, 56.24, 64.22, 74.0, 85.61, 103.95, 192.45, 156.11, 133.03, 113.31, 107.15, 96.51,
+    87.4, 85.55, 77.21, 77.86, 84.54, 98.69, 90.67, 52.6, 39.0, 39.7, 37.44, 37.86,
+    49.55, 53.76, 59.75, 62.73, 85.55, 120.78, 200.64, 144.29, 122.16, 106.28, 98.56, 90.27,
+    85.55, 78.04, 71.32, 72.39, 77.91, 87.49, 100.45, 59.55, 40.08, 39.4, 38.55, 33.91,
+    38.64, 48.75, 59.55, 66.34, 87.49, 139.01, 180.43, 116.64, 99.22, 91.63, 92.07, 87.59,
+    100.75, 93.98, 87.71, 87.89, 91.83, 98.6, 110.99, 63.13, 30.58, 17.81, 0.0, 7.54,
+    22.65, 37.79, 52.86, 67.92, 116.2, 261.26, 199.94, 134.73, 124.84, 115.38, 120.03, 107.18,
+    118.64, 100.98, 95.62, 92.66, 100.86, 124.41, 187.57, 132.61, 32.46, 17.95, -8.69, -2.34,
+    1.63, 22.55, 48.68, 64.77, 169.17, 277.89, 215.99, 159.15, 149.7, 139.01, 145.42, 132.96,
+    91.94, 85.78, 80.86, 79.9, 83.25, 90.32, 130.0, 131.21, 60.0, 38.85, 5.6, -1.56,
+    -17.94, 18.84, 38.91, 63.62, 144.01, 260.96, 194.01, 145.33, 136.9, 107.18, 114.53, 101.38,
+    86.74, 78.55, 65.76, 64.3, 78.19, 90.72, 122.29, 144.68, 53.72, 37.46, 0.16, -9.78,
+    -18.89, -1.39, 30.54, 49.26, 100.13, 224.99, 194.03, 134.6, 121.72, 103.8, 104.76, 92.39,
+    86.3, 79.76, 74.99, 71.38, 76.11, 93.94, 136.15, 77.85, 0.09, -19.14, -40.0, -35.03,
+    -34.63, -35.72, -18.89, 22.55, 92.88, 182.47, 206.41, 138.46, 123.31, 110.82, 110.79, 98.97,
+    73.23, 65.76, 59.93, 59.73, 61.73, 69.13, 67.84, -0.44, -23.82, -41.29, -43.55, -44.49,
+    -44.91, -43.36, -31.75, -11.6, 45.17, 123.03, 147.18, 101.1, 90.35, 77.95, 85.99, 80.45,
+    64.94, 61.41, 59.73, 59.73, 65.67, 77.91, 36.02, -20.8, -35.64, -41.18, -41.51, -40.96,
+    -40.7, -37.45, -20.8, 0.0, 50.46, 123.17, 158.49, 112.63, 99.13, 74.94, 91.93, 76.29,
+    103.67, 99.75, 94.75, 93.72, 99.91, 97.61, 54.76, 49.51, 30.14, 10.13, -0.0, 0.0,
+    9.16, 27.95, 51.96, 59.73, 82.04, 155.41, 200.0, 156.65, 130.88, 114.55, 117.97, 109.64,
+    97.63, 98.7, 93.83, 93.47, 94.48, 89.79, 44.8, 35.47, 30.55, 0.0, 4.13, 0.0,
+    0.67, 40.09, 53.44, 62.94, 86.67, 138.22, 231.99, 177.85, 144.87, 130.81, 127.66, 114.75,
+)
+QLD_ROBUST_SD_RRP = (
+    23.63, 22.46, 20.53, 23.0, 25.62, 27.29, 39.5, 43.0, 43.87, 43.86, 29.5, 29.74,
+    34.92, 38.46, 43.03, 38.53, 36.92, 46.03, 113.72, 56.19, 44.66, 31.48, 28.78, 19.85,
+    16.58, 19.29, 16.75, 18.49, 17.09, 22.37, 38.92, 35.11, 30.42, 30.93, 35.32, 34.81,
+    27.68, 31.15, 37.36, 37.11, 44.72, 64.24, 127.27, 53.17, 35.05, 30.73, 23.32, 17.17,
+    13.97, 19.16, 17.45, 18.01, 20.99, 19.29, 34.2, 30.85, 33.42, 37.87, 42.22, 49.16,
+    41.81, 43.14, 37.29, 36.78, 36.71, 58.15, 84.91, 32.16, 21.25, 21.19, 18.28, 16.19,
+    22.25, 16.71, 18.24, 18.77, 13.36, 19.41, 41.47, 41.02, 44.06, 50.82, 51.95, 56.24,
+    54.99, 47.32, 39.24, 37.18, 52.42, 94.58, 93.63, 40.39, 33.89, 34.68, 36.23, 31.77,
+    45.93, 46.61, 43.32, 37.51, 37.78, 38.47, 112.93, 117.07, 45.16, 54.62, 46.42, 49.64,
+    55.03, 54.97, 38.65, 42.09, 100.85, 40.37, 96.06, 51.68, 51.16, 42.08, 51.49, 40.62,
+    20.21, 20.12, 21.08, 21.73, 26.81, 29.74, 57.75, 64.85, 31.51, 36.77, 47.77, 52.11,
+    40.21, 65.59, 38.53, 42.21, 72.22, 99.26, 83.23, 53.52, 47.49, 35.86, 42.82, 27.92,
+    28.7, 23.25, 18.34, 19.7, 25.06, 26.94, 45.17, 90.85, 34.37, 38.09, 59.1, 47.37,
+    38.27, 58.09, 45.28, 27.75, 58.96, 104.6, 104.88, 53.79, 37.52, 29.53, 30.02, 26.92,
+    30.1, 29.4, 27.35, 25.53, 27.87, 33.74, 65.03, 71.15, 44.83, 32.72, 11.49, 22.61,
+    23.26, 20.36, 39.04, 56.0, 57.78, 93.85, 109.13, 60.68, 40.98, 41.75, 41.68, 31.05,
+    15.57, 16.16, 10.94, 10.07, 12.56, 17.3, 29.76, 39.33, 25.65, 9.18, 6.3, 5.75,
+    7.47, 7.72, 19.73, 34.84, 40.19, 42.03, 58.7, 26.42, 25.14, 24.02, 23.74, 21.78,
+    16.32, 13.14, 11.39, 13.02, 18.21, 31.25, 40.42, 29.95, 16.16, 9.31, 9.5, 10.05,
+    8.63, 13.45, 29.53, 46.81, 38.1, 66.39, 78.73, 53.83, 49.73, 26.69, 42.94, 26.38,
+    57.58, 42.27, 40.4, 40.89, 39.72, 47.22, 47.95, 58.38, 65.8, 62.98, 52.04, 52.04,
+    61.29, 69.4, 52.34, 52.28, 58.93, 110.35, 115.48, 64.43, 67.1, 71.08, 59.44, 60.56,
+    45.5, 43.94, 35.08, 39.63, 40.21, 44.82, 48.85, 52.59, 71.76, 52.38, 58.34, 55.69,
+    53.05, 59.44, 59.76, 54.59, 57.42, 83.86, 128.29, 93.51, 72.94, 53.52, 57.14, 46.46,
+)
+HISTORICAL_PRICES_BY_STATE = {
+    'QLD': (QLD_AVERAGE_RRP, QLD_SD_RRP, QLD_MEDIAN_RRP, QLD_ROBUST_SD_RRP),
+}
+try:
+    AVERAGE_RRP, SD_RRP, MEDIAN_RRP, ROBUST_SD_RRP = HISTORICAL_PRICES_BY_STATE[state]
+except:
+    AVERAGE_RRP, SD_RRP, MEDIAN_RRP, ROBUST_SD_RRP = HISTORICAL_PRICES_BY_STATE['QLD']
+
+
+def historical_price(month, hour):
+    """Return (Average_RRP, SD_RRP) for month 1-12 and hour 0-23."""
+    if not (1 <= month <= 12 and 0 <= hour <= 23):
+        raise KeyError((month, hour))
+    i = (month - 1) * 24 + hour
+    return AVERAGE_RRP[i], SD_RRP[i]
+
+
+def historical_robust_price(month, hour):
+    """Return (Median_RRP, robust SD) for month 1-12 and hour 0-23."""
+    if not (1 <= month <= 12 and 0 <= hour <= 23):
+        raise KeyError((month, hour))
+    i = (month - 1) * 24 + hour
+    return MEDIAN_RRP[i], ROBUST_SD_RRP[i]
+# END HISTORICAL PRICES
 
 
 
@@ -457,7 +299,7 @@ QLD_HISTORICAL_PRICES = {1: {0: {'Average_RRP': 98.94, 'SD_RRP': 36.99},
 try: 
     rrp = float(rrp)
 except:
-    rrp = QLD_HISTORICAL_PRICES[month][hour]['Average_RRP']
+    rrp = historical_price(month, hour)[0]
     reason += f" RRP exception, default to historical."
 
 reason += f" RRP: {rrp}."
@@ -505,8 +347,7 @@ Calculate the z-score for a given RRP value based on historical data for the sam
 
 """
 try:
-    historical_rrp = float(QLD_HISTORICAL_PRICES[month][hour]['Average_RRP'])
-    historical_sd_rrp = float(QLD_HISTORICAL_PRICES [month][hour]['SD_RRP'])
+    historical_rrp, historical_sd_rrp = historical_price(month, hour)
     if historical_sd_rrp == 0:
         z_score = 0.0 # 
     else:
@@ -0,0 +1 @@
+"""Replay the Powston scripts against the historical price data and score them."""
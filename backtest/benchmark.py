@@ -0,0 +1,198 @@
+"""
+Per-interval cost of every script variant, with a stored baseline.
+
+Each script in SCRIPTS is compiled and then executed against the
+variables_available.py snapshot and a set of historical fixtures: runs of
+consecutive intervals (20 by default) ending at 03:00, 09:00, 13:00 and
+18:00 on the 15th of every month of 2024, with battery_soc stepping
+through 10-90%. The intervals of a fixture share one user_cache, starting
+empty, as in production: the first run pays for anything a script caches
+between intervals and the rest reuse it. The snapshot is one interval,
+executed as many times. Reported per script:
+
+    compile_ms                 fastest of COMPILE_REPEATS compiles of the source
+    p50_us, p95_us, p99_us     wall time of one execution (best of ROUNDS)
+    alloc_kib                  median peak memory allocated by a fixture's first run (tracemalloc)
+    reason_chars               longest reason string produced
+    errors                     fixtures where the script raised at any interval
+
+Every fixture is run once as a warm-up, then ROUNDS more times; each
+interval's wall time is its fastest over those rounds, so a burst of
+scheduler noise in one round does not reach the percentiles.
+
+The baseline is backtest/benchmark_baseline.json. A script regresses when
+p50_us, p95_us, alloc_kib or reason_chars exceeds its baseline by more than
+the tolerance (25% by default), or when it raises on more fixtures.
+Timings are only compared with a baseline taken with the same --repeats.
+compile_ms and p99_us are reported but not compared: over one run they
+are mostly scheduler and garbage-collector noise. Timings are
+machine-dependent, so refresh the baseline with --update when moving to
+new hardware.
+
+Run from the repository root (exits 1 on a regression):
+    python -m backtest.benchmark [--update] [--tolerance=0.25] [--repeats=20] [script.py ...]
+"""
+
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from backtest.replay import build_inputs, interval_values
+from backtest.runner import ScriptRunner
+from historical_prices_qld.query import HistoricalIndex, to_epoch
+
+SCRIPTS = ("20250307_refactor_script.py", "20250308_david.py", "20250406_edit.py", "david_edit_of_script.py",
+           "david_script.py")
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "benchmark_baseline.json")
+FIXTURE_HOURS = (3, 9, 13, 18)
+FIXTURE_YEAR = 2024
+REPEATS = 20
+ROUNDS = 3
+COMPILE_REPEATS = 5
+TOLERANCE = 0.25
+# Figures compared against the baseline; errors must not increase at all.
+COMPARED = ("p50_us", "p95_us", "alloc_kib", "reason_chars")
+
+
+def historical_fixtures(index: HistoricalIndex = None, region: str = "QLD1", length: int = REPEATS) -> list:
+    """Each fixture's globals (see the module docstring) as a list of consecutive intervals, without user_cache."""
+    index = index or HistoricalIndex()
+    fixtures = []
+    for month in range(1, 13):
+        for hour in FIXTURE_HOURS:
+            end = to_epoch(f"{FIXTURE_YEAR}-{month:02d}-15 {hour:02d}:00")
+            try:
+                inputs = build_inputs(index, end - 300 * length, end, region)
+            except ValueError:
+                continue
+            battery_soc = 10.0 + 10 * (len(fixtures) % 9)
+            intervals = [interval_values(inputs, i, battery_soc, None) for i in range(len(inputs["settlement"]))]
+            for values in intervals:
+                del values["user_cache"]
+            fixtures.append(intervals)
+    return fixtures
+
+
+def measure(script_path: str, fixtures: list, repeats: int = REPEATS) -> dict:
+    """The figures listed in the module docstring for one script; repeats is the length of the snapshot fixture."""
+    with open(script_path) as f:
+        source = f.read()
+    compile_times = []
+    for _ in range(COMPILE_REPEATS):
+        started = time.perf_counter()
+        compile(source, script_path, "exec")
+        compile_times.append(time.perf_counter() - started)
+
+    runner = ScriptRunner(script_path)
+    fixtures = [[{}] * repeats] + list(fixtures)
+    # Round 0 is the warm-up; each interval's time is its fastest over the other ROUNDS.
+    timings, reasons, errors = [[] for _ in range(ROUNDS)], [], 0
+    for round_number in range(ROUNDS + 1):
+        for intervals in fixtures:
+            user_cache, failed = {}, False
+            for values in intervals:
+                started = time.perf_counter()
+                try:
+                    namespace = runner.run(dict(values, user_cache=user_cache))
+                except Exception:
+                    namespace, failed = None, True
+                elapsed = time.perf_counter() - started
+                if round_number:
+                    timings[round_number - 1].append(elapsed)
+                elif namespace is not None:
+                    reasons.append(len(str(namespace.get("reason", ""))))
+            errors += failed and not round_number
+
+    peaks = []
+    tracemalloc.start()
+    try:
+        for intervals in fixtures:
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+            try:
+                runner.run(dict(intervals[0], user_cache={}))
+            except Exception:
+                pass
+            peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    finally:
+        tracemalloc.stop()
+
+    p50, p95, p99 = np.percentile(np.min(timings, axis=0) * 1e6, [50, 95, 99])
+    return {
+        "compile_ms": round(min(compile_times) * 1000, 3),
+        "p50_us": round(float(p50), 1),
+        "p95_us": round(float(p95), 1),
+        "p99_us": round(float(p99), 1),
+        "alloc_kib": round(float(np.median(peaks)) / 1024, 1),
+        "reason_chars": max(reasons, default=0),
+        "errors": errors,
+        "fixtures": len(fixtures),
+        "repeats": repeats,
+    }
+
+
+def regressions(results: dict, baseline: dict, tolerance: float = TOLERANCE) -> list:
+    """'script: figure was -> now' for every figure worse than its baseline by more than tolerance."""
+    found = []
+    for script, figures in results.items():
+        before = baseline.get(script)
+        if before is None:
+            continue
+        for name in COMPARED:
+            if name.endswith("_us") and before.get("repeats") != figures["repeats"]:
+                continue  # fixtures of another length: the share of cold first intervals differs
+            if name in before and figures[name] > before[name] * (1 + tolerance):
+                found.append(f"{script}: {name} {before[name]} -> {figures[name]}")
+        if figures["errors"] > before.get("errors", 0):
+            found.append(f"{script}: errors {before.get('errors', 0)} -> {figures['errors']}")
+    return found
+
+
+def load_baseline(path: str = BASELINE_PATH) -> dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(results: dict, path: str = BASELINE_PATH) -> None:
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+        f.write("\n")
+    os.replace(tmp_path, path)
+
+
+def format_results(results: dict) -> str:
+    columns = ("compile_ms", "p50_us", "p95_us", "p99_us", "alloc_kib", "reason_chars", "errors")
+    width = max(len(script) for script in results)
+    lines = [f"{'script':<{width}}  " + "  ".join(f"{column:>12}" for column in columns)]
+    for script, figures in results.items():
+        lines.append(f"{script:<{width}}  " + "  ".join(f"{figures[column]:>12}" for column in columns))
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    options = dict(arg[2:].split("=", 1) if "=" in arg else (arg[2:], "") for arg in sys.argv[1:]
+                   if arg.startswith("--"))
+    scripts = [arg for arg in sys.argv[1:] if not arg.startswith("--")] or list(SCRIPTS)
+    repeats = int(options.get("repeats", REPEATS))
+    fixtures = historical_fixtures(length=repeats)
+    results = {script: measure(script, fixtures, repeats) for script in scripts}
+    print(f"{len(fixtures) + 1} fixtures (snapshot + historical) x {repeats} intervals each")
+    print(format_results(results))
+
+    baseline = load_baseline()
+    if "update" in options:
+        baseline.update(results)
+        save_baseline(baseline)
+        print(f"baseline written to {BASELINE_PATH}")
+        sys.exit(0)
+    found = regressions(results, baseline, float(options.get("tolerance", TOLERANCE)))
+    for line in found:
+        print(f"REGRESSION {line}")
+    sys.exit(1 if found else 0)
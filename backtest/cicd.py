@@ -0,0 +1,132 @@
+"""
+Check a script's CICD annotations against the historical data.
+
+auto_tuning.md has scripts declare the action they must take at given
+times:
+
+    # CICD: '2025-05-19 17:30:00+10', 'export'
+
+Times without an offset are AEST, like the settlement times. Each
+annotation is resolved to the 5-minute interval containing it through
+the settlement-time index (historical_prices_qld/query.py), its inputs are
+built for that interval alone, and the script is run once per annotation.
+There is no replay up to the annotated time, so battery_soc is a fixed
+assumption (50% unless given), user_cache starts empty and last_action is
+"auto". A few dozen annotations take milliseconds; with many, they are
+split across worker processes.
+
+Run from the repository root (exits 1 on any mismatch):
+    python -m backtest.cicd 20250406_edit.py [--soc=50] [--workers=N]
+"""
+
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+
+from backtest.replay import AEST, build_inputs, interval_values
+from backtest.runner import ScriptRunner
+from backtest.site import Site
+from historical_prices_qld.query import HistoricalIndex
+
+ANNOTATION_PATTERN = re.compile(r"^\s*#\s*CICD:\s*'([^']+)'\s*,\s*'([^']+)'", re.MULTILINE)
+INTERVAL_SECONDS = 300
+BATTERY_SOC = 50.0
+PARALLEL_MIN = 64  # below this many annotations, worker start-up costs more than it saves
+
+
+@dataclass(frozen=True)
+class Annotation:
+    line: int
+    when: str
+    settlement: int  # epoch seconds of the end of the interval containing when
+    expected: str
+
+
+def parse_annotations(source: str) -> list:
+    """Every `# CICD: 'time', 'action'` comment, in order of appearance."""
+    annotations = []
+    for match in ANNOTATION_PATTERN.finditer(source):
+        when, expected = match.groups()
+        moment = datetime.fromisoformat(when)
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=AEST)
+        epoch = int(moment.timestamp())
+        settlement = -(-epoch // INTERVAL_SECONDS) * INTERVAL_SECONDS
+        annotations.append(Annotation(source.count("\n", 0, match.start()) + 1, when, settlement, expected))
+    return annotations
+
+
+def build_fixtures(annotations: list, index: HistoricalIndex, region: str = "QLD1", site: Site = Site()) -> list:
+    """[(annotation, one-interval build_inputs() or None if the store has no data for it)]."""
+    fixtures = []
+    for annotation in annotations:
+        try:
+            inputs = build_inputs(index, annotation.settlement - INTERVAL_SECONDS, annotation.settlement, region, site)
+        except ValueError:
+            inputs = None
+        fixtures.append((annotation, inputs))
+    return fixtures
+
+
+def check(script_path: str, fixtures: list, source: str = None, battery_soc: float = BATTERY_SOC) -> list:
+    """Run the script at each fixture; one result dict per annotation, with ok False on a mismatch."""
+    runner = ScriptRunner(script_path, source)
+    results = []
+    for annotation, inputs in fixtures:
+        result = {"line": annotation.line, "when": annotation.when, "expected": annotation.expected,
+                  "action": None, "ok": False, "reason": "no historical data for this interval"}
+        if inputs is not None:
+            try:
+                namespace = runner.run(interval_values(inputs, 0, battery_soc, {}))
+                result.update(action=namespace.get("action"), reason=str(namespace.get("reason", "")))
+            except Exception as e:
+                result["reason"] = f"{type(e).__name__}: {e}"
+            result["ok"] = result["action"] == annotation.expected
+        results.append(result)
+    return results
+
+
+def _check_chunk(task: tuple) -> list:
+    return check(*task)
+
+
+def validate(script_path: str, source: str = None, index: HistoricalIndex = None, region: str = "QLD1",
+             battery_soc: float = BATTERY_SOC, workers: int = None) -> list:
+    """Parse the script's annotations and check them all; see check()."""
+    if source is None:
+        with open(script_path) as f:
+            source = f.read()
+    annotations = parse_annotations(source)
+    if not annotations:
+        return []
+    fixtures = build_fixtures(annotations, index or HistoricalIndex(), region)
+    if len(fixtures) < PARALLEL_MIN or workers == 1:
+        return check(script_path, fixtures, source, battery_soc)
+    workers = workers or os.cpu_count()
+    chunk = -(-len(fixtures) // workers)
+    tasks = [(script_path, fixtures[i:i + chunk], source, battery_soc) for i in range(0, len(fixtures), chunk)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return [result for results in executor.map(_check_chunk, tasks) for result in results]
+
+
+def mismatches(results: list) -> list:
+    return [result for result in results if not result["ok"]]
+
+
+if __name__ == "__main__":
+    options = dict(arg[2:].split("=", 1) for arg in sys.argv[2:] if arg.startswith("--"))
+    script_path = sys.argv[1]
+    started = time.perf_counter()
+    results = validate(script_path, battery_soc=float(options.get("soc", BATTERY_SOC)),
+                       workers=int(options["workers"]) if "workers" in options else None)
+    failed = mismatches(results)
+    for result in failed:
+        print(f"{script_path}:{result['line']}: {result['when']} expected {result['expected']!r}, "
+              f"got {result['action']!r}. {result['reason'][:200]}")
+    print(f"{script_path}: {len(results) - len(failed)}/{len(results)} CICD annotations pass "
+          f"({(time.perf_counter() - started) * 1000:.0f} ms)")
+    sys.exit(1 if failed else 0)
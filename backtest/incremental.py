@@ -0,0 +1,213 @@
+"""
+Re-simulate a replay from the first interval a parameter change affects.
+
+Changing one threshold such as buy_opport leaves most decisions, and so the
+SOC, exactly as they were. IncrementalReplay records a replay once with:
+
+    checkpoints    the state (SOC, user_cache, last_action, ...) before every
+                   checkpoint_every-th interval
+    trace          per interval, every name the final decision ladder reads
+                   and the action/solar it chose
+
+For new values of constants that only the ladder reads, the ladder is
+re-evaluated over the trace with np.select (backtest/vector_rules.py) to
+find the first interval whose decision changes. The script is then re-run
+from the checkpoint before it. Whenever the new run reaches a checkpoint
+with the same state as the recording, the recorded results are reused from
+there until the next changed decision. Changes that reach the rest of the
+script fall back to a full replay.
+
+Run from the repository root:
+    python -m backtest.incremental 20250406_edit.py [start] [end]
+"""
+
+import ast
+import copy
+import sys
+import time
+
+import numpy as np
+
+from backtest.battery import Battery
+from backtest.replay import (ReplayResult, build_inputs, empty_outputs, initial_state, make_runner,
+                             run_intervals)
+from backtest.tuning import apply_tunables
+from backtest.vector_rules import VectorLadder, literal_constants
+from historical_prices_qld.query import HistoricalIndex
+
+CHECKPOINT_EVERY = 288  # one day of 5-minute intervals
+
+
+def _stored_names(nodes) -> set:
+    return {node.id for statement in nodes for node in ast.walk(statement)
+            if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store)}
+
+
+class IncrementalReplay:
+    """A recorded replay of one script that re-runs new constant values incrementally."""
+
+    def __init__(self, script_path: str, inputs: dict, source: str = None, battery: Battery = Battery(),
+                 initial_soc: float = 50.0, checkpoint_every: int = CHECKPOINT_EVERY):
+        if source is None:
+            with open(script_path) as f:
+                source = f.read()
+        self.script_path = script_path
+        self.source = source
+        self.inputs = inputs
+        self.battery = battery
+        self.checkpoint_every = checkpoint_every
+        self.constants = literal_constants(source)
+        self.ladder = VectorLadder(source)
+        self._loads_outside = self._names_loaded_outside_ladder()
+
+        n = len(inputs["settlement"])
+        trace = {name: [None] * n for name in self.ladder.names}
+        self.decisions = {name: np.empty(n, dtype=object) for name in self.ladder.outputs}
+
+        def observe(i, namespace):
+            for name, values in trace.items():
+                values[i] = namespace.get(name)
+            for name, values in self.decisions.items():
+                values[i] = namespace.get(name)
+
+        started = time.perf_counter()
+        runner = make_runner(script_path, source, battery)
+        state = initial_state(battery, initial_soc)
+        self.outputs = empty_outputs(n)
+        self.checkpoints = []
+        for first in range(0, n, checkpoint_every):
+            self.checkpoints.append(copy.deepcopy(state))
+            run_intervals(runner, inputs, battery, state, self.outputs, first, min(first + checkpoint_every, n),
+                          observe)
+        self.final_state = state
+        self.elapsed = time.perf_counter() - started
+        self.env, self.list_ids = self._trace_arrays(trace)
+
+    def _names_loaded_outside_ladder(self) -> set:
+        """
+        Names read anywhere but the ladder, or None if the ladder cannot be re-evaluated from a trace.
+
+        That needs the ladder at the top level, not assigning anything it
+        reads, and nothing after it reassigning what it reads or decides.
+        """
+        tree = ast.parse(self.source)
+        ladder = next((statement for statement in tree.body if statement.lineno == self.ladder.lineno), None)
+        if ladder is None:
+            return None
+        after = tree.body[tree.body.index(ladder) + 1:]
+        watched = set(self.ladder.names) | set(self.ladder.outputs)
+        if _stored_names([ladder]) & set(self.ladder.names) or _stored_names(after) & watched:
+            return None
+        inside = {id(node) for node in ast.walk(ladder)}
+        return {node.id for node in ast.walk(tree) if isinstance(node, ast.Name)
+                and isinstance(node.ctx, ast.Load) and id(node) not in inside}
+
+    @staticmethod
+    def _trace_arrays(trace: dict) -> tuple:
+        """Scalar names as arrays; list-valued names (hour lists) as ids into a table of distinct lists."""
+        env, list_ids = {}, {}
+        for name, values in trace.items():
+            if any(isinstance(value, (list, tuple, set, frozenset)) for value in values):
+                table = {}
+                ids = np.array([table.setdefault(tuple(value or ()), len(table)) for value in values])
+                list_ids[name] = (ids, [list(key) for key in table])
+            else:
+                env[name] = np.asarray(values)
+        return env, list_ids
+
+    def ladder_decisions(self, changed: dict) -> dict:
+        """The ladder's outputs at every recorded interval with the changed constants substituted."""
+        env = dict(self.env)
+        env.update({name: value for name, value in changed.items() if name in self.ladder.names})
+        if not self.list_ids:
+            return self.ladder.evaluate(env)
+        names = list(self.list_ids)
+        groups, inverse = np.unique(np.stack([self.list_ids[name][0] for name in names], axis=1), axis=0,
+                                    return_inverse=True)
+        n = len(self.inputs["settlement"])
+        results = {name: np.empty(n, dtype=object) for name in self.ladder.outputs}
+        for group, ids in enumerate(groups):
+            mask = inverse.ravel() == group
+            subset = {name: value[mask] if isinstance(value, np.ndarray) and value.shape == (n,) else value
+                      for name, value in env.items()}
+            subset.update({name: self.list_ids[name][1][table_id] for name, table_id in zip(names, ids)})
+            for name, values in self.ladder.evaluate(subset).items():
+                results[name][mask] = values
+        return results
+
+    def _base_errors(self, i: int) -> int:
+        """Script errors in the recording before interval i (a checkpoint or the end)."""
+        if i >= len(self.inputs["settlement"]):
+            return self.final_state["errors"]
+        return self.checkpoints[i // self.checkpoint_every]["errors"]
+
+    def _same_state(self, state: dict, i: int) -> bool:
+        recorded = self.checkpoints[i // self.checkpoint_every]
+        return all(state[key] == recorded[key] for key in ("soc_wh", "last_action", "grid_kw", "user_cache"))
+
+    def rerun(self, values: dict) -> tuple:
+        """
+        Replay the script with values substituted for its constants.
+
+        Returns (ReplayResult, number of intervals actually simulated).
+        """
+        started = time.perf_counter()
+        n = len(self.inputs["settlement"])
+        changed = {name: value for name, value in values.items() if self.constants.get(name) != value}
+        runner = make_runner(self.script_path, apply_tunables(self.source, values), self.battery)
+        outputs = {name: array.copy() for name, array in self.outputs.items()}
+
+        # differs marks the intervals where the recorded decision no longer holds.
+        differs = np.zeros(n, dtype=bool)
+        if self._loads_outside is None or set(changed) & self._loads_outside:
+            differs[:] = True
+        elif changed:
+            try:
+                decisions = self.ladder_decisions(changed)
+                for name in self.ladder.outputs:
+                    differs |= decisions[name] != self.decisions[name]
+            except Exception:
+                differs[:] = True
+
+        simulated, errors, i = 0, 0, 0
+        while i < n:
+            diverged = np.flatnonzero(differs[i:])
+            if not len(diverged):
+                errors += self._base_errors(n) - self._base_errors(i)
+                break
+            first = (i + int(diverged[0])) // self.checkpoint_every * self.checkpoint_every
+            errors += self._base_errors(first) - self._base_errors(i)
+            state = copy.deepcopy(self.checkpoints[first // self.checkpoint_every])
+            i = first
+            while i < n:
+                stop = min(i + self.checkpoint_every, n)
+                run_intervals(runner, self.inputs, self.battery, state, outputs, i, stop)
+                simulated += stop - i
+                i = stop
+                if i < n and self._same_state(state, i):
+                    break
+            errors += state["errors"] - self.checkpoints[first // self.checkpoint_every]["errors"]
+
+        result = ReplayResult(self.inputs, outputs["actions"], outputs["solar"], outputs["soc"], outputs["imported"],
+                              outputs["exported"], errors, time.perf_counter() - started)
+        return result, simulated
+
+
+if __name__ == "__main__":
+    from backtest.replay import replay
+
+    script_path = sys.argv[1] if len(sys.argv) > 1 else "20250406_edit.py"
+    start = sys.argv[2] if len(sys.argv) > 2 else "2024-01-01 00:00"
+    end = sys.argv[3] if len(sys.argv) > 3 else "2024-02-01 00:00"
+    inputs = build_inputs(HistoricalIndex(), start, end)
+    recording = IncrementalReplay(script_path, inputs)
+    print(f"{script_path}: recorded {len(inputs['settlement'])} intervals in {recording.elapsed:.1f}s")
+    for name, value in (("buy_opport", 4.0), ("buy_opport", 0.0), ("night_fill", 35), ("always_sell_rrp", 800.0),
+                        ("buy_max_soft", 12.0)):
+        if name not in recording.constants:
+            continue
+        result, simulated = recording.rerun({name: value})
+        full = replay(script_path, None, None, inputs=inputs, source=apply_tunables(recording.source, {name: value}))
+        assert np.array_equal(result.soc, full.soc) and abs(result.bill - full.bill) < 1e-9, name
+        print(f"  {name} = {value}: {simulated} intervals re-simulated in {result.elapsed:.2f}s "
+              f"(full replay {full.elapsed:.2f}s), bill ${result.bill:.2f}")
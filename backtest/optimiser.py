@@ -0,0 +1,384 @@
+"""
+Adaptive tuning of a script's constants: CMA-ES with successive halving.
+
+A grid over buy_max_soft, sell_min_hard, buy_opport, always_sell_rrp,
+night_fill and the reserve_soc hour table of 20250406_edit.py is far too
+large to replay in full. Instead each generation of CMA-ES proposes a
+handful of configurations and they race over the year a few months at a
+time (successive halving): after each rung only the best 1/ETA by bill so
+far go on to more months, and any whose partial bill already trails the
+incumbent's bill over the same months are dropped. Only the survivors are
+replayed over every month, and CMA-ES ranks candidates by how far they got
+and then by bill.
+
+Each month is replayed on its own (from initial_soc, with an empty
+user_cache), so a month's bill can be reused by every rung that includes
+it. The study (CMA-ES state, every trial's monthly bills and the
+incumbent) is saved as JSON after every rung, and a run with the same
+study file resumes where the last one stopped.
+
+Run from the repository root:
+    python -m backtest.optimiser 20250406_edit.py [--generations=10] [--year=2024]
+        [--study=tuning_study_20250406_edit.json] [--workers=N]
+"""
+
+import json
+import math
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+
+import numpy as np
+
+from backtest.replay import build_inputs, replay
+from backtest.tuning import apply_tunables, load_shared_inputs, share_inputs
+from historical_prices_qld.query import HistoricalIndex
+
+ETA = 3  # keep the best 1/ETA of the candidates at each rung
+SIGMA = 0.3  # initial CMA-ES step size, in units of each parameter's range
+# Months in the order they join the race, so early rungs cover every season.
+MONTH_ORDER = (1, 7, 4, 10, 2, 8, 5, 11, 3, 9, 6, 12)
+# Bounds for the scalar constants of 20250406_edit.py.
+EDIT_SCALARS = {
+    "buy_max_soft": (0.0, 40.0),
+    "sell_min_hard": (5.0, 80.0),
+    "buy_opport": (0.0, 15.0),
+    "always_sell_rrp": (200.0, 5000.0),
+    "night_fill": (0, 100),
+}
+HOUR_TABLE = "reserve_soc"
+
+# Worker state, set once per process by _init_worker.
+_WORKER = {}
+
+
+@dataclass(frozen=True)
+class Parameter:
+    """One tuned value: a scalar constant, or "table[first-last]" for a run of hours of an hour table."""
+
+    name: str
+    low: float
+    high: float
+    integer: bool = False
+
+    def decode(self, unit: float):
+        value = self.low + min(max(unit, 0.0), 1.0) * (self.high - self.low)
+        return int(round(value)) if self.integer else round(float(value), 3)
+
+    def encode(self, value: float) -> float:
+        return (value - self.low) / (self.high - self.low)
+
+
+def read_hour_table(source: str, name: str) -> dict:
+    """{hour: value} from a `name = {` block with one `hour: value,` per line."""
+    block = re.search(rf"^{re.escape(name)}\s*=\s*\{{(.*?)\}}", source, re.MULTILINE | re.DOTALL)
+    if not block:
+        raise KeyError(f"no {name} table in this script")
+    return {int(hour): int(value) for hour, value in re.findall(r"(\d+)\s*:\s*(\d+)", block.group(1))}
+
+
+def write_hour_table(source: str, name: str, table: dict) -> str:
+    """Rewrite the values of the hours in table, leaving the layout of the block alone."""
+    block = re.search(rf"^{re.escape(name)}\s*=\s*\{{(.*?)\}}", source, re.MULTILINE | re.DOTALL)
+    body = re.sub(r"(\d+)(\s*:\s*)(\d+)",
+                  lambda match: match.group(1) + match.group(2) + str(table.get(int(match.group(1)), match.group(3))),
+                  block.group(1))
+    return source[:block.start(1)] + body + source[block.end(1):]
+
+
+def _hour_runs(table: dict) -> list:
+    """Runs of consecutive hours with the same value, as (first, last, value)."""
+    runs = []
+    for hour in sorted(table):
+        if runs and runs[-1][1] == hour - 1 and runs[-1][2] == table[hour]:
+            runs[-1] = (runs[-1][0], hour, table[hour])
+        else:
+            runs.append((hour, hour, table[hour]))
+    return runs
+
+
+def edit_space(source: str) -> tuple:
+    """
+    The search space for 20250406_edit.py and the script's current values.
+
+    The reserve_soc table is tuned as the runs of hours that currently share
+    a value (0-11, 12, 13, ..., 18-19, 20, 21-23), which keeps its shape:
+    10 parameters instead of 24, 15 with the scalars.
+    """
+    space, current = [], {}
+    for name, (low, high) in EDIT_SCALARS.items():
+        space.append(Parameter(name, low, high, isinstance(low, int)))
+        current[name] = float(re.search(rf"^{name}\s*=\s*(\d+(?:\.\d+)?)", source, re.MULTILINE).group(1))
+    for first, last, value in _hour_runs(read_hour_table(source, HOUR_TABLE)):
+        name = f"{HOUR_TABLE}[{first}-{last}]"
+        space.append(Parameter(name, 0, 100, True))
+        current[name] = value
+    return tuple(space), current
+
+
+def apply_values(source: str, values: dict) -> str:
+    """Rewrite scalar constants with apply_tunables and "table[first-last]" runs into their hour table."""
+    scalars, tables = {}, {}
+    for name, value in values.items():
+        run = re.fullmatch(r"(\w+)\[(\d+)-(\d+)\]", name)
+        if run:
+            table = tables.setdefault(run.group(1), {})
+            table.update({hour: value for hour in range(int(run.group(2)), int(run.group(3)) + 1)})
+        else:
+            scalars[name] = value
+    source = apply_tunables(source, scalars)
+    for name, table in tables.items():
+        source = write_hour_table(source, name, table)
+    return source
+
+
+def rung_sizes(periods: int, eta: int = ETA) -> list:
+    """Number of periods at each rung, e.g. [2, 4, 12] for 12 months and eta 3."""
+    sizes = [periods]
+    while sizes[0] > eta:
+        sizes.insert(0, math.ceil(sizes[0] / eta))
+    return sizes
+
+
+def month_periods(year: int) -> list:
+    """[(label, start, end)] for each month of year, in MONTH_ORDER."""
+    periods = []
+    for month in MONTH_ORDER:
+        following = (year + month // 12, month % 12 + 1)
+        periods.append((f"{year}-{month:02d}", f"{year}-{month:02d}-01 00:00",
+                        f"{following[0]}-{following[1]:02d}-01 00:00"))
+    return periods
+
+
+class CMAES:
+    """
+    (mu/mu_w, lambda)-CMA-ES on the unit cube, after Hansen's tutorial.
+
+    The state is plain lists in to_dict() so it can go into the study JSON.
+    Candidates for a generation come from a generator seeded with the
+    generation number, so a resumed study asks for the same ones again.
+    """
+
+    def __init__(self, mean: list, sigma: float = SIGMA, seed: int = 0):
+        n = len(mean)
+        self.seed = seed
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.sigma = sigma
+        self.generation = 0
+        self.C = np.eye(n)
+        self.pc = np.zeros(n)
+        self.ps = np.zeros(n)
+        self.popsize = 4 + int(3 * math.log(n))
+        mu = self.popsize // 2
+        weights = math.log(mu + 0.5) - np.log(np.arange(1, mu + 1))
+        self.weights = weights / weights.sum()
+        self.mueff = 1 / np.sum(self.weights ** 2)
+        self.cc = (4 + self.mueff / n) / (n + 4 + 2 * self.mueff / n)
+        self.cs = (self.mueff + 2) / (n + self.mueff + 5)
+        self.c1 = 2 / ((n + 1.3) ** 2 + self.mueff)
+        self.cmu = min(1 - self.c1, 2 * (self.mueff - 2 + 1 / self.mueff) / ((n + 2) ** 2 + self.mueff))
+        self.damps = 1 + 2 * max(0, math.sqrt((self.mueff - 1) / (n + 1)) - 1) + self.cs
+        self.chi_n = math.sqrt(n) * (1 - 1 / (4 * n) + 1 / (21 * n * n))
+
+    def ask(self) -> np.ndarray:
+        """popsize candidates, one per row."""
+        rng = np.random.default_rng((self.seed, self.generation))
+        values, vectors = np.linalg.eigh(self.C)
+        scale = vectors * np.sqrt(np.maximum(values, 1e-20))
+        return self.mean + self.sigma * rng.standard_normal((self.popsize, len(self.mean))) @ scale.T
+
+    def tell(self, candidates: np.ndarray, order: list) -> None:
+        """Update from the candidates of ask(), given their indices best first."""
+        n = len(self.mean)
+        mu = len(self.weights)
+        best = candidates[order[:mu]]
+        old = self.mean
+        self.mean = self.weights @ best
+        step = (self.mean - old) / self.sigma
+
+        values, vectors = np.linalg.eigh(self.C)
+        inverse_sqrt = vectors @ np.diag(1 / np.sqrt(np.maximum(values, 1e-20))) @ vectors.T
+        self.ps = (1 - self.cs) * self.ps + math.sqrt(self.cs * (2 - self.cs) * self.mueff) * inverse_sqrt @ step
+        norm = np.linalg.norm(self.ps) / math.sqrt(1 - (1 - self.cs) ** (2 * (self.generation + 1)))
+        hsig = norm / self.chi_n < 1.4 + 2 / (n + 1)
+        self.pc = (1 - self.cc) * self.pc + hsig * math.sqrt(self.cc * (2 - self.cc) * self.mueff) * step
+
+        spread = (best - old) / self.sigma
+        self.C = ((1 - self.c1 - self.cmu) * self.C
+                  + self.c1 * (np.outer(self.pc, self.pc) + (not hsig) * self.cc * (2 - self.cc) * self.C)
+                  + self.cmu * spread.T @ np.diag(self.weights) @ spread)
+        self.sigma *= math.exp((self.cs / self.damps) * (np.linalg.norm(self.ps) / self.chi_n - 1))
+        self.generation += 1
+
+    def to_dict(self) -> dict:
+        return {"seed": self.seed, "mean": self.mean.tolist(), "sigma": self.sigma, "generation": self.generation,
+                "C": self.C.tolist(), "pc": self.pc.tolist(), "ps": self.ps.tolist()}
+
+    @classmethod
+    def from_dict(cls, state: dict) -> "CMAES":
+        cma = cls(state["mean"], state["sigma"], state["seed"])
+        cma.generation = state["generation"]
+        cma.C, cma.pc, cma.ps = (np.asarray(state[key]) for key in ("C", "pc", "ps"))
+        return cma
+
+
+def _init_worker(script_path: str, source: str, folder: str) -> None:
+    periods = {label: load_shared_inputs(os.path.join(folder, label)) for label in os.listdir(folder)}
+    _WORKER.update(script_path=script_path, source=source, periods=periods)
+
+
+def _score_period(task: tuple) -> float:
+    values, label = task
+    source = apply_values(_WORKER["source"], values)
+    return replay(_WORKER["script_path"], None, None, source=source, inputs=_WORKER["periods"][label]).bill
+
+
+class Study:
+    """
+    A resumable optimisation of one script over a list of periods.
+
+    trials maps a configuration (as sorted JSON) to its values, the bill
+    of every period it has been replayed over, and how it ended
+    ("complete" or "pruned"). The incumbent is the complete trial with the
+    lowest total bill.
+    """
+
+    def __init__(self, path: str, script_path: str, space: tuple, current: dict, periods: list,
+                 eta: int = ETA, seed: int = 0):
+        self.path = path
+        self.script_path = script_path
+        self.space = space
+        self.periods = periods
+        self.eta = eta
+        self.trials = {}
+        self.incumbent = None
+        self.evaluations = 0
+        self.cma = CMAES([parameter.encode(current[parameter.name]) for parameter in space], seed=seed)
+        self.current = {parameter.name: parameter.decode(parameter.encode(current[parameter.name]))
+                        for parameter in space}
+        if os.path.exists(path):
+            self._load()
+
+    def _load(self) -> None:
+        with open(self.path) as f:
+            state = json.load(f)
+        if state["space"] != [asdict(parameter) for parameter in self.space] or \
+                state["periods"] != [list(period) for period in self.periods]:
+            raise ValueError(f"{self.path} is a study of a different space or period list")
+        self.trials = state["trials"]
+        self.incumbent = state["incumbent"]
+        self.evaluations = state["evaluations"]
+        self.cma = CMAES.from_dict(state["cma"])
+
+    def save(self) -> None:
+        state = {
+            "script": self.script_path,
+            "space": [asdict(parameter) for parameter in self.space],
+            "periods": [list(period) for period in self.periods],
+            "cma": self.cma.to_dict(),
+            "trials": self.trials,
+            "incumbent": self.incumbent,
+            "evaluations": self.evaluations,
+        }
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.path)
+
+    def _trial(self, values: dict) -> dict:
+        key = json.dumps(values, sort_keys=True)
+        return self.trials.setdefault(key, {"values": values, "bills": {}, "status": "running"})
+
+    def _partial(self, trial: dict, size: int) -> float:
+        return sum(trial["bills"][label] for label, _, _ in self.periods[:size])
+
+    def _race(self, candidates: list, executor) -> list:
+        """Successive halving of trials over the periods; returns the sort key of each for CMA-ES."""
+        trials = [self._trial(values) for values in candidates]
+        alive = list(range(len(trials)))
+        keys = [None] * len(trials)
+        for rung, size in enumerate(rung_sizes(len(self.periods), self.eta)):
+            tasks = [(i, label) for i in alive for label, _, _ in self.periods[:size]
+                     if label not in trials[i]["bills"]]
+            bills = executor.map(_score_period, [(trials[i]["values"], label) for i, label in tasks])
+            for (i, label), bill in zip(tasks, bills):
+                trials[i]["bills"][label] = bill
+            self.evaluations += len(tasks)
+
+            partial = {i: self._partial(trials[i], size) for i in alive}
+            for i in alive:
+                keys[i] = (-rung, partial[i])
+            if size == len(self.periods):
+                for i in alive:
+                    trials[i]["status"] = "complete"
+                    if self.incumbent is None or partial[i] < self.trials[self.incumbent]["total"]:
+                        self.incumbent = json.dumps(trials[i]["values"], sort_keys=True)
+                    trials[i]["total"] = partial[i]
+                self.save()
+                break
+
+            ranked = sorted(alive, key=partial.get)
+            keep = ranked[:math.ceil(len(alive) / self.eta)]
+            if self.incumbent is not None:
+                best = self.trials[self.incumbent]
+                keep = [i for i in keep if partial[i] <= self._partial(best, size)]
+            for i in set(alive) - set(keep):
+                trials[i]["status"] = "pruned"
+            alive = keep
+            self.save()
+            if not alive:
+                break
+        return keys
+
+    def run(self, generations: int, workers: int = None, index: HistoricalIndex = None) -> dict:
+        """Run generations more generations (after scoring the current values) and return the incumbent."""
+        with open(self.script_path) as f:
+            source = f.read()
+        folder = tempfile.mkdtemp(prefix="optimiser_")
+        try:
+            index = index or HistoricalIndex()
+            for label, start, end in self.periods:
+                os.mkdir(os.path.join(folder, label))
+                share_inputs(build_inputs(index, start, end), os.path.join(folder, label))
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(self.script_path, source, folder)) as executor:
+                if self.incumbent is None:
+                    self._race([self.current], executor)
+                for _ in range(generations):
+                    candidates = self.cma.ask()
+                    values = [{parameter.name: parameter.decode(unit) for parameter, unit in zip(self.space, row)}
+                              for row in candidates]
+                    keys = self._race(values, executor)
+                    self.cma.tell(candidates, sorted(range(len(keys)), key=keys.__getitem__))
+                    self.save()
+        finally:
+            shutil.rmtree(folder)
+        return self.trials[self.incumbent]
+
+    def summary(self) -> str:
+        best = self.trials[self.incumbent]
+        baseline = self.trials.get(json.dumps(self.current, sort_keys=True), {}).get("total")
+        pruned = sum(trial["status"] == "pruned" for trial in self.trials.values())
+        lines = [f"{len(self.trials)} trials ({pruned} pruned) in {self.evaluations} period replays "
+                 f"= {self.evaluations / len(self.periods):.1f} full replays over {self.cma.generation} generation(s)",
+                 f"best bill ${best['total']:.2f}" + (f" (current values ${baseline:.2f})" if baseline is not None else "")]
+        lines += [f"  {name} = {value}" for name, value in best["values"].items()]
+        return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    options = dict(arg[2:].split("=", 1) for arg in sys.argv[2:] if arg.startswith("--"))
+    script_path = sys.argv[1]
+    stem = os.path.splitext(os.path.basename(script_path))[0]
+    with open(script_path) as f:
+        space, current = edit_space(f.read())
+    study = Study(options.get("study", f"tuning_study_{stem}.json"), script_path, space, current,
+                  month_periods(int(options.get("year", 2024))))
+    started = time.perf_counter()
+    study.run(int(options.get("generations", 10)), int(options["workers"]) if "workers" in options else None)
+    print(f"{script_path} in {time.perf_counter() - started:.0f}s: {study.summary()}")
@@ -0,0 +1,226 @@
+"""
+Optimal charge/discharge schedule over the forecast horizon by dynamic programming.
+
+The scripts schedule with hand-tuned thresholds (buy_max_soft,
+sell_min_hard, start_charging_time, required_min_soc). The planner instead
+solves the schedule that minimises the grid bill over the 16 half-hour
+steps of buy_forecast/sell_forecast, and the first step is what to do now;
+the next interval solves again from wherever the battery ended up
+(receding horizon).
+
+State is the SOC on a grid of soc_steps points from empty to
+battery_capacity. In a step the battery may move up by what
+max_charge_rate_kW stores in half an hour and down by what it delivers,
+with the round-trip efficiency split between charging and discharging as in
+backtest/battery.py. It may not discharge below the reserve floor for
+that step (an SOC already below the floor may stay or charge). What the
+battery takes or gives is settled with the grid together with the house's
+net load, export capped at feed_in_power_limitation. Energy left at the
+end of the horizon is valued at terminal_price, the mean of the sell
+forecast unless given.
+
+The moves from each grid point are fixed by the battery, so they are
+precomputed, and each step of the backward pass is one (soc_steps, moves)
+array operation: a 16-step plan takes well under a millisecond. The value
+function and decisions of the last solve are kept; a call with the same
+forecast (a half-hour forecast is unchanged for the six intervals it
+covers) only traces the plan from the new SOC. A forecast shifted by a
+step has a new last step, which changes the value of every earlier step,
+so it is solved again.
+
+Run from the repository root to time the planner and replay it against a
+script:
+    python -m backtest.planner [20250406_edit.py] [start] [end]
+"""
+
+import sys
+import time
+from dataclasses import dataclass
+
+import numpy as np
+
+from backtest import battery as battery_model
+from backtest.battery import ACTIONS, Battery
+from backtest.replay import (STEP_INTERVALS, ReplayResult, _half_hour_means, build_inputs, empty_outputs,
+                             initial_state, replay)
+from historical_prices_qld.query import HistoricalIndex
+
+SOC_STEPS = 51  # grid points from 0 to 100% SOC
+STEP_HOURS = 0.5
+RESERVE_SOC = 10.0  # %
+
+
+@dataclass(frozen=True)
+class Plan:
+    """
+    The schedule for the horizon.
+
+    actions are Powston actions per step, soc the SOC (%) at the start of
+    each step and after the last one, battery_kwh the AC energy into the
+    battery per step (negative when discharging), cost the grid bill over
+    the horizon in dollars (without the value of the energy left).
+    """
+
+    action: str
+    actions: tuple
+    soc: tuple
+    battery_kwh: tuple
+    cost: float
+    cached: bool
+
+
+class Planner:
+    """Solves Plans for one battery, reusing the last value function while the forecast is unchanged."""
+
+    def __init__(self, battery: Battery = Battery(), soc_steps: int = SOC_STEPS, step_hours: float = STEP_HOURS):
+        self.battery = battery
+        self.step_hours = step_hours
+        self.grid = np.linspace(0.0, 100.0, soc_steps)
+        efficiency = battery.charge_efficiency
+        step_kwh = battery.battery_capacity / 1000 / (soc_steps - 1)
+        stored = battery.max_charge_rate_kW * step_hours
+        up, down = int(stored * efficiency / step_kwh + 1e-9), int(stored / efficiency / step_kwh + 1e-9)
+        self.moves = np.arange(-down, up + 1)
+        # AC energy (kWh) the battery takes from or gives to the house per move.
+        self.move_kwh = np.where(self.moves > 0, self.moves * step_kwh / efficiency, self.moves * step_kwh * efficiency)
+        self.targets = np.arange(soc_steps)[:, None] + self.moves
+        self.outside = (self.targets < 0) | (self.targets >= soc_steps)
+        self.targets = np.clip(self.targets, 0, soc_steps - 1)
+        self.target_soc = self.grid[self.targets]
+        self.tolerance = step_kwh / efficiency / 2
+        self.stored_kwh = self.grid / 100 * battery.battery_capacity / 1000
+        self._key = None
+        self._values = self._choices = self._costs = None
+
+    def _solve(self, buy: np.ndarray, sell: np.ndarray, net_kwh: np.ndarray, floors: np.ndarray,
+               terminal_price: float) -> None:
+        """Backward pass: self._values[t, s] is the least cost from grid point s at step t, _choices the move."""
+        horizon = len(buy)
+        grid_kwh = net_kwh[:, None] + self.move_kwh
+        export_kwh = np.minimum(np.maximum(-grid_kwh, 0.0), self.battery.feed_in_power_limitation / 1000
+                                * self.step_hours)
+        costs = np.maximum(grid_kwh, 0.0) * buy[:, None] - export_kwh * sell[:, None]
+
+        values = np.empty((horizon + 1, len(self.grid)))
+        choices = np.empty((horizon, len(self.grid)), dtype=np.int64)
+        values[horizon] = -terminal_price * self.stored_kwh * self.battery.charge_efficiency
+        discharging = self.moves < 0
+        for t in range(horizon - 1, -1, -1):
+            candidates = costs[t] + values[t + 1][self.targets]
+            blocked = self.outside | (discharging & (self.target_soc < floors[t]))
+            candidates[blocked] = np.inf
+            choices[t] = candidates.argmin(axis=1)
+            values[t] = candidates[np.arange(len(self.grid)), choices[t]]
+        self._values, self._choices, self._costs = values, choices, costs
+
+    def plan(self, buy_forecast, sell_forecast, battery_soc: float, pv_kw=None, load_kw=None,
+             reserve_soc=RESERVE_SOC, terminal_price: float = None) -> Plan:
+        """
+        The least-cost Plan from battery_soc (%) for the forecast horizon.
+
+        Prices are c/kWh per step; pv_kw and load_kw are the mean PV and
+        house load per step (zero when not given, i.e. pure arbitrage);
+        reserve_soc is a floor (%) for every step or a sequence of one per
+        step.
+        """
+        buy = np.asarray(buy_forecast, dtype=np.float64)
+        sell = np.asarray(sell_forecast, dtype=np.float64)
+        horizon = len(buy)
+        pv = np.zeros(horizon) if pv_kw is None else np.asarray(pv_kw, dtype=np.float64)
+        load = np.zeros(horizon) if load_kw is None else np.asarray(load_kw, dtype=np.float64)
+        floors = np.broadcast_to(np.asarray(reserve_soc, dtype=np.float64), (horizon,))
+        if terminal_price is None:
+            terminal_price = float(sell.mean())
+        net_kwh = (load - pv) * self.step_hours
+
+        key = (buy.tobytes(), sell.tobytes(), net_kwh.tobytes(), floors.tobytes(), terminal_price)
+        cached = key == self._key
+        if not cached:
+            self._solve(buy, sell, net_kwh, floors, terminal_price)
+            self._key = key
+
+        s = int(np.abs(self.grid - battery_soc).argmin())
+        path, moves = [s], []
+        for t in range(horizon):
+            move = int(self._choices[t, s])
+            moves.append(move)
+            s = int(self.targets[s, move])
+            path.append(s)
+        battery_kwh = tuple(float(self.move_kwh[move]) for move in moves)
+        actions = tuple(dispatch_action(kwh, net, self.tolerance)
+                        for kwh, net in zip(battery_kwh, net_kwh))
+        cost = sum(float(self._costs[t, move]) for t, move in enumerate(moves)) / 100
+        return Plan(actions[0], actions, tuple(float(self.grid[s]) for s in path), battery_kwh, cost, cached)
+
+
+def dispatch_action(battery_kwh: float, net_kwh: float, tolerance: float = 0.0) -> str:
+    """
+    The Powston action for a planned step: the AC energy into the battery against the house's net load.
+
+    Charging within the PV surplus is charge and beyond it import;
+    discharging within the house deficit is discharge and beyond it export;
+    an idle battery is stopped. tolerance (kWh) absorbs the SOC grid's rounding.
+    """
+    if battery_kwh > 0:
+        return "import" if battery_kwh > max(-net_kwh, 0.0) + tolerance else "charge"
+    if battery_kwh < 0:
+        return "export" if -battery_kwh > max(net_kwh, 0.0) + tolerance else "discharge"
+    return "stopped"
+
+
+def replay_planner(start, end, region: str = "QLD1", battery: Battery = Battery(), initial_soc: float = 50.0,
+                   reserve_soc=RESERVE_SOC, index: HistoricalIndex = None, inputs: dict = None) -> ReplayResult:
+    """
+    Replay the planner in place of a script: each interval plans from the current SOC and applies the first action.
+
+    The planner sees the same perfect-foresight forecasts as a script, and
+    the simulated PV and load averaged over each forecast step.
+    """
+    started = time.perf_counter()
+    if inputs is None:
+        inputs = build_inputs(index or HistoricalIndex(), start, end, region)
+    n = len(inputs["settlement"])
+    # The site arrays cover only the replayed intervals, so the last hours repeat their last value.
+    pv_forecast = _half_hour_means(inputs["pv"], 0, n)
+    load_forecast = _half_hour_means(inputs["load"], 0, n)
+    planner = Planner(battery)
+    state = initial_state(battery, initial_soc)
+    outputs = empty_outputs(n)
+    action_codes = {action: number for number, action in enumerate(ACTIONS)}
+    soc_wh = state["soc_wh"]
+    for i in range(n):
+        action = planner.plan(inputs["buy_forecast"][i], inputs["sell_forecast"][i],
+                              soc_wh / battery.battery_capacity * 100, pv_forecast[i], load_forecast[i],
+                              reserve_soc).action
+        soc_wh, imported, exported = battery_model.step(soc_wh, action, "maximize", float(inputs["pv"][i]),
+                                                         float(inputs["load"][i]), battery)
+        outputs["actions"][i] = action_codes[action]
+        outputs["soc"][i] = soc_wh / battery.battery_capacity * 100
+        outputs["imported"][i], outputs["exported"][i] = imported, exported
+    return ReplayResult(inputs, outputs["actions"], outputs["solar"], outputs["soc"], outputs["imported"],
+                        outputs["exported"], 0, time.perf_counter() - started)
+
+
+if __name__ == "__main__":
+    script_path = sys.argv[1] if len(sys.argv) > 1 else "20250406_edit.py"
+    start = sys.argv[2] if len(sys.argv) > 2 else "2024-01-01 00:00"
+    end = sys.argv[3] if len(sys.argv) > 3 else "2024-02-01 00:00"
+    inputs = build_inputs(HistoricalIndex(), start, end)
+
+    planner = Planner()
+    rows = range(0, len(inputs["settlement"]), STEP_INTERVALS)
+    started = time.perf_counter()
+    for i in rows:
+        planner.plan(inputs["buy_forecast"][i], inputs["sell_forecast"][i], 50.0)
+    solved = (time.perf_counter() - started) / len(rows)
+    started = time.perf_counter()
+    for soc in range(len(rows)):
+        planner.plan(inputs["buy_forecast"][0], inputs["sell_forecast"][0], soc % 100)
+    reused = (time.perf_counter() - started) / len(rows)
+    print(f"{len(planner.grid)}-point SOC grid, {len(planner.moves)} moves: {solved * 1000:.2f} ms per solve, "
+          f"{reused * 1000:.2f} ms per plan from the cached value function")
+
+    result = replay_planner(start, end, inputs=inputs)
+    print(f"planner {start} to {end}: {result.summary()}")
+    result = replay(script_path, start, end, inputs=inputs)
+    print(f"{script_path} {start} to {end}: {result.summary()}")
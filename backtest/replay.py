@@ -0,0 +1,265 @@
+"""
+Replay a Powston script over every 5-minute interval of the historical data.
+
+For each interval the globals the script expects are synthesised from the
+historical store and the simulated site, the script is executed, and its
+action and solar mode are applied to the battery model. The result is the
+bill for the period plus per-interval SOC, grid energy and cost.
+
+Synthesised globals, per interval:
+
+    interval_time, rrp              SETTLEMENTDATE (AEST) and its RRP in $/MWh
+    buy_price, sell_price           from RRP through a flat retail tariff (c/kWh)
+    forecast, buy_forecast,         16 half-hour steps of the real prices that
+    sell_forecast                   followed (perfect foresight)
+    history_buy_prices              the previous 168 five-minute buy prices
+    sunrise, sunset                 for the site (backtest/site.py)
+    battery_soc, solar_power,       from the battery model and the synthetic
+    house_power, grid_power         PV and load profiles
+    user_cache, last_action         carried from one interval to the next
+
+Everything else comes from the variables_available.py snapshot (see
+backtest/runner.py). print() is silenced, and datetime/timedelta are
+provided as the Powston runtime does.
+
+Run from the repository root:
+    python -m backtest.replay 20250406_edit.py [start] [end]
+"""
+
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from backtest import battery as battery_model
+from backtest.battery import ACTIONS, SOLAR_MODES, Battery
+from backtest.runner import ScriptRunner
+from backtest.site import Site, house_load, pv_power, sun_times
+from historical_prices_qld.query import HistoricalIndex, to_epoch
+from historical_prices_qld.settlement_time import from_epoch_seconds, to_epoch_seconds
+
+AEST = timezone(timedelta(hours=10))
+HISTORY_INTERVALS = 168
+FORECAST_STEPS = 16
+STEP_INTERVALS = 6  # a forecast step is half an hour
+
+# Retail tariff fitted to the buy/sell forecasts in variables_available.py:
+# buy = 1.117 * wholesale + 8.27 c/kWh (network charges, losses, GST),
+# sell = wholesale. Wholesale c/kWh is RRP $/MWh / 10.
+BUY_MULTIPLIER = 1.117
+BUY_ADDER = 8.27
+SELL_MULTIPLIER = 1.0
+
+
+def tariff(rrp: np.ndarray) -> tuple:
+    """Retail (buy_price, sell_price) in c/kWh for RRP in $/MWh."""
+    wholesale = np.asarray(rrp, dtype=np.float64) / 10
+    return BUY_MULTIPLIER * wholesale + BUY_ADDER, SELL_MULTIPLIER * wholesale
+
+
+def _half_hour_means(values: np.ndarray, first: int, count: int) -> np.ndarray:
+    """(count, FORECAST_STEPS) means of the 6 intervals in each half hour after interval first + i."""
+    padded = np.r_[values, np.full(FORECAST_STEPS * STEP_INTERVALS, values[-1])]
+    cumulative = np.r_[0.0, np.cumsum(padded)]
+    starts = first + np.arange(count)[:, None] + 1 + STEP_INTERVALS * np.arange(FORECAST_STEPS)
+    return (cumulative[starts + STEP_INTERVALS] - cumulative[starts]) / STEP_INTERVALS
+
+
+def build_inputs(index: HistoricalIndex, start, end, region: str = "QLD1", site: Site = Site()) -> dict:
+    """
+    Arrays of everything the replay feeds the script for intervals in (start, end].
+
+    The window is widened by HISTORY_INTERVALS before and the forecast
+    horizon after, so the first interval has a full history and the last a
+    full forecast; at the edges of the data the nearest price is repeated.
+    """
+    start, end = to_epoch(start), to_epoch(end)
+    wide = index.between(start - HISTORY_INTERVALS * 300, end + FORECAST_STEPS * STEP_INTERVALS * 300, region)
+    settlement = np.asarray(wide["settlement"])
+    rrp = np.asarray(wide["rrp"], dtype=np.float64)
+    first, last = np.searchsorted(settlement, [start, end], side="right")
+    if first >= last:
+        raise ValueError(f"no {region} intervals between {start} and {end}")
+    return inputs_from_prices(settlement, rrp, first, last, site)
+
+
+def inputs_from_prices(settlement: np.ndarray, rrp: np.ndarray, first: int, last: int, site: Site = Site()) -> dict:
+    """build_inputs() for intervals first to last - 1 of any price series, using what lies around them."""
+    buy, sell = tariff(rrp)
+    history = np.r_[np.full(HISTORY_INTERVALS, buy[0]), buy]
+
+    minutes = from_epoch_seconds(settlement[first:last])
+    days = minutes // 1440
+    sunrise, sunset = sun_times(np.unique(days), site)
+    day_index = np.searchsorted(np.unique(days), days)
+    return {
+        "settlement": settlement[first:last],
+        "minutes": minutes,
+        "rrp": rrp[first:last],
+        "buy": buy[first:last],
+        "sell": sell[first:last],
+        "forecast": _half_hour_means(rrp, first, last - first),
+        "buy_forecast": _half_hour_means(buy, first, last - first),
+        "sell_forecast": _half_hour_means(sell, first, last - first),
+        "history": history,
+        "history_offset": first,
+        "sunrise": to_epoch_seconds(days * 1440 + sunrise[day_index].astype(np.int64)),
+        "sunset": to_epoch_seconds(days * 1440 + sunset[day_index].astype(np.int64)),
+        "pv": pv_power(minutes, site),
+        "load": house_load(minutes, site),
+    }
+
+
+def interval_values(inputs: dict, i: int, battery_soc: float, user_cache: dict, last_action: str = "auto",
+                    grid_kw: float = 0.0) -> dict:
+    """The globals for interval i of build_inputs() output, given the battery and script state."""
+    buy, sell = float(inputs["buy"][i]), float(inputs["sell"][i])
+    offset = inputs["history_offset"]
+    return dict(
+        interval_time=datetime.fromtimestamp(int(inputs["settlement"][i]), AEST),
+        rrp=float(inputs["rrp"][i]), buy_price=buy, sell_price=sell,
+        general_tariff=buy, feed_in_tariff=sell, lv_buy_price=buy, lv_sell_price=sell,
+        forecast=inputs["forecast"][i].tolist(),
+        buy_forecast=inputs["buy_forecast"][i].tolist(),
+        sell_forecast=inputs["sell_forecast"][i].tolist(),
+        history_buy_prices=inputs["history"][offset + i:offset + i + HISTORY_INTERVALS].tolist(),
+        sunrise=datetime.fromtimestamp(int(inputs["sunrise"][i]), AEST),
+        sunset=datetime.fromtimestamp(int(inputs["sunset"][i]), AEST),
+        battery_soc=battery_soc,
+        solar_power=float(inputs["pv"][i]) * 1000, house_power=float(inputs["load"][i]) * 1000,
+        grid_power=grid_kw * 1000, pgrid=grid_kw * 1000,
+        user_cache=user_cache, last_action=last_action,
+        action=None, solar=None, suggested_action="auto", suggested_solar="maximize", reason="",
+    )
+
+
+class ReplayResult:
+    """Per-interval outcome of a replay and the bill it adds up to."""
+
+    def __init__(self, inputs: dict, actions: np.ndarray, solar: np.ndarray, soc: np.ndarray,
+                 imported: np.ndarray, exported: np.ndarray, errors: int, elapsed: float):
+        self.settlement = inputs["settlement"]
+        self.minutes = inputs["minutes"]
+        self.actions = actions
+        self.solar = solar
+        self.soc = soc
+        self.imported = imported
+        self.exported = exported
+        self.cost = (imported * inputs["buy"] - exported * inputs["sell"]) / 100
+        self.errors = errors
+        self.elapsed = elapsed
+
+    @property
+    def bill(self) -> float:
+        """Net grid cost in dollars (negative is a credit)."""
+        return float(self.cost.sum())
+
+    def monthly_bills(self) -> dict:
+        """
+        {'YYYY-MM': dollars} by the month each interval falls in.
+
+        SETTLEMENTDATE ends the interval, so the one at midnight on the 1st
+        belongs to the month before; a window ending on a month boundary
+        gets no row for the next month.
+        """
+        months = ((self.minutes - 5) * 60).astype("datetime64[s]").astype("datetime64[M]")
+        labels, inverse = np.unique(months, return_inverse=True)
+        totals = np.bincount(inverse, weights=self.cost)
+        return {str(label): float(total) for label, total in zip(labels, totals)}
+
+    def action_counts(self) -> dict:
+        counts = np.bincount(self.actions, minlength=len(ACTIONS))
+        return {action: int(count) for action, count in zip(ACTIONS, counts)}
+
+    def summary(self) -> str:
+        return (f"{len(self.cost)} intervals in {self.elapsed:.1f}s: bill ${self.bill:.2f}, "
+                f"import {self.imported.sum():.0f} kWh, export {self.exported.sum():.0f} kWh, "
+                f"{self.errors} script error(s). Actions: {self.action_counts()}")
+
+
+def make_runner(script_path: str, source: str = None, battery: Battery = Battery()) -> ScriptRunner:
+    """A ScriptRunner whose globals describe battery."""
+    runner = ScriptRunner(script_path, source)
+    runner.base["battery_capacity"] = battery.battery_capacity
+    runner.base["feed_in_power_limitation"] = battery.feed_in_power_limitation
+    return runner
+
+
+def initial_state(battery: Battery = Battery(), initial_soc: float = 50.0) -> dict:
+    """What carries over from one interval to the next, before the first one."""
+    return {"soc_wh": battery.battery_capacity * initial_soc / 100, "user_cache": {}, "last_action": "auto",
+            "grid_kw": 0.0, "errors": 0}
+
+
+def empty_outputs(n: int) -> dict:
+    """Per-interval arrays filled by run_intervals()."""
+    return {"actions": np.zeros(n, dtype=np.int8), "solar": np.zeros(n, dtype=np.int8), "soc": np.zeros(n),
+            "imported": np.zeros(n), "exported": np.zeros(n)}
+
+
+def run_intervals(runner: ScriptRunner, inputs: dict, battery: Battery, state: dict, outputs: dict,
+                  first: int, last: int, observe=None) -> None:
+    """
+    Run the script for intervals first to last - 1 and apply each decision to the battery.
+
+    state (see initial_state) is updated in place, so a run can be
+    continued later or restarted from a copy; outputs are written at each
+    interval's index. observe(i, namespace) is called after each script run.
+    """
+    action_codes = {action: number for number, action in enumerate(ACTIONS)}
+    solar_codes = {mode: number for number, mode in enumerate(SOLAR_MODES)}
+    soc_wh, user_cache = state["soc_wh"], state["user_cache"]
+    last_action, grid_kw, errors = state["last_action"], state["grid_kw"], state["errors"]
+    for i in range(first, last):
+        pv_kw, load_kw = float(inputs["pv"][i]), float(inputs["load"][i])
+        values = interval_values(inputs, i, round(soc_wh / battery.battery_capacity * 100, 1), user_cache,
+                                 last_action, grid_kw)
+        try:
+            namespace = runner.run(values)
+        except Exception:
+            namespace = runner.namespace
+            errors += 1
+        if observe is not None:
+            observe(i, namespace)
+        action = namespace.get("action")
+        solar = namespace.get("solar")
+        soc_wh, imported, exported = battery_model.step(soc_wh, action, solar, pv_kw, load_kw, battery)
+        outputs["actions"][i] = action_codes.get(action, 0)
+        outputs["solar"][i] = solar_codes.get(solar, 0)
+        outputs["soc"][i] = soc_wh / battery.battery_capacity * 100
+        outputs["imported"][i], outputs["exported"][i] = imported, exported
+        grid_kw = (imported - exported) / battery_model.INTERVAL_HOURS
+        last_action = action if isinstance(action, str) else "auto"
+    state.update(soc_wh=soc_wh, last_action=last_action, grid_kw=grid_kw, errors=errors)
+
+
+def replay(script_path: str, start, end, region: str = "QLD1", site: Site = Site(),
+           battery: Battery = Battery(), initial_soc: float = 50.0, index: HistoricalIndex = None,
+           source: str = None, inputs: dict = None) -> ReplayResult:
+    """
+    Run script_path for every interval in (start, end] and simulate the battery.
+
+    source replaces the file's contents (e.g. with tuned constants), and
+    inputs from an earlier build_inputs() call skip rebuilding them.
+    """
+    started = time.perf_counter()
+    if inputs is None:
+        inputs = build_inputs(index or HistoricalIndex(), start, end, region, site)
+    runner = make_runner(script_path, source, battery)
+    n = len(inputs["settlement"])
+    state = initial_state(battery, initial_soc)
+    outputs = empty_outputs(n)
+    run_intervals(runner, inputs, battery, state, outputs, 0, n)
+    return ReplayResult(inputs, outputs["actions"], outputs["solar"], outputs["soc"], outputs["imported"],
+                        outputs["exported"], state["errors"], time.perf_counter() - started)
+
+
+if __name__ == "__main__":
+    script_path = sys.argv[1]
+    start = sys.argv[2] if len(sys.argv) > 2 else "2024-01-01 00:00"
+    end = sys.argv[3] if len(sys.argv) > 3 else "2025-01-01 00:00"
+    result = replay(script_path, start, end)
+    print(f"{script_path} {start} to {end}: {result.summary()}")
+    for month, bill in result.monthly_bills().items():
+        print(f"  {month}: ${bill:8.2f}")
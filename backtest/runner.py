@@ -0,0 +1,147 @@
+"""
+Compile-once, exec-many runner for Powston scripts.
+
+The old test harness writes each case to test_script_temp.py, fakes the
+variables_available module in sys.modules and re-imports the script with
+importlib. That is a file write, a compile and an import for every
+evaluation. ScriptRunner compiles a script once, caching the code object
+by the SHA-256 of its source, and executes it into one globals dict that is
+reset from a prepared base namespace for every interval. Mutable values in
+the base (user_cache, the forecast lists, ...) are deep-copied into each
+run that does not supply its own, so a script writing into them cannot
+leak state into later runs.
+
+Run from the repository root to compare the two:
+    python -m backtest.runner [script.py] [evaluations]
+"""
+
+import copy
+import hashlib
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+import variables_available
+
+# sha256 of the source -> code object, shared by every runner in the process.
+_CODE_CACHE = {}
+# path -> ((size, mtime_ns), sha256), so an unchanged file is not re-read.
+_PATH_CACHE = {}
+# Values a script cannot change in place.
+ATOMS = (str, int, float, bool, type(None))
+
+
+def base_globals() -> dict:
+    """The variables_available.py snapshot as a fresh globals dict."""
+    namespace = {name: value for name, value in vars(variables_available).items() if not name.startswith("__")}
+    namespace.update(datetime=datetime, timedelta=timedelta, print=lambda *args, **kwargs: None)
+    return namespace
+
+
+def compile_source(source: str, filename: str = "<script>") -> tuple:
+    """Return (sha256, code object) for source, compiling it only the first time."""
+    digest = hashlib.sha256(source.encode()).hexdigest()
+    code = _CODE_CACHE.get(digest)
+    if code is None:
+        code = _CODE_CACHE[digest] = compile(source, filename, "exec")
+    return digest, code
+
+
+def compile_script(path: str) -> tuple:
+    """Return (sha256, code object) for a script file; unchanged files cost one stat()."""
+    stat = os.stat(path)
+    key = (stat.st_size, stat.st_mtime_ns)
+    cached = _PATH_CACHE.get(path)
+    if cached and cached[0] == key and cached[1] in _CODE_CACHE:
+        return cached[1], _CODE_CACHE[cached[1]]
+    with open(path) as f:
+        digest, code = compile_source(f.read(), path)
+    _PATH_CACHE[path] = (key, digest)
+    return digest, code
+
+
+def _flat(container) -> bool:
+    """True if nothing in the list, set or dict (keys or values) is itself mutable."""
+    items = container.items() if isinstance(container, dict) else ((item, None) for item in container)
+    return all(isinstance(key, ATOMS) and isinstance(value, ATOMS) for key, value in items)
+
+
+class ScriptRunner:
+    """Execute one compiled script repeatedly into a reused globals dict."""
+
+    def __init__(self, path: str = None, source: str = None, base: dict = None):
+        if source is None:
+            self.digest, self.code = compile_script(path)
+        else:
+            self.digest, self.code = compile_source(source, path or "<script>")
+        self.base = base_globals() if base is None else base
+        # name -> how to copy it: containers of numbers and strings only need a shallow copy.
+        self.mutable = {name: copy.copy if _flat(value) else copy.deepcopy for name, value in self.base.items()
+                        if isinstance(value, (list, dict, set))}
+        self.namespace = {}
+
+    def run(self, values: dict = None) -> dict:
+        """
+        Reset the namespace to base, apply values, execute the script and return the namespace.
+
+        The same dict is returned every call, so copy anything that must
+        outlive the next run. Exceptions from the script propagate.
+        """
+        namespace = self.namespace
+        namespace.clear()
+        namespace.update(self.base)
+        values = values or {}
+        for name, fresh in self.mutable.items():
+            if name not in values:
+                namespace[name] = fresh(self.base[name])
+        namespace.update(values)
+        exec(self.code, namespace)
+        return namespace
+
+
+def _legacy_evaluation(source: str, folder: str) -> str:
+    """One evaluation the way test_20250308_david.py does it."""
+    import importlib
+    import types
+    from unittest.mock import patch
+
+    with open(os.path.join(folder, "runner_benchmark_temp.py"), "w") as f:
+        f.write("from variables_available import *\n" + source)
+    module = types.ModuleType("variables_available")
+    for name, value in base_globals().items():
+        setattr(module, name, value)
+    with patch.dict("sys.modules", {"variables_available": module}):
+        sys.modules.pop("runner_benchmark_temp", None)
+        return importlib.import_module("runner_benchmark_temp").action
+
+
+if __name__ == "__main__":
+    import shutil
+    import tempfile
+
+    script_path = sys.argv[1] if len(sys.argv) > 1 else "20250406_edit.py"
+    evaluations = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    with open(script_path) as f:
+        source = f.read()
+
+    folder = tempfile.mkdtemp()
+    sys.path.insert(0, folder)
+    try:
+        started = time.perf_counter()
+        for _ in range(evaluations):
+            legacy_action = _legacy_evaluation(source, folder)
+        legacy = evaluations / (time.perf_counter() - started)
+    finally:
+        sys.path.remove(folder)
+        shutil.rmtree(folder)
+
+    started = time.perf_counter()
+    runner = ScriptRunner(script_path)
+    for _ in range(evaluations):
+        action = runner.run({"user_cache": {}})["action"]
+    fast = evaluations / (time.perf_counter() - started)
+
+    assert action == legacy_action, (action, legacy_action)
+    print(f"{script_path}: write + importlib {legacy:8.0f} evaluations/s, "
+          f"ScriptRunner {fast:8.0f} evaluations/s ({fast / legacy:.0f}x)")
@@ -0,0 +1,177 @@
+"""
+Monte Carlo price scenarios: block-bootstrapped days with noisy forecasts.
+
+A replay scores a script on the one price path that happened. Scenarios
+re-draw that history: a scenario-year follows a template calendar, and each
+block of block_days days is copied from a run of consecutive historical
+days starting in the same month, so seasonality, weekly shape and
+multi-day heat waves survive while the order of spikes changes.
+
+Forecasts in a replay are perfect foresight. Scenarios add error growing
+with the horizon: a random walk along the 16 half-hour steps, scaled so its
+SD at the last step is error (relative to the price). buy_forecast and
+sell_forecast come from the noisy forecast through the same tariff.
+
+Sampling only draws historical day numbers, (scenarios, days) small ints,
+so thousands of scenario-years take milliseconds; prices and forecasts are
+materialised one scenario at a time when a script is replayed over them.
+
+Run from the repository root for the distribution of a script's bills:
+    python -m backtest.scenarios 20250406_edit.py [--scenarios=16] [--days=28] [--block=7]
+        [--error=0.2] [--start=2024-01-01] [--workers=N]
+"""
+
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from backtest.replay import FORECAST_STEPS, inputs_from_prices, replay, tariff
+from backtest.site import Site
+from historical_prices_qld.query import HistoricalIndex
+from historical_prices_qld.settlement_time import calendar_columns, from_epoch_seconds, to_epoch_seconds
+
+INTERVALS_PER_DAY = 288
+BLOCK_DAYS = 7
+FORECAST_ERROR = 0.2  # relative SD of the forecast 8 hours ahead
+PERCENTILES = (5, 25, 50, 75, 95)
+
+# Worker state, set once per process by _init_worker.
+_WORKER = {}
+
+
+class DayLibrary:
+    """
+    Complete historical days of one region as a (days, 288) price matrix.
+
+    A day is the 288 intervals ending 00:05 to 24:00, matching the
+    interval-ending SETTLEMENTDATE; days with missing intervals are left out.
+    """
+
+    def __init__(self, rrp: np.ndarray, day_numbers: np.ndarray):
+        self.rrp = rrp
+        self.day_numbers = day_numbers
+        self.months = calendar_columns(day_numbers * 1440)["month"]
+
+    @classmethod
+    def from_index(cls, index: HistoricalIndex = None, region: str = "QLD1") -> "DayLibrary":
+        index = index or HistoricalIndex()
+        data = index.between(0, 2 ** 40, region, ("settlement", "rrp"))
+        days = (from_epoch_seconds(np.asarray(data["settlement"])) - 5) // 1440
+        day_numbers, starts, counts = np.unique(days, return_index=True, return_counts=True)
+        complete = counts == INTERVALS_PER_DAY
+        rows = starts[complete, None] + np.arange(INTERVALS_PER_DAY)
+        return cls(np.asarray(data["rrp"], dtype=np.float64)[rows], day_numbers[complete])
+
+    def sample(self, scenarios: int, start: str = "2024-01-01", days: int = 365, block_days: int = BLOCK_DAYS,
+               seed: int = 0) -> np.ndarray:
+        """
+        (scenarios, days) row numbers into rrp for scenario calendars starting at start.
+
+        Each block takes block_days consecutive historical days whose first
+        day is in the same month as the block's first calendar day.
+        """
+        calendar = np.datetime64(start, "D") + np.arange(days)
+        months = calendar.astype("datetime64[M]").astype(np.int64) % 12 + 1
+        block_months = months[::block_days]
+
+        # Block starts: rows whose next block_days - 1 rows are the following calendar days.
+        last = len(self.day_numbers) - block_days
+        runs = self.day_numbers[block_days - 1:] - self.day_numbers[:last + 1] == block_days - 1
+        candidates = np.flatnonzero(runs)
+        candidates = candidates[np.argsort(self.months[candidates], kind="stable")]
+        offsets = np.searchsorted(self.months[candidates], np.arange(1, 14))
+        counts = np.diff(offsets)
+        if np.any(counts[block_months - 1] == 0):
+            raise ValueError("the history has no block of that length for some month")
+
+        rng = np.random.default_rng(seed)
+        draws = rng.random((scenarios, len(block_months)))
+        picks = offsets[block_months - 1] + (draws * counts[block_months - 1]).astype(np.int64)
+        rows = candidates[picks][:, :, None] + np.arange(block_days)
+        return rows.reshape(scenarios, -1)[:, :days]
+
+    def prices(self, rows: np.ndarray) -> np.ndarray:
+        """RRP for sampled rows, flattened to 5-minute intervals along the last axis."""
+        return self.rrp[rows].reshape(*rows.shape[:-1], -1)
+
+
+def noisy_forecasts(forecast: np.ndarray, error: float = FORECAST_ERROR, seed: int = 0) -> dict:
+    """forecast, buy_forecast and sell_forecast with a relative random-walk error reaching error at the last step."""
+    rng = np.random.default_rng(seed)
+    walk = np.cumsum(rng.standard_normal(forecast.shape), axis=-1) * (error / np.sqrt(FORECAST_STEPS))
+    noisy = forecast * (1 + walk)
+    buy, sell = tariff(noisy)
+    return {"forecast": noisy, "buy_forecast": buy, "sell_forecast": sell}
+
+
+def scenario_inputs(library: DayLibrary, rows: np.ndarray, start: str = "2024-01-01", error: float = FORECAST_ERROR,
+                    seed: int = 0, site: Site = Site()) -> dict:
+    """build_inputs()-style arrays for one scenario (a 1-D row of sample()) on its template calendar."""
+    rrp = library.prices(rows)
+    first_minute = int(np.datetime64(start, "m").astype(np.int64))
+    settlement = to_epoch_seconds(first_minute + 5 * np.arange(1, len(rrp) + 1))
+    inputs = inputs_from_prices(settlement, rrp, 0, len(rrp), site)
+    if error:
+        inputs.update(noisy_forecasts(inputs["forecast"], error, seed))
+    return inputs
+
+
+def _init_worker(script_path: str, library: DayLibrary) -> None:
+    _WORKER.update(script_path=script_path, library=library)
+
+
+def _scenario_bill(task: tuple) -> float:
+    rows, start, error, seed = task
+    inputs = scenario_inputs(_WORKER["library"], rows, start, error, seed)
+    return replay(_WORKER["script_path"], None, None, inputs=inputs).bill
+
+
+def bill_distribution(script_path: str, scenarios: int, days: int = 28, start: str = "2024-01-01",
+                      block_days: int = BLOCK_DAYS, error: float = FORECAST_ERROR, seed: int = 0,
+                      library: DayLibrary = None, workers: int = None) -> np.ndarray:
+    """The script's bill (dollars) over each of scenarios bootstrapped periods, replayed in parallel."""
+    library = library or DayLibrary.from_index()
+    rows = library.sample(scenarios, start, days, block_days, seed)
+    tasks = [(rows[i], start, error, seed + i) for i in range(scenarios)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(script_path, library)) as executor:
+        return np.array(list(executor.map(_scenario_bill, tasks)))
+
+
+def summarise(bills: np.ndarray) -> str:
+    percentiles = np.percentile(bills, PERCENTILES)
+    return (f"mean ${bills.mean():.2f} (SD {bills.std():.2f}), "
+            + ", ".join(f"p{p} ${value:.2f}" for p, value in zip(PERCENTILES, percentiles)))
+
+
+if __name__ == "__main__":
+    options = dict(arg[2:].split("=", 1) for arg in sys.argv[2:] if arg.startswith("--"))
+    script_path = sys.argv[1]
+    library = DayLibrary.from_index()
+
+    started = time.perf_counter()
+    rows = library.sample(1000, days=365, seed=1)
+    sampled = time.perf_counter() - started
+    started = time.perf_counter()
+    means = [library.prices(rows[chunk:chunk + 50]).mean(axis=1) for chunk in range(0, 1000, 50)]
+    materialised = time.perf_counter() - started
+    started = time.perf_counter()
+    scenario_inputs(library, rows[0], seed=1)
+    one = time.perf_counter() - started
+    print(f"{len(library.day_numbers)} historical days. 1000 scenario-years: sampled in {sampled * 1000:.1f} ms, "
+          f"prices materialised in {materialised:.1f}s (mean RRP p5-p95 ${np.percentile(np.concatenate(means), 5):.0f}"
+          f"-${np.percentile(np.concatenate(means), 95):.0f}/MWh); full inputs with noisy forecasts {one:.2f}s each")
+
+    scenarios = int(options.get("scenarios", 16))
+    days = int(options.get("days", 28))
+    start = options.get("start", "2024-01-01")
+    started = time.perf_counter()
+    bills = bill_distribution(script_path, scenarios, days, start, int(options.get("block", BLOCK_DAYS)),
+                              float(options.get("error", FORECAST_ERROR)), library=library,
+                              workers=int(options["workers"]) if "workers" in options else None)
+    historical = replay(script_path, f"{start} 00:00", str(np.datetime64(start) + days) + " 00:00").bill
+    print(f"{script_path}: {scenarios} scenarios of {days} days from {start} in {time.perf_counter() - started:.0f}s")
+    print(f"  bills: {summarise(bills)}")
+    print(f"  historical path: ${historical:.2f}")
@@ -0,0 +1,83 @@
+"""
+Synthetic site: sunrise/sunset, PV generation and house load.
+
+The historical store only has prices and regional demand, so the replay
+needs a stand-in for the house it controls. Sun times and clear-sky PV come
+from the NOAA solar position approximation for the site's latitude and
+longitude; house load is a typical Queensland daily shape with a little
+more use in summer and winter. Everything is vectorised over arrays of
+minutes since epoch in AEST (see historical_prices_qld/settlement_time.py).
+"""
+
+from dataclasses import dataclass
+
+import numpy as np
+
+# Average house load (kW) by hour for a day using 1 kWh: overnight base,
+# a morning bump and the evening peak.
+LOAD_SHAPE = np.array([
+    0.55, 0.50, 0.48, 0.47, 0.48, 0.60, 0.95, 1.25, 1.10, 0.90, 0.85, 0.85,
+    0.85, 0.85, 0.90, 1.05, 1.35, 1.75, 1.95, 1.85, 1.60, 1.25, 0.90, 0.70,
+])
+LOAD_SHAPE = LOAD_SHAPE / LOAD_SHAPE.sum()
+
+DAY_2000_01_01 = 10957
+TROPICAL_YEAR = 365.2425
+
+
+@dataclass(frozen=True)
+class Site:
+    """Location and size of the simulated house (defaults: a Brisbane home)."""
+
+    latitude: float = -27.47
+    longitude: float = 153.03
+    utc_offset_hours: float = 10.0
+    pv_kw: float = 6.6
+    pv_performance: float = 0.75
+    daily_load_kwh: float = 20.0
+
+
+def _solar_angles(days: np.ndarray, minute_of_day: np.ndarray, site: Site) -> tuple:
+    """Declination (radians) and equation of time (minutes) at local times."""
+    day_of_year = (np.asarray(days, dtype=np.float64) - DAY_2000_01_01) % TROPICAL_YEAR
+    gamma = 2 * np.pi / 365 * (day_of_year + (minute_of_day / 60 - site.utc_offset_hours - 12) / 24)
+    declination = (0.006918 - 0.399912 * np.cos(gamma) + 0.070257 * np.sin(gamma)
+                   - 0.006758 * np.cos(2 * gamma) + 0.000907 * np.sin(2 * gamma)
+                   - 0.002697 * np.cos(3 * gamma) + 0.00148 * np.sin(3 * gamma))
+    equation_of_time = 229.18 * (0.000075 + 0.001868 * np.cos(gamma) - 0.032077 * np.sin(gamma)
+                                 - 0.014615 * np.cos(2 * gamma) - 0.040849 * np.sin(2 * gamma))
+    return declination, equation_of_time
+
+
+def sun_times(days: np.ndarray, site: Site = Site()) -> tuple:
+    """Sunrise and sunset as local minute of day for each day number."""
+    days = np.asarray(days, dtype=np.float64)
+    declination, equation_of_time = _solar_angles(days, np.full(days.shape, 720.0), site)
+    latitude = np.radians(site.latitude)
+    cos_hour_angle = (np.cos(np.radians(90.833)) / (np.cos(latitude) * np.cos(declination))
+                      - np.tan(latitude) * np.tan(declination))
+    hour_angle = np.degrees(np.arccos(np.clip(cos_hour_angle, -1, 1)))
+    noon = 720 - 4 * site.longitude - equation_of_time + site.utc_offset_hours * 60
+    return noon - 4 * hour_angle, noon + 4 * hour_angle
+
+
+def pv_power(minutes: np.ndarray, site: Site = Site()) -> np.ndarray:
+    """Clear-sky PV output in kW at each time (minutes since epoch, local)."""
+    days, minute_of_day = np.divmod(np.asarray(minutes, dtype=np.int64), 1440)
+    declination, equation_of_time = _solar_angles(days, minute_of_day, site)
+    solar_minutes = minute_of_day + equation_of_time + 4 * site.longitude - 60 * site.utc_offset_hours
+    hour_angle = np.radians(solar_minutes / 4 - 180)
+    latitude = np.radians(site.latitude)
+    sin_elevation = (np.sin(latitude) * np.sin(declination)
+                     + np.cos(latitude) * np.cos(declination) * np.cos(hour_angle))
+    return site.pv_kw * site.pv_performance * np.clip(sin_elevation, 0, None)
+
+
+def house_load(minutes: np.ndarray, site: Site = Site()) -> np.ndarray:
+    """House load in kW at each time: LOAD_SHAPE scaled to daily_load_kwh, up to 15% more in January and July."""
+    days, minute_of_day = np.divmod(np.asarray(minutes, dtype=np.int64), 1440)
+    hours = minute_of_day / 60
+    shape = np.interp(hours, np.arange(25), np.r_[LOAD_SHAPE, LOAD_SHAPE[0]])
+    # Cooling in January and heating in July both add load.
+    season = 1 + 0.15 * np.abs(np.cos(2 * np.pi * (days - DAY_2000_01_01) / TROPICAL_YEAR))
+    return site.daily_load_kwh * shape * season
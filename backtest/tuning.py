@@ -0,0 +1,192 @@
+"""
+Parameter sweep over a script's ALL_CAPS tunables (see auto_tuning.md).
+
+The tunables are the numeric assignments matching TUNABLE_PATTERN, e.g.
+MIN_SOC, HIGH_SOC, TAKE_THE_MONEY and PRICE_RATIO_THRESHOLD in
+david_script.py. Each configuration is the script with those constants
+rewritten, scored by a replay over the same historical period.
+
+The replay inputs are built once in the parent and saved as .npy files that
+every worker opens with numpy.memmap, so the workers share one read-only
+copy of the data and a sweep scales with the number of cores.
+
+Run from the repository root:
+    python -m backtest.tuning david_script.py [--samples=32] [--grid=MIN_SOC,HIGH_SOC]
+        [--start=2024-01-01] [--end=2024-02-01] [--workers=N] [--out=tuning.csv]
+"""
+
+import csv
+import itertools
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from backtest.cicd import build_fixtures, check, mismatches, parse_annotations
+from backtest.replay import build_inputs, replay
+from historical_prices_qld.query import HistoricalIndex
+
+TUNABLE_PATTERN = re.compile(r"^([A-Z_0-9]+)\s*=\s*(\d+(?:\.\d+)?)", re.MULTILINE)
+SPREAD = 0.5  # default search range is the current value +/- 50%
+GRID_LEVELS = (0.5, 0.75, 1.0, 1.25, 1.5)
+PERCENT_SUFFIX = "SOC"  # tunables ending in SOC are kept within 0-100
+RESULT_COLUMNS = ("rank", "bill", "saving", "errors", "cicd", "seconds")
+
+# Worker state, set once per process by _init_worker.
+_WORKER = {}
+
+
+def extract_tunables(source: str) -> dict:
+    """{name: value} for the first numeric ALL_CAPS assignment of each name; ints stay ints."""
+    tunables = {}
+    for name, value in TUNABLE_PATTERN.findall(source):
+        if name not in tunables:
+            tunables[name] = float(value) if "." in value else int(value)
+    return tunables
+
+
+def apply_tunables(source: str, values: dict) -> str:
+    """Rewrite the first assignment of each named tunable with its new value."""
+    for name, value in values.items():
+        pattern = re.compile(rf"^({re.escape(name)}\s*=\s*)\d+(?:\.\d+)?", re.MULTILINE)
+        source, count = pattern.subn(lambda match: match.group(1) + repr(value), source, count=1)
+        if not count:
+            raise KeyError(f"{name} is not a tunable in this script")
+    return source
+
+
+def _coerce(name: str, value: float, original):
+    if name.endswith(PERCENT_SUFFIX):
+        value = min(max(value, 0), 100)
+    return int(round(value)) if isinstance(original, int) else round(float(value), 4)
+
+
+def default_ranges(tunables: dict, spread: float = SPREAD) -> dict:
+    """{name: (low, high)} around each current value."""
+    return {name: (value * (1 - spread), value * (1 + spread)) for name, value in tunables.items()}
+
+
+def grid_configs(tunables: dict, names: list, levels=GRID_LEVELS) -> list:
+    """Every combination of levels x current value for the named tunables; the rest stay as they are."""
+    axes = [sorted({_coerce(name, tunables[name] * level, tunables[name]) for level in levels}) for name in names]
+    return [dict(zip(names, combination)) for combination in itertools.product(*axes)]
+
+
+def random_configs(tunables: dict, samples: int, ranges: dict = None, seed: int = 0) -> list:
+    """samples configurations drawn uniformly from ranges (default_ranges if not given)."""
+    ranges = ranges or default_ranges(tunables)
+    rng = np.random.default_rng(seed)
+    return [{name: _coerce(name, rng.uniform(low, high), tunables[name]) for name, (low, high) in ranges.items()}
+            for _ in range(samples)]
+
+
+def share_inputs(inputs: dict, folder: str) -> None:
+    """Save replay inputs as .npy files for load_shared_inputs()."""
+    for name, value in inputs.items():
+        np.save(os.path.join(folder, name + ".npy"), np.asarray(value))
+
+
+def load_shared_inputs(folder: str) -> dict:
+    """Replay inputs memory-mapped read-only from share_inputs() output."""
+    inputs = {}
+    for filename in os.listdir(folder):
+        name = filename[:-len(".npy")]
+        value = np.load(os.path.join(folder, filename), mmap_mode="r")
+        inputs[name] = value if value.ndim else int(value)
+    return inputs
+
+
+def _init_worker(script_path: str, source: str, folder: str) -> None:
+    _WORKER.update(script_path=script_path, source=source, inputs=load_shared_inputs(folder))
+
+
+def _score(config: dict) -> dict:
+    source = apply_tunables(_WORKER["source"], config)
+    result = replay(_WORKER["script_path"], None, None, source=source, inputs=_WORKER["inputs"])
+    return {"bill": result.bill, "errors": result.errors, "seconds": result.elapsed, **config}
+
+
+def sweep(script_path: str, configs: list, start, end, region: str = "QLD1", workers: int = None,
+          index: HistoricalIndex = None) -> list:
+    """
+    Replay every configuration over (start, end] and rank them by bill.
+
+    The script's current values are always scored too, and saving is
+    measured against them. If the script has CICD annotations, cicd is the
+    number each configuration fails (see backtest/cicd.py). Returns rows
+    sorted cheapest first, with any that raised script errors or failed an
+    annotation last, each with rank, bill, saving, errors, cicd, seconds
+    and the full set of tunable values.
+    """
+    with open(script_path) as f:
+        source = f.read()
+    tunables = extract_tunables(source)
+    configs = [{**tunables, **config} for config in [{}] + list(configs)]
+
+    index = index or HistoricalIndex()
+    folder = tempfile.mkdtemp(prefix="tuning_")
+    try:
+        share_inputs(build_inputs(index, start, end, region), folder)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(script_path, source, folder)) as executor:
+            rows = list(executor.map(_score, configs))
+    finally:
+        shutil.rmtree(folder)
+
+    fixtures = build_fixtures(parse_annotations(source), index, region)
+    for row, config in zip(rows, configs):
+        row["cicd"] = len(mismatches(check(script_path, fixtures, apply_tunables(source, config)))) if fixtures else 0
+
+    baseline = rows[0]["bill"]
+    rows.sort(key=lambda row: (row["errors"] > 0 or row["cicd"] > 0, row["bill"]))
+    for rank, row in enumerate(rows, 1):
+        row["rank"] = rank
+        row["saving"] = baseline - row["bill"]
+    return rows
+
+
+def _tunable_names(row: dict) -> list:
+    return [name for name in row if name not in RESULT_COLUMNS]
+
+
+def format_table(rows: list, limit: int = 20) -> str:
+    """Ranked rows as an aligned text table."""
+    names = _tunable_names(rows[0])
+    header = ["rank", "bill", "saving", "errors", "cicd"] + names
+    lines = [header] + [[str(row["rank"]), f"{row['bill']:.2f}", f"{row['saving']:.2f}", str(row["errors"]),
+                         str(row["cicd"])]
+                        + [str(row[name]) for name in names] for row in rows[:limit]]
+    widths = [max(len(line[i]) for line in lines) for i in range(len(header))]
+    return "\n".join("  ".join(cell.rjust(width) for cell, width in zip(line, widths)) for line in lines)
+
+
+def write_table(rows: list, path: str) -> None:
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(RESULT_COLUMNS) + _tunable_names(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+if __name__ == "__main__":
+    options = dict(arg[2:].split("=", 1) for arg in sys.argv[2:] if arg.startswith("--"))
+    script_path = sys.argv[1]
+    with open(script_path) as f:
+        tunables = extract_tunables(f.read())
+    if "grid" in options:
+        configs = grid_configs(tunables, options["grid"].split(","))
+    else:
+        configs = random_configs(tunables, int(options.get("samples", 32)), seed=int(options.get("seed", 0)))
+
+    started = time.perf_counter()
+    rows = sweep(script_path, configs, options.get("start", "2024-01-01 00:00"), options.get("end", "2024-02-01 00:00"),
+                 workers=int(options["workers"]) if "workers" in options else None)
+    elapsed = time.perf_counter() - started
+    print(f"{script_path}: {len(rows)} configurations of {', '.join(tunables)} in {elapsed:.1f}s")
+    print(format_table(rows))
+    if "out" in options:
+        write_table(rows, options["out"])
@@ -39,19 +39,107 @@ def safe_get_hour(time_obj):
     except (AttributeError, TypeError):
         return 0
 
-def calculate_sma(data, period):
-    """Calculate Simple Moving Average"""
+# BEGIN ROLLING PRICE STATS (same block in david_script.py, 20250406_edit.py and trading_strategy_snippets.md)
+# Mean, SD, min and max of the last 1, 2 and 4 hours of history_buy_prices, kept in
+# user_cache between intervals. Each interval adds only the newest price: window sums
+# and sums of squares are updated in O(1) and min/max come from monotonic queues of
+# positions into a ring of the last ROLLING_RING prices. The state is rebuilt from the
+# full list after a gap, when it disagrees with the list, and once a day so float error
+# in the running sums cannot build up. Bump the key's version if the layout changes.
+ROLLING_KEY = "rolling_prices_v1"
+ROLLING_WINDOWS = (12, 24, 48)  # 1h, 2h and 4h of 5-minute prices
+ROLLING_RING = max(ROLLING_WINDOWS)
+ROLLING_RESYNC = ROLLING_RING * 6  # prices added between rebuilds (a day)
+
+
+def rolling_new():
+    """Empty rolling state: t is the interval (epoch seconds) it is up to date for, n the prices added."""
+    return {"t": None, "n": 0, "ring": [0.0] * ROLLING_RING,
+            "sum": [0.0] * len(ROLLING_WINDOWS), "sumsq": [0.0] * len(ROLLING_WINDOWS),
+            "min": [[] for _ in ROLLING_WINDOWS], "max": [[] for _ in ROLLING_WINDOWS]}
+
+
+def rolling_push(stats, price):
+    """Add the newest price to every window."""
+    n, ring = stats["n"], stats["ring"]
+    for k, window in enumerate(ROLLING_WINDOWS):
+        old = ring[(n - window) % ROLLING_RING] if n >= window else 0.0
+        stats["sum"][k] += price - old
+        stats["sumsq"][k] += price * price - old * old
+        low, high = stats["min"][k], stats["max"][k]
+        while low and ring[low[-1] % ROLLING_RING] >= price:
+            low.pop()
+        while high and ring[high[-1] % ROLLING_RING] <= price:
+            high.pop()
+        low.append(n)
+        high.append(n)
+        if low[0] <= n - window:
+            low.pop(0)
+        if high[0] <= n - window:
+            high.pop(0)
+    ring[n % ROLLING_RING] = price
+    stats["n"] = n + 1
+
+
+def rolling_from(prices):
+    """Rolling state built directly from a list of prices, the newest last."""
+    stats = rolling_new()
+    prices = prices[-ROLLING_RING:]
+    n = len(prices)
+    stats["ring"][:n] = prices
+    stats["n"] = n
+    for k, window in enumerate(ROLLING_WINDOWS):
+        first = max(n - window, 0)
+        stats["sum"][k] = sum(prices[first:])
+        stats["sumsq"][k] = sum(price * price for price in prices[first:])
+        # The queues hold the positions priced below (above) every later price, oldest first.
+        low, high = [], []
+        for j in range(n - 1, first - 1, -1):
+            if not low or prices[j] < prices[low[-1]]:
+                low.append(j)
+            if not high or prices[j] > prices[high[-1]]:
+                high.append(j)
+        low.reverse()
+        high.reverse()
+        stats["min"][k], stats["max"][k] = low, high
+    return stats
+
+
+def rolling_in_step(stats, t, previous):
+    """True if stats is from the interval before t and its newest price is previous (history_buy_prices[-2])."""
+    return (stats is not None and t is not None and stats["t"] == t - 300 and stats["n"] % ROLLING_RESYNC != 0
+            and stats["ring"][(stats["n"] - 1) % ROLLING_RING] == previous)
+
+
+def rolling_window(stats, k):
+    """(mean, SD, min, max) of the last ROLLING_WINDOWS[k] prices, or None until that many have been added."""
+    window = ROLLING_WINDOWS[k]
+    if stats["n"] < window:
+        return None
+    mean = stats["sum"][k] / window
+    variance = max(stats["sumsq"][k] / window - mean * mean, 0.0)
+    ring = stats["ring"]
+    return mean, variance ** 0.5, ring[stats["min"][k][0] % ROLLING_RING], ring[stats["max"][k][0] % ROLLING_RING]
+# END ROLLING PRICE STATS
+
+
+def rolling_price_stats(vars_dict):
+    """Rolling stats of history_buy_prices, advanced by the newest price when user_cache holds the last interval's"""
+    history = vars_dict.get('history_buy_prices')
+    user_cache = vars_dict.get('user_cache')
     try:
-        if not data or len(data) < period:
-            return [0]
-        results = []
-        for i in range(len(data) - period + 1):
-            window = data[i:i + period]
-            average = sum(window) / period
-            results.append(average)
-        return results
-    except (ValueError, TypeError):
-        return [0]
+        t = int(vars_dict.get('interval_time').timestamp())
+    except (AttributeError, TypeError, ValueError, OverflowError):
+        t = None
+    stats = user_cache.get(ROLLING_KEY) if isinstance(user_cache, dict) else None
+    if isinstance(history, list) and len(history) > 1 and rolling_in_step(stats, t, safe_float(history[-2])):
+        rolling_push(stats, safe_float(history[-1]))
+    else:
+        stats = rolling_from(safe_list_float(history) or [0] * 12)
+    stats["t"] = t
+    if isinstance(user_cache, dict):
+        user_cache[ROLLING_KEY] = stats
+    return stats
 
 def calculate_avg_future_buy(buy_forecast, rrp):
     """Calculate average future buy price"""
@@ -76,12 +164,10 @@ def determine_time_of_day(current_hour, sunrise_hour):
     except (ValueError, TypeError):
         return 'daytime', 'auto', 0
 
-def is_price_spiking(sell_price, sma, avg_future_buy):
+def is_price_spiking(sell_price, sma_1hr, avg_future_buy):
     """Determine if price is spiking"""
     try:
-        if not sma:
-            return False
-        return (sell_price > sma[-1] and sell_price > (avg_future_buy * PRICE_RATIO_THRESHOLD))
+        return (sell_price > sma_1hr and sell_price > (avg_future_buy * PRICE_RATIO_THRESHOLD))
     except (ValueError, TypeError):
         return False
 
@@ -133,7 +219,7 @@ def build_reason_string(vars_dict, t_o_day, action, solar, is_spiking, decision_
             f"Grid: {grid_power/1000:.2f}kW",
             f"Battery power: {battery_power/1000:.2f}kW",
             f"Battery SOC: {battery_soc:.1f}%",
-            f"Most recent 1hr SMA: {sma_1hr[-1]:.2f}",
+            f"Most recent 1hr SMA: {sma_1hr:.2f}",
             f"Is spiking = {1 if is_spiking else 0}",
             f"Decision reason: {decision_reason}",
             f"Decision: action ({action}) solar ({solar})"
@@ -153,10 +239,8 @@ def process_battery_management(vars_dict):
     sell_price = safe_float(vars_dict.get('sell_price', 0))
     buy_price = safe_float(vars_dict.get('buy_price', 0))
     t_o_day, initial_action, soc_reserve = determine_time_of_day(current_hour, sunrise_hour)
-    history_prices = safe_list_float(vars_dict.get('history_buy_prices', []))
-    if not history_prices:
-        history_prices = [0] * 12
-    sma_1hr = calculate_sma(history_prices, 12)
+    hour_stats = rolling_window(rolling_price_stats(vars_dict), 0)
+    sma_1hr = hour_stats[0] if hour_stats else 0
     avg_future_buy = calculate_avg_future_buy(safe_list_float(vars_dict.get('buy_forecast', [])), vars_dict.get('rrp', 0))
     is_spiking = is_price_spiking(sell_price, sma_1hr, avg_future_buy)
     action, decision_reason = determine_action(battery_soc, sell_price, buy_price, avg_future_buy, t_o_day, is_spiking, current_hour, battery_capacity, soc_reserve)
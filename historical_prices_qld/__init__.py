@@ -0,0 +1 @@
+"""Historical AEMO price and demand data and the tools that process it."""
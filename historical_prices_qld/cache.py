@@ -0,0 +1,143 @@
+"""
+Memory-mapped columnar cache of the historical price and demand store.
+
+The text store written by ingest.py is converted once into one .npy file per
+column:
+
+    settlement  int64    SETTLEMENTDATE as epoch seconds (AEMO market time, UTC+10)
+    rrp         float32  RRP in $/MWh
+    demand      float32  TOTALDEMAND in MW
+    region      int8     index into REGIONS
+
+Rows are sorted by region and then settlement time. load_cache() opens the
+columns with numpy.memmap, so a load costs a few milliseconds and worker
+processes share the same pages through the OS page cache. The cache records
+the SHA-256 of every source CSV and is rebuilt automatically when a source
+file is added or changed.
+
+Run from the repository root:
+    python -m historical_prices_qld.cache
+"""
+
+import json
+import os
+import shutil
+import sys
+import time
+
+import numpy as np
+
+from historical_prices_qld.ingest import DATA_DIR, MANIFEST_PATH, REGIONS, STORE_PATH, iter_chunks, ingest, load_manifest
+from historical_prices_qld.settlement_time import MARKET_UTC_OFFSET_MINUTES, parse_settlement, to_epoch_seconds
+
+CACHE_DIR = os.path.join(DATA_DIR, "cache")
+CACHE_VERSION = 1
+
+REGION_CODES = {region: code for code, region in enumerate(REGIONS)}
+
+COLUMNS = {
+    "settlement": np.int64,
+    "rrp": np.float32,
+    "demand": np.float32,
+    "region": np.int8,
+}
+
+MARKET_UTC_OFFSET_SECONDS = MARKET_UTC_OFFSET_MINUTES * 60
+
+
+def parse_settlement_dates(values: list) -> np.ndarray:
+    """Convert 'YYYY/MM/DD HH:MM:SS' market-time strings to epoch seconds."""
+    return to_epoch_seconds(parse_settlement(values))
+
+
+def _fingerprint(manifest: dict) -> dict:
+    return {name: entry["sha256"] for name, entry in manifest["files"].items()}
+
+
+def _read_meta(cache_dir: str) -> dict:
+    try:
+        with open(os.path.join(cache_dir, "meta.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def build_cache(folder: str = DATA_DIR, cache_dir: str = None) -> dict:
+    """
+    Rebuild the columnar cache from the ingest store.
+
+    The store is brought up to date first, then streamed chunk by chunk into
+    preallocated .npy files. The new cache is written beside the old one and
+    swapped in only when complete. cache_dir defaults to cache/ inside folder.
+    """
+    cache_dir = cache_dir or os.path.join(folder, os.path.basename(CACHE_DIR))
+    store = os.path.join(folder, os.path.basename(STORE_PATH))
+    manifest_path = os.path.join(folder, os.path.basename(MANIFEST_PATH))
+    ingest(folder, store, manifest_path)
+    manifest = load_manifest(manifest_path)
+    n_rows = sum(entry["rows"] for entry in manifest["files"].values())
+
+    tmp_dir = cache_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    columns = {
+        name: np.lib.format.open_memmap(os.path.join(tmp_dir, name + ".npy"), mode="w+", dtype=dtype, shape=(n_rows,))
+        for name, dtype in COLUMNS.items()
+    }
+
+    start = 0
+    for chunk in iter_chunks(store):
+        stop = start + len(chunk)
+        regions, settlements, demands, rrps, _ = zip(*chunk)
+        columns["region"][start:stop] = [REGION_CODES[region] for region in regions]
+        columns["settlement"][start:stop] = parse_settlement_dates(settlements)
+        columns["demand"][start:stop] = np.array(demands, dtype=np.float64)
+        columns["rrp"][start:stop] = np.array(rrps, dtype=np.float64)
+        start = stop
+
+    # The store is in (month, region) file order; the cache is (region, time).
+    order = np.lexsort((columns["settlement"], columns["region"]))
+    if np.any(order != np.arange(n_rows)):
+        for column in columns.values():
+            column[:] = column[order]
+    for column in columns.values():
+        column.flush()
+    del columns
+
+    meta = {"version": CACHE_VERSION, "rows": n_rows, "sources": _fingerprint(manifest)}
+    with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+        json.dump(meta, f, indent=1, sort_keys=True)
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    os.replace(tmp_dir, cache_dir)
+    return load_cache(folder, cache_dir, rebuild=False)
+
+
+def load_cache(folder: str = DATA_DIR, cache_dir: str = None, rebuild: bool = True) -> dict:
+    """
+    Open the cached columns as read-only memory maps.
+
+    Returns a dict of column name to array. The source CSVs are checked
+    through the ingest manifest (one stat() per file when nothing changed);
+    if any was added or modified the cache is rebuilt first, unless rebuild
+    is False, in which case whatever is on disk is returned.
+    """
+    cache_dir = cache_dir or os.path.join(folder, os.path.basename(CACHE_DIR))
+    meta = _read_meta(cache_dir)
+    if rebuild:
+        manifest_path = os.path.join(folder, os.path.basename(MANIFEST_PATH))
+        ingest(folder, os.path.join(folder, os.path.basename(STORE_PATH)), manifest_path)
+        current = _fingerprint(load_manifest(manifest_path))
+        if meta.get("version") != CACHE_VERSION or meta.get("sources") != current:
+            return build_cache(folder, cache_dir)
+    return {name: np.load(os.path.join(cache_dir, name + ".npy"), mmap_mode="r") for name in COLUMNS}
+
+
+if __name__ == "__main__":
+    folder = sys.argv[1] if len(sys.argv) > 1 else DATA_DIR
+    started = time.perf_counter()
+    data = build_cache(folder)
+    built = time.perf_counter()
+    data = load_cache(folder)
+    loaded = time.perf_counter()
+    print(f"Cached {len(data['settlement'])} intervals in {built - started:.2f}s; "
+          f"load takes {(loaded - built) * 1000:.1f}ms.")
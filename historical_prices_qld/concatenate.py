@@ -1,25 +1,22 @@
-import pandas as pd
-import os
+"""
+Combine the monthly PRICE_AND_DEMAND CSVs into combined_output.csv.
 
-# Specify the folder where the CSV files are located
-folder_path = "/Users/davidbelavy/Library/CloudStorage/OneDrive-Personal/Development/powston_hacking/historical_prices_qld/"
+Kept as an entry point for the old workflow; the work is done by the
+incremental ingest in ingest.py, so only months not already in the store are
+read.
 
-# Get a list of all CSV files in the folder
-csv_files = [file for file in os.listdir(folder_path) if file.endswith('.csv')]
+Run from the repository root:
+    python -m historical_prices_qld.concatenate
+"""
 
-# Create an empty list to store DataFrames
-dataframes = []
+import os
 
-# Loop through each CSV file and read it into a DataFrame
-for csv_file in csv_files:
-    file_path = os.path.join(folder_path, csv_file)
-    df = pd.read_csv(file_path)
-    dataframes.append(df)
+from historical_prices_qld.ingest import find_sources, ingest
 
-# Concatenate all DataFrames into one
-combined_df = pd.concat(dataframes, ignore_index=True)
+# The CSV files live next to this script
+folder_path = os.path.dirname(os.path.abspath(__file__))
 
-# Save the result to a new CSV file
-combined_df.to_csv("combined_output.csv", index=False)
+added = ingest(folder_path)
 
-print(f"Successfully combined {len(csv_files)} CSV files into 'combined_output.csv'.")
\ No newline at end of file
+print(f"Successfully combined {len(find_sources(folder_path))} CSV files into 'combined_output.csv' "
+      f"({len(added)} new).")
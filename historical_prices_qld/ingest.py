@@ -0,0 +1,223 @@
+"""
+Incremental ingestion of the AEMO PRICE_AND_DEMAND monthly CSVs.
+
+Each PRICE_AND_DEMAND_YYYYMM_<REGION>.csv file is streamed in fixed-size
+chunks and appended to a single store (combined_output.csv). A manifest of
+SHA-256 hashes records which files are already in the store, so a re-run
+only reads months it has not seen before. Memory use is bounded by the chunk
+size, not by the number of months or regions.
+
+Rows are validated on the way in (see quality.py): non-TRADE rows and
+duplicate intervals are dropped, and gaps are reported in the manifest and
+optionally filled.
+
+Run from the repository root:
+    python -m historical_prices_qld.ingest [folder] [--fill=ffill|mark]
+"""
+
+import csv
+import hashlib
+import json
+import os
+import re
+import sys
+
+from historical_prices_qld.quality import IntervalValidator, format_report
+
+DATA_DIR = os.path.dirname(os.path.abspath(__file__))
+STORE_PATH = os.path.join(DATA_DIR, "combined_output.csv")
+MANIFEST_PATH = os.path.join(DATA_DIR, "ingest_manifest.json")
+
+SOURCE_PATTERN = re.compile(r"^PRICE_AND_DEMAND_(\d{6})_([A-Z]+1)\.csv$")
+REGIONS = ("QLD1", "NSW1", "VIC1", "SA1", "TAS1")
+HEADER = ["REGION", "SETTLEMENTDATE", "TOTALDEMAND", "RRP", "PERIODTYPE"]
+CHUNK_ROWS = 4096
+MANIFEST_VERSION = 2
+
+
+def region_path(path: str, region: str) -> str:
+    """
+    Per-region variant of a data file path, e.g. average_rrp_with_sd_NSW1.csv.
+
+    QLD1 keeps the original un-suffixed names this folder started with.
+    """
+    if region == "QLD1":
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}_{region}{ext}"
+
+
+def file_sha256(path: str, block_size: int = 1 << 20) -> str:
+    """Hash a file in fixed-size blocks so large files never sit in memory."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def find_sources(folder: str = DATA_DIR) -> list:
+    """Return (month, region, filename) for every monthly CSV, oldest first."""
+    sources = []
+    for name in os.listdir(folder):
+        match = SOURCE_PATTERN.match(name)
+        if match:
+            sources.append((match.group(1), match.group(2), name))
+    return sorted(sources)
+
+
+def empty_manifest(fill: str = "report") -> dict:
+    return {"version": MANIFEST_VERSION, "store_bytes": 0, "fill": fill, "files": {}}
+
+
+def load_manifest(path: str = MANIFEST_PATH) -> dict:
+    """Load the ingest manifest, or an empty one if it does not exist yet."""
+    if not os.path.exists(path):
+        return empty_manifest()
+    with open(path) as f:
+        manifest = json.load(f)
+    if manifest.get("version") != MANIFEST_VERSION:
+        return empty_manifest()
+    return manifest
+
+
+def save_manifest(manifest: dict, path: str = MANIFEST_PATH) -> None:
+    """Write the manifest atomically so an interrupted run never corrupts it."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def iter_chunks(path: str, chunk_rows: int = CHUNK_ROWS):
+    """Yield lists of at most chunk_rows data rows from one monthly CSV."""
+    with open(path, newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header != HEADER:
+            raise ValueError(f"{path}: unexpected header {header}")
+        chunk = []
+        for row in reader:
+            if not row:
+                continue
+            chunk.append(row)
+            if len(chunk) >= chunk_rows:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+def _stat_key(path: str) -> list:
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _needs_rebuild(manifest: dict, sources: list, hashes: dict, store: str, fill: str) -> bool:
+    """A rebuild is needed if a seen file changed, a new month is out of order or the fill policy changed."""
+    if manifest["files"] and manifest.get("fill") != fill:
+        return True
+    if not os.path.exists(store):
+        return bool(manifest["files"])
+    if os.path.getsize(store) < manifest["store_bytes"]:
+        return True
+    latest = {}
+    for name, entry in manifest["files"].items():
+        if name in hashes and hashes[name] != entry["sha256"]:
+            return True
+        latest[entry["region"]] = max(latest.get(entry["region"], ""), entry["month"])
+    for month, region, name in sources:
+        if name not in manifest["files"] and month < latest.get(region, ""):
+            return True
+    return False
+
+
+def ingest(folder: str = DATA_DIR, store: str = None, manifest_path: str = None,
+           chunk_rows: int = CHUNK_ROWS, fill: str = None) -> list:
+    """
+    Append every monthly CSV in folder that is not yet in the store.
+
+    Files are matched to the manifest by size and mtime first and only hashed
+    when those differ, so an up-to-date store costs one stat() per file.
+    The store and manifest default to combined_output.csv and
+    ingest_manifest.json inside folder. fill is the gap policy passed to
+    IntervalValidator ("report", "ffill" or "mark"); None keeps the policy
+    the store was built with, and a different one rebuilds it. Returns the
+    names of the files appended on this run.
+    """
+    store = store or os.path.join(folder, os.path.basename(STORE_PATH))
+    manifest_path = manifest_path or os.path.join(folder, os.path.basename(MANIFEST_PATH))
+    manifest = load_manifest(manifest_path)
+    sources = find_sources(folder)
+    fill = fill or manifest.get("fill") or "report"
+
+    hashes = {}
+    for _, _, name in sources:
+        path = os.path.join(folder, name)
+        entry = manifest["files"].get(name)
+        if entry and entry["stat"] == _stat_key(path):
+            hashes[name] = entry["sha256"]
+        else:
+            hashes[name] = file_sha256(path)
+
+    dirty = False
+    if _needs_rebuild(manifest, sources, hashes, store, fill):
+        manifest = empty_manifest(fill)
+        dirty = True
+
+    # Validation continues from the last row of each region's latest month.
+    last_rows = {}
+    for name, entry in sorted(manifest["files"].items(), key=lambda item: item[1]["month"]):
+        last_rows[entry["region"]] = entry.get("last_row") or last_rows.get(entry["region"])
+
+    # Drop anything appended after the last completed manifest write.
+    if os.path.exists(store) and manifest["store_bytes"] > 0:
+        with open(store, "r+b") as f:
+            f.truncate(manifest["store_bytes"])
+    else:
+        with open(store, "w", newline="") as f:
+            csv.writer(f).writerow(HEADER)
+        manifest["store_bytes"] = os.path.getsize(store)
+        dirty = True
+
+    added = []
+    for month, region, name in sources:
+        path = os.path.join(folder, name)
+        entry = manifest["files"].get(name)
+        if entry and entry["sha256"] == hashes[name]:
+            if entry["stat"] != _stat_key(path):
+                entry["stat"] = _stat_key(path)
+                dirty = True
+            continue
+        validator = IntervalValidator(fill, last_rows.get(region))
+        with open(store, "a", newline="") as out:
+            writer = csv.writer(out)
+            for chunk in iter_chunks(path, chunk_rows):
+                writer.writerows(validator.process(chunk))
+        last_rows[region] = validator.last_row
+        manifest["files"][name] = {
+            "month": month,
+            "region": region,
+            "rows": validator.counts["written"],
+            "sha256": hashes[name],
+            "stat": _stat_key(path),
+            "last_row": validator.last_row,
+            "quality": validator.report(),
+        }
+        manifest["store_bytes"] = os.path.getsize(store)
+        save_manifest(manifest, manifest_path)
+        added.append(name)
+
+    if dirty:
+        save_manifest(manifest, manifest_path)
+    return added
+
+
+if __name__ == "__main__":
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--fill=")]
+    fills = [arg.split("=", 1)[1] for arg in sys.argv[1:] if arg.startswith("--fill=")]
+    folder = args[0] if args else DATA_DIR
+    added = ingest(folder, fill=fills[-1] if fills else None)
+    total = len(find_sources(folder))
+    print(f"Ingested {len(added)} new file(s); {total} monthly CSV files now in '{os.path.basename(STORE_PATH)}'.")
+    print(format_report(load_manifest(os.path.join(folder, os.path.basename(MANIFEST_PATH)))))
@@ -1,33 +1,168 @@
-import pandas as pd
+"""
+Generate the historical price lookup pasted into the Powston scripts.
 
+The old output was a dict of 12 dicts of 24 dicts, which the Powston runtime
+parses and allocates on every 5-minute run. This emits flat 288-element
+tuples indexed by (month - 1) * 24 + hour, plus small accessors. Tuples of
+literals are folded into a single constant at compile time, so executing the
+block costs almost nothing.
+
+Usage (from the repository root):
+    python -m historical_prices_qld.make_dictionary            # print the block and timings
+    python -m historical_prices_qld.make_dictionary 20250406_edit.py   # also rewrite the block in a script
+
+Tables are emitted for every region with an average_rrp_with_sd table (see
+pipeline.py), with median and robust SD tables where robust_rrp_stats exists.
+The script selects its region's tables with the Powston state variable.
+"""
+
+import csv
+import os
 import pprint
+import sys
+import time
+
+from historical_prices_qld.ingest import REGIONS, region_path
+from historical_prices_qld.quantile_stats import MAD_TO_SD
+
+folder_path = os.path.dirname(os.path.abspath(__file__))
+file_path = os.path.join(folder_path, "average_rrp_with_sd.csv")
+robust_file_path = os.path.join(folder_path, "robust_rrp_stats.csv")
+
+BEGIN_MARKER = "# BEGIN HISTORICAL PRICES"
+END_MARKER = "# END HISTORICAL PRICES"
+
+
+def load_table(path: str = file_path) -> dict:
+    """Read Month,Hour,Average_RRP,SD_RRP into {(month, hour): (average, sd)}."""
+    with open(path, newline="") as f:
+        return {(int(row["Month"]), int(row["Hour"])): (float(row["Average_RRP"]), float(row["SD_RRP"]))
+                for row in csv.DictReader(f)}
+
+
+def load_robust_table(path: str = robust_file_path) -> dict:
+    """Read robust_rrp_stats.csv into {(month, hour): (median, MAD scaled to an SD)}."""
+    with open(path, newline="") as f:
+        return {(int(row["Month"]), int(row["Hour"])):
+                (float(row["Median_RRP"]), round(float(row["MAD_RRP"]) * MAD_TO_SD, 2))
+                for row in csv.DictReader(f)}
+
+
+def nested_dict_source(table: dict) -> str:
+    """The previous dict-of-dicts-of-dicts output, kept for the cost comparison."""
+    lookup_table = {}
+    for (month, hour), (average, sd) in sorted(table.items()):
+        lookup_table.setdefault(month, {})[hour] = {"Average_RRP": average, "SD_RRP": sd}
+    return "QLD_HISTORICAL_PRICES = " + pprint.pformat(lookup_table, sort_dicts=False) + "\n"
+
+
+def format_tuple(name: str, values: list, per_line: int = 12) -> str:
+    lines = [", ".join(repr(v) for v in values[i:i + per_line]) for i in range(0, len(values), per_line)]
+    return f"{name} = (\n    " + ",\n    ".join(lines) + ",\n)\n"
+
+
+def load_region_tables(folder: str = folder_path) -> dict:
+    """
+    {state: (table, robust)} for every region with an average_rrp_with_sd table.
+
+    robust is None where that region has no robust_rrp_stats table yet.
+    """
+    tables = {}
+    for region in REGIONS:
+        path = region_path(os.path.join(folder, os.path.basename(file_path)), region)
+        if os.path.exists(path):
+            robust_path = region_path(os.path.join(folder, os.path.basename(robust_file_path)), region)
+            robust = load_robust_table(robust_path) if os.path.exists(robust_path) else None
+            tables[region[:-1]] = (load_table(path), robust)
+    return tables
+
+
+def flat_table_source(tables: dict) -> str:
+    """
+    Flat 288-element tuples per state and accessors, ready to paste into a script.
+
+    tables is {state: (table, robust)} as returned by load_region_tables().
+    The block picks the site's tables once, with one dict lookup on the
+    Powston state variable, falling back to the first state listed.
+    """
+    def column(values: dict, i: int) -> list:
+        return [values[(month, hour)][i] for month in range(1, 13) for hour in range(24)]
+
+    source = (
+        f"{BEGIN_MARKER} (generated by historical_prices_qld/make_dictionary.py)\n"
+        "# Historical data from 2023-2024 - use this for rrp and for z score.\n"
+        "# Flat tables indexed by (month - 1) * 24 + hour. Median and 1.4826 * MAD\n"
+        "# are not inflated by spike intervals like SD_RRP is.\n"
+    )
+    entries = []
+    for state, (table, robust) in tables.items():
+        source += format_tuple(f"{state}_AVERAGE_RRP", column(table, 0))
+        source += format_tuple(f"{state}_SD_RRP", column(table, 1))
+        if robust:
+            source += format_tuple(f"{state}_MEDIAN_RRP", column(robust, 0))
+            source += format_tuple(f"{state}_ROBUST_SD_RRP", column(robust, 1))
+            robust_names = f"{state}_MEDIAN_RRP, {state}_ROBUST_SD_RRP"
+        else:
+            robust_names = "None, None"
+        entries.append(f"    '{state}': ({state}_AVERAGE_RRP, {state}_SD_RRP, {robust_names}),\n")
+    default_state = next(iter(tables))
+    source += (
+        "HISTORICAL_PRICES_BY_STATE = {\n" + "".join(entries) + "}\n"
+        "try:\n"
+        "    AVERAGE_RRP, SD_RRP, MEDIAN_RRP, ROBUST_SD_RRP = HISTORICAL_PRICES_BY_STATE[state]\n"
+        "except:\n"
+        f"    AVERAGE_RRP, SD_RRP, MEDIAN_RRP, ROBUST_SD_RRP = HISTORICAL_PRICES_BY_STATE['{default_state}']\n"
+        "\n\n"
+        "def historical_price(month, hour):\n"
+        "    \"\"\"Return (Average_RRP, SD_RRP) for month 1-12 and hour 0-23.\"\"\"\n"
+        "    if not (1 <= month <= 12 and 0 <= hour <= 23):\n"
+        "        raise KeyError((month, hour))\n"
+        "    i = (month - 1) * 24 + hour\n"
+        "    return AVERAGE_RRP[i], SD_RRP[i]\n"
+        "\n\n"
+        "def historical_robust_price(month, hour):\n"
+        "    \"\"\"Return (Median_RRP, robust SD) for month 1-12 and hour 0-23.\"\"\"\n"
+        "    if not (1 <= month <= 12 and 0 <= hour <= 23):\n"
+        "        raise KeyError((month, hour))\n"
+        "    i = (month - 1) * 24 + hour\n"
+        "    return MEDIAN_RRP[i], ROBUST_SD_RRP[i]\n"
+    )
+    return source + f"{END_MARKER}\n"
 
-# Specify the file path to the CSV
-file_path = "average_rrp_with_sd.csv"
 
-# Load the CSV file into a pandas DataFrame
-df = pd.read_csv(file_path)
+def measure(source: str, repeats: int = 200) -> tuple:
+    """Best-of-repeats compile (parse) and exec time in microseconds."""
+    compile_times, exec_times = [], []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        code = compile(source, "<table>", "exec")
+        compiled = time.perf_counter()
+        exec(code, {})
+        executed = time.perf_counter()
+        compile_times.append(compiled - started)
+        exec_times.append(executed - compiled)
+    return min(compile_times) * 1e6, min(exec_times) * 1e6
 
-# Display the first few rows of the DataFrame
-print(df.head())
 
+def replace_block(script_path: str, block: str, begin: str = BEGIN_MARKER, end: str = END_MARKER) -> None:
+    """Replace the text between the BEGIN/END markers in a script."""
+    with open(script_path) as f:
+        text = f.read()
+    start = text.index(begin)
+    end = text.index(end, start) + len(end) + 1
+    with open(script_path, "w") as f:
+        f.write(text[:start] + block + text[end:])
 
-# Create the nested dictionary
-lookup_table = {}
-for _, row in df.iterrows():
-    month = int(row["Month"])
-    hour = int(row["Hour"])
-    
-    if month not in lookup_table:
-        lookup_table[month] = {}
-    
-    lookup_table[month][hour] = {
-        "Average_RRP": row["Average_RRP"],
-        "SD_RRP": row["SD_RRP"]
-    }
 
+if __name__ == "__main__":
+    tables = load_region_tables()
+    block = flat_table_source(tables)
+    print(block)
 
-pprint.pp(lookup_table)
+    for label, source in (("nested dict", nested_dict_source(tables["QLD"][0])), ("flat tuples", block)):
+        parse_us, exec_us = measure(source)
+        print(f"# {label:>11}: {len(source):6d} bytes, parse {parse_us:8.1f} us, exec {exec_us:6.1f} us")
 
-# Example: Access data
-print(lookup_table[1][0])  # Output: {'Average_RRP': 98.94, 'SD_RRP': 36.99}
\ No newline at end of file
+    for script_path in sys.argv[1:]:
+        replace_block(script_path, block)
+        print(f"# Updated {script_path}")
@@ -0,0 +1,145 @@
+"""
+Single-pass month x hour RRP statistics.
+
+MonthHourStats keeps a count, mean and sum of squared deviations (M2) for
+each of the 12 x 24 buckets and updates them with Welford's method, one
+chunk at a time. Two accumulators can be merged (Chan et al.), so files can
+be folded in separate processes, and the state is saved to an .npz file with
+the list of source files it has seen. New months are folded into the saved
+state without re-reading the history.
+
+Buckets use the month and hour of SETTLEMENTDATE, as the pandas groupby this
+replaces did.
+"""
+
+import os
+
+import numpy as np
+
+from historical_prices_qld.ingest import DATA_DIR, MANIFEST_PATH, STORE_PATH, find_sources, ingest, iter_chunks, load_manifest
+from historical_prices_qld.quality import validated_chunks
+from historical_prices_qld.settlement_time import calendar_columns, parse_settlement
+
+STATE_PATH = os.path.join(DATA_DIR, "month_hour_stats.npz")
+TABLE_PATH = os.path.join(DATA_DIR, "average_rrp_with_sd.csv")
+N_BUCKETS = 12 * 24
+
+
+class MonthHourStats:
+    """Mergeable per month x hour count / mean / M2 accumulator."""
+
+    def __init__(self):
+        self.count = np.zeros(N_BUCKETS, dtype=np.int64)
+        self.mean = np.zeros(N_BUCKETS, dtype=np.float64)
+        self.m2 = np.zeros(N_BUCKETS, dtype=np.float64)
+        self.sources = {}
+
+    def update(self, month: np.ndarray, hour: np.ndarray, values: np.ndarray) -> None:
+        """Fold a chunk of observations into the buckets."""
+        bucket = (np.asarray(month, dtype=np.int64) - 1) * 24 + np.asarray(hour, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        count = np.bincount(bucket, minlength=N_BUCKETS)
+        total = np.bincount(bucket, weights=values, minlength=N_BUCKETS)
+        mean = np.divide(total, count, out=np.zeros(N_BUCKETS), where=count > 0)
+        m2 = np.bincount(bucket, weights=(values - mean[bucket]) ** 2, minlength=N_BUCKETS)
+        self._combine(count, mean, m2)
+
+    def merge(self, other: "MonthHourStats") -> "MonthHourStats":
+        """Fold another accumulator into this one and return self."""
+        self._combine(other.count, other.mean, other.m2)
+        self.sources.update(other.sources)
+        return self
+
+    def _combine(self, count: np.ndarray, mean: np.ndarray, m2: np.ndarray) -> None:
+        total = self.count + count
+        safe_total = np.maximum(total, 1)
+        delta = mean - self.mean
+        self.mean = self.mean + delta * count / safe_total
+        self.m2 = self.m2 + m2 + delta ** 2 * self.count * count / safe_total
+        self.count = total
+
+    def std(self) -> np.ndarray:
+        """Sample standard deviation per bucket (NaN where count < 2)."""
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self.count > 1, np.sqrt(self.m2 / (self.count - 1)), np.nan)
+
+    def save(self, path: str = STATE_PATH) -> None:
+        names = sorted(self.sources)
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, count=self.count, mean=self.mean, m2=self.m2,
+                 source_names=np.array(names, dtype=str),
+                 source_hashes=np.array([self.sources[name] for name in names], dtype=str))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str = STATE_PATH) -> "MonthHourStats":
+        """Load saved state, or return an empty accumulator if there is none."""
+        stats = cls()
+        if os.path.exists(path):
+            with np.load(path) as state:
+                stats.count = state["count"]
+                stats.mean = state["mean"]
+                stats.m2 = state["m2"]
+                stats.sources = dict(zip(state["source_names"].tolist(), state["source_hashes"].tolist()))
+        return stats
+
+    def write_table(self, path: str = TABLE_PATH) -> None:
+        """Write Month,Hour,Average_RRP,SD_RRP rounded to 2 decimal places."""
+        std = self.std()
+        with open(path, "w") as f:
+            f.write("Month,Hour,Average_RRP,SD_RRP\n")
+            for bucket in np.flatnonzero(self.count):
+                month, hour = divmod(int(bucket), 24)
+                f.write(f"{month + 1},{hour},{round(float(self.mean[bucket]), 2)},{round(float(std[bucket]), 2)}\n")
+
+
+def stats_for_file(path: str, stats=None, last_row: list = None):
+    """
+    Accumulate one monthly CSV, deriving month and hour from the fixed-width date.
+
+    Rows go through the same validation as the ingest, so duplicates and
+    non-TRADE rows are not counted. last_row is the previous month's last
+    row, so an interval repeated across the month boundary is counted once.
+    stats is any accumulator with update(month, hour, values); a new
+    MonthHourStats is used when it is omitted.
+    """
+    stats = MonthHourStats() if stats is None else stats
+    for chunk in validated_chunks(iter_chunks(path), last_row=last_row):
+        calendar = calendar_columns(parse_settlement([row[1] for row in chunk]))
+        stats.update(calendar["month"], calendar["hour"], np.array([row[3] for row in chunk], dtype=np.float64))
+    return stats
+
+
+def source_hashes(folder: str = DATA_DIR) -> dict:
+    """Bring the ingest store up to date and return {filename: sha256}."""
+    manifest_path = os.path.join(folder, os.path.basename(MANIFEST_PATH))
+    ingest(folder, os.path.join(folder, os.path.basename(STORE_PATH)), manifest_path)
+    return {name: entry["sha256"] for name, entry in load_manifest(manifest_path)["files"].items()}
+
+
+def fold_new_sources(stats, folder: str = DATA_DIR, region: str = "QLD1", hashes: dict = None):
+    """
+    Fold every monthly CSV for region that stats has not seen.
+
+    Works for any accumulator with update(), merge() and a sources dict. If a
+    file already folded in has since changed its contribution cannot be
+    removed, so the accumulator is rebuilt from scratch. Pass hashes from
+    source_hashes() when several regions are folded in parallel, so only one
+    process touches the ingest store.
+
+    Each file's validation continues from the previous month's last row,
+    taken from the ingest manifest, as the ingest itself does.
+    """
+    hashes = source_hashes(folder) if hashes is None else hashes
+    if any(hashes.get(name) != sha for name, sha in stats.sources.items()):
+        stats = type(stats)()
+    files = load_manifest(os.path.join(folder, os.path.basename(MANIFEST_PATH)))["files"]
+    last_row = None
+    for _, source_region, name in find_sources(folder):
+        if source_region != region:
+            continue
+        if name not in stats.sources:
+            stats.merge(stats_for_file(os.path.join(folder, name), type(stats)(), last_row))
+            stats.sources[name] = hashes[name]
+        last_row = files.get(name, {}).get("last_row") or last_row
+    return stats
@@ -0,0 +1,70 @@
+"""
+Historical statistics for every NEM region in one command.
+
+The ingest runs once in the parent process. Each region's monthly files are
+then folded into its Welford (mean/SD) and t-digest (median/MAD/percentiles)
+accumulators in a separate worker process, and the per-region tables are
+written next to the QLD ones:
+
+    average_rrp_with_sd.csv, average_rrp_with_sd_NSW1.csv, ...
+    robust_rrp_stats.csv, robust_rrp_stats_NSW1.csv, ...
+
+Finally the flat lookup block is regenerated for every region that has data,
+and rewritten into any scripts given on the command line.
+
+Run from the repository root:
+    python -m historical_prices_qld.pipeline [script.py ...]
+"""
+
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from historical_prices_qld import make_dictionary, month_hour_stats, quantile_stats
+from historical_prices_qld.ingest import DATA_DIR, find_sources, region_path
+from historical_prices_qld.month_hour_stats import MonthHourStats, fold_new_sources, source_hashes
+from historical_prices_qld.quantile_stats import MonthHourQuantiles
+
+
+def run_region(region: str, folder: str = DATA_DIR, hashes: dict = None) -> dict:
+    """Fold new months for one region into both accumulators and write its tables."""
+    hashes = source_hashes(folder) if hashes is None else hashes
+    summary = {"region": region}
+    for accumulator, module in ((MonthHourStats, month_hour_stats), (MonthHourQuantiles, quantile_stats)):
+        state_path = region_path(os.path.join(folder, os.path.basename(module.STATE_PATH)), region)
+        stats = accumulator.load(state_path)
+        seen = len(stats.sources)
+        stats = fold_new_sources(stats, folder, region, hashes)
+        stats.save(state_path)
+        stats.write_table(region_path(os.path.join(folder, os.path.basename(module.TABLE_PATH)), region))
+        summary[accumulator.__name__] = len(stats.sources) - seen
+    return summary
+
+
+def run_pipeline(folder: str = DATA_DIR, regions: list = None, workers: int = None) -> list:
+    """
+    Ingest, then build every region's tables in a process pool.
+
+    regions defaults to every region with at least one monthly CSV in folder.
+    Returns one summary dict per region.
+    """
+    hashes = source_hashes(folder)
+    if regions is None:
+        regions = sorted({region for _, region, _ in find_sources(folder)})
+    if len(regions) <= 1 or workers == 1:
+        return [run_region(region, folder, hashes) for region in regions]
+    with ProcessPoolExecutor(max_workers=workers or min(len(regions), os.cpu_count() or 1)) as pool:
+        return list(pool.map(run_region, regions, [folder] * len(regions), [hashes] * len(regions)))
+
+
+if __name__ == "__main__":
+    started = time.perf_counter()
+    for summary in run_pipeline():
+        print(f"{summary['region']}: folded {summary['MonthHourStats']} new file(s) into mean/SD, "
+              f"{summary['MonthHourQuantiles']} into quantiles.")
+    block = make_dictionary.flat_table_source(make_dictionary.load_region_tables())
+    for script_path in sys.argv[1:]:
+        make_dictionary.replace_block(script_path, block)
+        print(f"Updated {script_path}")
+    print(f"Done in {time.perf_counter() - started:.2f}s.")
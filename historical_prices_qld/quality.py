@@ -0,0 +1,157 @@
+"""
+Interval validation and normalisation for the streaming ingest.
+
+Every row that reaches the store passes through an IntervalValidator, one
+per region, so the statistics and backtests can rely on each 5-minute
+interval appearing once, in order and with PERIODTYPE TRADE:
+
+- rows whose PERIODTYPE is not TRADE are dropped and counted by type;
+- a SETTLEMENTDATE equal to one already seen is a duplicate, an earlier one
+  is out of order; both are dropped (the first occurrence wins);
+- a step of more than 5 minutes is a gap. Gaps are always reported, which
+  is all the default fill="report" does. fill="ffill" fills them by
+  repeating the previous row and fill="mark" with NaN prices and demand.
+  Filled rows carry PERIODTYPE FFILL or MISSING so they can be told apart.
+
+Checks are vectorised per chunk with np.diff over the parsed timestamps;
+only the gaps themselves are handled row by row. The validator carries the
+last row between chunks and files, so duplicates and gaps at month
+boundaries are caught too.
+
+Run from the repository root to print the report for the ingested store:
+    python -m historical_prices_qld.quality
+"""
+
+import numpy as np
+
+from historical_prices_qld.settlement_time import format_settlement, parse_settlement
+
+STEP_MINUTES = 5
+FILL_POLICIES = ("report", "ffill", "mark")
+FILLED_PERIOD_TYPES = {"ffill": "FFILL", "mark": "MISSING"}
+MAX_LISTED_GAPS = 10
+
+
+class IntervalValidator:
+    """Streaming duplicate / gap check and fill for one region's rows."""
+
+    def __init__(self, fill: str = "report", last_row: list = None):
+        if fill not in FILL_POLICIES:
+            raise ValueError(f"fill must be one of {FILL_POLICIES}, not {fill!r}")
+        self.fill = fill
+        self.last_row = last_row
+        self.last_minute = parse_settlement([last_row[1]])[0] if last_row else None
+        self.counts = {"rows": 0, "written": 0, "duplicates": 0, "out_of_order": 0,
+                       "gaps": 0, "missing_intervals": 0, "filled": 0}
+        self.non_trade = {}
+        self.gaps = []
+
+    def process(self, rows: list) -> list:
+        """Return the rows of one chunk that should be written, with gaps filled."""
+        self.counts["rows"] += len(rows)
+        period_types = np.array([row[4] for row in rows])
+        trade = period_types == "TRADE"
+        if not trade.all():
+            for period_type, count in zip(*np.unique(period_types[~trade], return_counts=True)):
+                self.non_trade[str(period_type)] = self.non_trade.get(str(period_type), 0) + int(count)
+            rows = [row for row, keep in zip(rows, trade) if keep]
+        if not rows:
+            return []
+
+        minutes = parse_settlement([row[1] for row in rows])
+        previous = np.maximum.accumulate(np.r_[self.last_minute if self.last_minute is not None else -1, minutes])[:-1]
+        new = minutes > previous
+        self.counts["duplicates"] += int(np.count_nonzero(minutes == previous))
+        self.counts["out_of_order"] += int(np.count_nonzero(minutes < previous))
+        if not new.all():
+            rows = [row for row, keep in zip(rows, new) if keep]
+            minutes = minutes[new]
+        if not rows:
+            return []
+
+        steps = np.diff(minutes, prepend=self.last_minute if self.last_minute is not None else minutes[0])
+        gap_at = np.flatnonzero(steps > STEP_MINUTES)
+        output = rows
+        if len(gap_at):
+            output = self._fill_gaps(rows, minutes, steps, gap_at)
+        self.last_row, self.last_minute = rows[-1], int(minutes[-1])
+        self.counts["written"] += len(output)
+        return output
+
+    def _fill_gaps(self, rows: list, minutes: np.ndarray, steps: np.ndarray, gap_at: np.ndarray) -> list:
+        output, start = [], 0
+        for i in gap_at:
+            missing = int(steps[i]) // STEP_MINUTES - 1
+            before = rows[i - 1] if i else self.last_row
+            self.counts["gaps"] += 1
+            self.counts["missing_intervals"] += missing
+            if len(self.gaps) < MAX_LISTED_GAPS:
+                self.gaps.append([before[1], missing])
+            output.extend(rows[start:i])
+            if self.fill in FILLED_PERIOD_TYPES:
+                output.extend(self._filler(before, int(minutes[i]) - int(steps[i]), missing))
+                self.counts["filled"] += missing
+            start = i
+        output.extend(rows[start:])
+        return output
+
+    def _filler(self, before: list, after_minute: int, missing: int) -> list:
+        period_type = FILLED_PERIOD_TYPES[self.fill]
+        rows = []
+        for k in range(1, missing + 1):
+            settlement = format_settlement(after_minute + k * STEP_MINUTES)
+            if self.fill == "ffill":
+                rows.append([before[0], settlement, before[2], before[3], period_type])
+            else:
+                rows.append([before[0], settlement, "nan", "nan", period_type])
+        return rows
+
+    def report(self) -> dict:
+        """Compact summary: counts, non-TRADE rows by type and the first gaps."""
+        report = dict(self.counts)
+        if self.non_trade:
+            report["non_trade"] = dict(self.non_trade)
+        if self.gaps:
+            report["first_gaps"] = [list(gap) for gap in self.gaps]
+        return report
+
+
+def validated_chunks(chunks, fill: str = "report", last_row: list = None):
+    """Pass an iterable of row chunks through a fresh IntervalValidator, continuing from last_row if given."""
+    validator = IntervalValidator(fill, last_row)
+    for chunk in chunks:
+        rows = validator.process(chunk)
+        if rows:
+            yield rows
+
+
+def has_issues(report: dict) -> bool:
+    return report["rows"] != report["written"] or bool(report["gaps"])
+
+
+def format_report(manifest: dict) -> str:
+    """One line per source file with a problem, then the totals."""
+    lines, totals = [], {}
+    for name in sorted(manifest["files"]):
+        report = manifest["files"][name].get("quality")
+        if not report:
+            continue
+        for key, value in report.items():
+            if isinstance(value, int):
+                totals[key] = totals.get(key, 0) + value
+        if has_issues(report):
+            details = ", ".join(f"{key} {value}" for key, value in report.items() if value and key != "rows")
+            lines.append(f"{name}: {details}")
+    if not totals:
+        return "No data-quality information; run the ingest first."
+    lines.append(f"{len(manifest['files'])} file(s), {totals['rows']} rows read, {totals['written']} written, "
+                 f"{totals['duplicates']} duplicate(s), {totals['out_of_order']} out of order, "
+                 f"{totals['gaps']} gap(s) covering {totals['missing_intervals']} interval(s), "
+                 f"{totals['filled']} filled (fill policy: {manifest['fill']}).")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    from historical_prices_qld.ingest import load_manifest
+
+    print(format_report(load_manifest()))
@@ -0,0 +1,232 @@
+"""
+Robust month x hour RRP statistics from a streaming quantile sketch.
+
+A handful of spike intervals inflate SD_RRP so much that the z-score in the
+scripts sits near zero exactly when prices spike (January 18:00 has a mean of
+891 and an SD of 2837). The median and the median absolute deviation (MAD)
+are not moved by those outliers.
+
+TDigest is a merging t-digest in NumPy: values are buffered, then sorted
+together with the existing centroids and grouped with the k1 scale function
+in a single vectorised pass. Digests merge by pooling centroids, so month
+files can be folded separately or in other processes. Until a digest holds
+more than EXACT_LIMIT values it keeps every value and its quantiles are
+exact: a month x hour bucket has about 370 intervals a year, and in spike
+buckets the top 1% are a few values thousands of $/MWh apart, so a
+centroid of two of them moves P99 by over $1,000/MWh. MonthHourQuantiles
+keeps one digest per month x hour bucket and follows the same fold/save
+pattern as MonthHourStats.
+
+Run from the repository root:
+    python -m historical_prices_qld.quantile_stats
+"""
+
+import os
+
+import numpy as np
+
+from historical_prices_qld.ingest import DATA_DIR
+from historical_prices_qld.month_hour_stats import N_BUCKETS, fold_new_sources
+
+STATE_PATH = os.path.join(DATA_DIR, "quantile_stats.npz")
+TABLE_PATH = os.path.join(DATA_DIR, "robust_rrp_stats.csv")
+COMPRESSION = 500
+QUANTILES = (0.05, 0.95, 0.99)
+EXACT_LIMIT = 20 * COMPRESSION  # values kept as they are before centroids are grouped
+
+# Scales the MAD to match the SD for normally distributed prices.
+MAD_TO_SD = 1.4826
+
+
+class TDigest:
+    """Mergeable streaming quantile sketch (merging t-digest)."""
+
+    def __init__(self, compression: float = COMPRESSION):
+        self.compression = compression
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self.min = np.inf
+        self.max = -np.inf
+        self._buffer = []
+        self._buffered = 0
+
+    @property
+    def count(self) -> float:
+        return float(self.weights.sum()) + self._buffered
+
+    @property
+    def exact(self) -> bool:
+        """True while every centroid is a single value."""
+        self._compress()
+        return not len(self.weights) or bool(self.weights.max() <= 1)
+
+    def update(self, values: np.ndarray) -> None:
+        """Add a batch of observations."""
+        values = np.asarray(values, dtype=np.float64)
+        if not len(values):
+            return
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self._buffer.append(values)
+        self._buffered += len(values)
+        if self._buffered >= 20 * self.compression:
+            self._compress()
+
+    def merge(self, other: "TDigest") -> "TDigest":
+        """Pool another digest's centroids into this one and return self."""
+        other._compress()
+        self._compress(other.means, other.weights)
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def _compress(self, extra_means: np.ndarray = None, extra_weights: np.ndarray = None) -> None:
+        means = [self.means] + self._buffer
+        weights = [self.weights] + [np.ones(len(values)) for values in self._buffer]
+        if extra_means is not None:
+            means.append(extra_means)
+            weights.append(extra_weights)
+        means = np.concatenate(means)
+        weights = np.concatenate(weights)
+        self._buffer, self._buffered = [], 0
+        if not len(means):
+            return
+        order = np.argsort(means, kind="stable")
+        means, weights = means[order], weights[order]
+        if len(means) <= EXACT_LIMIT and weights.max() <= 1:
+            self.means, self.weights = means, weights
+            return
+
+        # k1 scale: a centroid may span at most one unit of k, so centroids
+        # are small in the tails and large around the median.
+        cumulative = np.cumsum(weights)
+        q_left = (cumulative - weights) / cumulative[-1]
+        k = self.compression / (2 * np.pi) * np.arcsin(np.clip(2 * q_left - 1, -1, 1))
+        group = np.floor(k - k[0]).astype(np.int64)
+        starts = np.flatnonzero(np.r_[True, group[1:] != group[:-1]])
+        self.weights = np.add.reduceat(weights, starts)
+        self.means = np.add.reduceat(means * weights, starts) / self.weights
+
+    def _knots(self) -> tuple:
+        self._compress()
+        cumulative = np.cumsum(self.weights)
+        total = cumulative[-1]
+        q = np.r_[0.0, (cumulative - self.weights / 2) / total, 1.0]
+        x = np.r_[self.min, self.means, self.max]
+        return q, x
+
+    def quantile(self, q) -> np.ndarray:
+        """Estimated value at quantile(s) q in [0, 1]."""
+        if not self.count:
+            return np.full(np.shape(q), np.nan)
+        if self.exact:
+            return np.quantile(self.means, q)
+        knot_q, knot_x = self._knots()
+        return np.interp(q, knot_q, knot_x)
+
+    def cdf(self, x) -> np.ndarray:
+        """Estimated fraction of observations <= x."""
+        knot_q, knot_x = self._knots()
+        return np.interp(x, knot_x, knot_q)
+
+    def mad(self) -> float:
+        """Median absolute deviation, solved from the CDF by bisection."""
+        if not self.count:
+            return float("nan")
+        if self.exact:
+            return float(np.median(np.abs(self.means - np.median(self.means))))
+        knot_q, knot_x = self._knots()
+        median = float(np.interp(0.5, knot_q, knot_x))
+        low, high = 0.0, max(self.max - median, median - self.min)
+        for _ in range(50):
+            mid = (low + high) / 2
+            inside = np.interp(median + mid, knot_x, knot_q) - np.interp(median - mid, knot_x, knot_q)
+            if inside < 0.5:
+                low = mid
+            else:
+                high = mid
+        return (low + high) / 2
+
+
+class MonthHourQuantiles:
+    """One TDigest per month x hour bucket, mergeable and persistent."""
+
+    def __init__(self, compression: float = COMPRESSION):
+        self.digests = [TDigest(compression) for _ in range(N_BUCKETS)]
+        self.sources = {}
+
+    def update(self, month: np.ndarray, hour: np.ndarray, values: np.ndarray) -> None:
+        """Fold a chunk of observations into their buckets."""
+        bucket = (np.asarray(month, dtype=np.int64) - 1) * 24 + np.asarray(hour, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        order = np.argsort(bucket, kind="stable")
+        bucket, values = bucket[order], values[order]
+        starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+        for start, stop in zip(starts, np.r_[starts[1:], len(bucket)]):
+            self.digests[bucket[start]].update(values[start:stop])
+
+    def merge(self, other: "MonthHourQuantiles") -> "MonthHourQuantiles":
+        for digest, other_digest in zip(self.digests, other.digests):
+            digest.merge(other_digest)
+        self.sources.update(other.sources)
+        return self
+
+    def summary(self) -> np.ndarray:
+        """(288, 5) array of median, MAD, p5, p95 and p99 per bucket."""
+        rows = []
+        for digest in self.digests:
+            rows.append([float(digest.quantile(0.5)), digest.mad()] + list(digest.quantile(QUANTILES)))
+        return np.array(rows)
+
+    def save(self, path: str = STATE_PATH) -> None:
+        for digest in self.digests:
+            digest._compress()
+        sizes = [len(digest.means) for digest in self.digests]
+        names = sorted(self.sources)
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, sizes=np.array(sizes),
+                 means=np.concatenate([digest.means for digest in self.digests]),
+                 weights=np.concatenate([digest.weights for digest in self.digests]),
+                 mins=np.array([digest.min for digest in self.digests]),
+                 maxs=np.array([digest.max for digest in self.digests]),
+                 compression=np.array(self.digests[0].compression),
+                 source_names=np.array(names, dtype=str),
+                 source_hashes=np.array([self.sources[name] for name in names], dtype=str))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str = STATE_PATH) -> "MonthHourQuantiles":
+        """Load saved state, or return an empty accumulator if there is none."""
+        if not os.path.exists(path):
+            return cls()
+        with np.load(path) as state:
+            quantiles = cls(float(state["compression"]))
+            offsets = np.r_[0, np.cumsum(state["sizes"])]
+            for i, digest in enumerate(quantiles.digests):
+                digest.means = state["means"][offsets[i]:offsets[i + 1]]
+                digest.weights = state["weights"][offsets[i]:offsets[i + 1]]
+                digest.min = float(state["mins"][i])
+                digest.max = float(state["maxs"][i])
+            quantiles.sources = dict(zip(state["source_names"].tolist(), state["source_hashes"].tolist()))
+        return quantiles
+
+    def write_table(self, path: str = TABLE_PATH) -> None:
+        """Write Month,Hour,Median_RRP,MAD_RRP,P5_RRP,P95_RRP,P99_RRP (2 decimal places)."""
+        summary = self.summary()
+        with open(path, "w") as f:
+            f.write("Month,Hour,Median_RRP,MAD_RRP,P5_RRP,P95_RRP,P99_RRP\n")
+            for bucket, digest in enumerate(self.digests):
+                if digest.count:
+                    month, hour = divmod(bucket, 24)
+                    values = ",".join(str(round(float(v), 2)) for v in summary[bucket])
+                    f.write(f"{month + 1},{hour},{values}\n")
+
+
+if __name__ == "__main__":
+    quantiles = MonthHourQuantiles.load()
+    seen = len(quantiles.sources)
+    quantiles = fold_new_sources(quantiles)
+    quantiles.save()
+    quantiles.write_table()
+    print(f"Folded {len(quantiles.sources) - seen} new file(s). "
+          f"Updated 'historical_prices_qld/{os.path.basename(TABLE_PATH)}'.")
@@ -0,0 +1,86 @@
+"""
+Time-range queries over the historical settlement intervals.
+
+    index = HistoricalIndex()
+    window = index.between("2024-01-15 16:00", "2024-01-15 21:00")
+    window["rrp"]          # 60 intervals, a view into the memory-mapped cache
+
+The cache is sorted by region and then settlement time, so each region is a
+contiguous block and its settlement column is already a sorted int64 index.
+A query is two np.searchsorted calls and a slice: the returned columns are
+read-only views of the memory maps, nothing is copied or parsed.
+
+Times are AEMO market time (AEST). A window (start, end] holds the
+5-minute intervals that lie inside it, because SETTLEMENTDATE is the end of
+its interval: 16:00-21:00 returns the intervals ending 16:05 to 21:00.
+
+Run from the repository root:
+    python -m historical_prices_qld.query "2024-01-15 16:00" "2024-01-15 21:00" [REGION]
+"""
+
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+
+from historical_prices_qld.cache import COLUMNS, MARKET_UTC_OFFSET_SECONDS, REGION_CODES, load_cache
+from historical_prices_qld.ingest import DATA_DIR
+
+
+def to_epoch(when) -> int:
+    """
+    Epoch seconds for a market-time string, naive datetime or numpy datetime64.
+
+    Integers are taken to be epoch seconds already; aware datetimes are
+    converted from their own time zone.
+    """
+    if isinstance(when, (int, np.integer)):
+        return int(when)
+    if isinstance(when, datetime) and when.tzinfo is not None:
+        return int(when.timestamp())
+    if isinstance(when, (str, datetime)):
+        when = np.datetime64(str(when).replace("/", "-"))
+    return int(when.astype("datetime64[s]").astype(np.int64)) - MARKET_UTC_OFFSET_SECONDS
+
+
+class HistoricalIndex:
+    """Sorted settlement-time index over the cached columns, one block per region."""
+
+    def __init__(self, folder: str = DATA_DIR, data: dict = None):
+        self.data = load_cache(folder) if data is None else data
+        codes = np.arange(len(REGION_CODES) + 1)
+        bounds = np.searchsorted(self.data["region"], codes)
+        self.blocks = {region: (int(bounds[code]), int(bounds[code + 1])) for region, code in REGION_CODES.items()}
+
+    def slice(self, start, end, region: str = "QLD1") -> slice:
+        """Row slice of the intervals with start < settlement <= end."""
+        first, last = self.blocks[region]
+        settlement = self.data["settlement"][first:last]
+        lo, hi = np.searchsorted(settlement, [to_epoch(start), to_epoch(end)], side="right")
+        return slice(first + int(lo), first + int(hi))
+
+    def between(self, start, end, region: str = "QLD1", columns=("settlement", "rrp", "demand")) -> dict:
+        """Zero-copy views of columns for the intervals in (start, end]."""
+        rows = self.slice(start, end, region)
+        return {name: self.data[name][rows] for name in columns}
+
+    def at(self, when, region: str = "QLD1") -> dict:
+        """The single interval ending at when, as {column: scalar}."""
+        epoch = to_epoch(when)
+        rows = self.slice(epoch - 300, epoch, region)
+        if rows.stop - rows.start != 1 or self.data["settlement"][rows.start] != epoch:
+            raise KeyError(when)
+        return {name: self.data[name][rows.start].item() for name in COLUMNS}
+
+
+if __name__ == "__main__":
+    start, end = sys.argv[1:3]
+    region = sys.argv[3] if len(sys.argv) > 3 else "QLD1"
+    index = HistoricalIndex()
+    started = time.perf_counter()
+    window = index.between(start, end, region)
+    elapsed = time.perf_counter() - started
+    rrp = window["rrp"]
+    print(f"{region} {start} to {end}: {len(rrp)} intervals in {elapsed * 1e6:.0f} us, "
+          f"RRP mean {rrp.mean():.2f}, min {rrp.min():.2f}, max {rrp.max():.2f}")
@@ -0,0 +1,175 @@
+"""
+5-minute seasonal RRP profile keyed by month, day type and slot.
+
+The month x hour tables smear the 17:00-18:00 spike structure across the
+hour, while history_buy_prices and dispatch run every 5 minutes. This
+profile keeps 288 slots per day and separates weekdays, weekends and
+Queensland public holidays:
+
+    mean[month - 1, day_type, slot]     day_type: 0 weekday, 1 weekend, 2 public holiday
+
+The slot is the 5-minute slot of SETTLEMENTDATE (minute of day // 5), so
+slot 210 is the interval ending 17:30, matching how the hourly tables
+bucket by SETTLEMENTDATE. Every interval is binned in one np.bincount pass
+over the memory-mapped cache. A month has at most a few public holidays,
+so holiday buckets with fewer than MIN_HOLIDAY_COUNT intervals (months with
+none) fall back to that month's weekend profile, which holidays resemble.
+
+Run from the repository root:
+    python -m historical_prices_qld.seasonal_profile [script.py ...]
+"""
+
+import os
+import sys
+from datetime import date
+
+import numpy as np
+
+from historical_prices_qld.cache import REGION_CODES, load_cache
+from historical_prices_qld.ingest import DATA_DIR, region_path
+from historical_prices_qld.make_dictionary import format_tuple, measure, replace_block
+from historical_prices_qld.settlement_time import calendar_columns, from_epoch_seconds
+
+PROFILE_PATH = os.path.join(DATA_DIR, "seasonal_profile.npz")
+DAY_TYPES = ("weekday", "weekend", "holiday")
+WEEKDAY, WEEKEND, HOLIDAY = range(len(DAY_TYPES))
+SLOTS = 288
+MIN_HOLIDAY_COUNT = 2
+SLOT_WIDTH = 6
+
+BEGIN_MARKER = "# BEGIN SEASONAL PROFILE"
+END_MARKER = "# END SEASONAL PROFILE"
+
+# Queensland state-wide public holidays (regional show days excluded).
+QLD_PUBLIC_HOLIDAYS = (
+    "2023-01-01", "2023-01-02", "2023-01-26", "2023-04-07", "2023-04-08", "2023-04-09",
+    "2023-04-10", "2023-04-25", "2023-05-01", "2023-10-02", "2023-12-25", "2023-12-26",
+    "2024-01-01", "2024-01-26", "2024-03-29", "2024-03-30", "2024-03-31", "2024-04-01",
+    "2024-04-25", "2024-05-06", "2024-10-07", "2024-12-25", "2024-12-26",
+    "2025-01-01", "2025-01-27", "2025-04-18", "2025-04-19", "2025-04-20", "2025-04-21",
+    "2025-04-25", "2025-05-05", "2025-10-06", "2025-12-25", "2025-12-26",
+)
+PUBLIC_HOLIDAYS = {"QLD1": QLD_PUBLIC_HOLIDAYS}
+
+
+def day_type(day: date, holidays=QLD_PUBLIC_HOLIDAYS) -> int:
+    """WEEKDAY, WEEKEND or HOLIDAY for a single date."""
+    if day.isoformat() in holidays:
+        return HOLIDAY
+    return WEEKEND if day.weekday() >= 5 else WEEKDAY
+
+
+def bucket_columns(settlement: np.ndarray, holidays=QLD_PUBLIC_HOLIDAYS) -> tuple:
+    """Month (1-12), day type and slot arrays for epoch-second settlement times."""
+    minutes = from_epoch_seconds(settlement)
+    calendar = calendar_columns(minutes)
+    types = np.where(calendar["weekday"] >= 5, WEEKEND, WEEKDAY)
+    holiday_days = np.array(holidays, dtype="datetime64[D]").astype(np.int64)
+    types[np.isin(minutes // 1440, holiday_days)] = HOLIDAY
+    return calendar["month"], types, calendar["slot"]
+
+
+class SeasonalProfile:
+    """Mean, SD and count per (month, day type, 5-minute slot)."""
+
+    def __init__(self, count: np.ndarray, mean: np.ndarray, sd: np.ndarray):
+        self.count = count
+        self.mean = mean
+        self.sd = sd
+
+    @classmethod
+    def build(cls, settlement: np.ndarray, rrp: np.ndarray, holidays=QLD_PUBLIC_HOLIDAYS) -> "SeasonalProfile":
+        """Bin every interval in one pass and fill sparse holiday buckets from weekends."""
+        month, types, slot = bucket_columns(settlement, holidays)
+        bucket = ((month - 1) * len(DAY_TYPES) + types) * SLOTS + slot
+        rrp = np.asarray(rrp, dtype=np.float64)
+        size = 12 * len(DAY_TYPES) * SLOTS
+        count = np.bincount(bucket, minlength=size)
+        total = np.bincount(bucket, weights=rrp, minlength=size)
+        mean = np.divide(total, count, out=np.full(size, np.nan), where=count > 0)
+        # Second pass around the bucket mean keeps the variance numerically stable.
+        m2 = np.bincount(bucket, weights=(rrp - np.nan_to_num(mean)[bucket]) ** 2, minlength=size)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            sd = np.where(count > 1, np.sqrt(m2 / (count - 1)), np.nan)
+
+        shape = (12, len(DAY_TYPES), SLOTS)
+        count, mean, sd = count.reshape(shape), mean.reshape(shape), sd.reshape(shape)
+        sparse = count[:, HOLIDAY] < MIN_HOLIDAY_COUNT
+        mean[:, HOLIDAY][sparse] = mean[:, WEEKEND][sparse]
+        sd[:, HOLIDAY][sparse] = sd[:, WEEKEND][sparse]
+        return cls(count, mean.astype(np.float32), sd.astype(np.float32))
+
+    @classmethod
+    def from_cache(cls, folder: str = DATA_DIR, region: str = "QLD1") -> "SeasonalProfile":
+        """Build the profile for one region from the memory-mapped cache."""
+        data = load_cache(folder)
+        code = REGION_CODES[region]
+        start, stop = np.searchsorted(data["region"], [code, code + 1])
+        return cls.build(data["settlement"][start:stop], data["rrp"][start:stop],
+                         PUBLIC_HOLIDAYS.get(region, ()))
+
+    def price(self, month: int, day_type: int, slot: int) -> tuple:
+        """(mean, SD) for month 1-12, a day type and slot 0-287."""
+        return float(self.mean[month - 1, day_type, slot]), float(self.sd[month - 1, day_type, slot])
+
+    def save(self, path: str = PROFILE_PATH) -> None:
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, count=self.count, mean=self.mean, sd=self.sd)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str = PROFILE_PATH) -> "SeasonalProfile":
+        with np.load(path) as state:
+            return cls(state["count"], state["mean"], state["sd"])
+
+
+def profile_source(profile: SeasonalProfile, holidays=QLD_PUBLIC_HOLIDAYS) -> str:
+    """
+    The profile means plus an accessor, ready to paste into a script.
+
+    A 10,368-element tuple of numbers takes ~18 ms to parse on every run, so
+    the means are rounded to whole $/MWh and packed into one string of
+    SLOT_WIDTH-character fields. A string literal parses in well under a
+    millisecond and each lookup is a single slice and int().
+    """
+    values = np.rint(np.nan_to_num(profile.mean)).astype(np.int64).ravel()
+    per_line = 48
+    lines = ['    "' + "".join(f"{v:{SLOT_WIDTH}d}" for v in values[i:i + per_line]) + '"'
+             for i in range(0, len(values), per_line)]
+    return (
+        f"{BEGIN_MARKER} (generated by historical_prices_qld/seasonal_profile.py)\n"
+        "# Mean RRP per (month, day type, 5-minute slot of SETTLEMENTDATE), 2023-2024,\n"
+        f"# as {SLOT_WIDTH}-character fields. Day type 0 weekday, 1 weekend, 2 public holiday.\n"
+        + format_tuple("SEASONAL_PUBLIC_HOLIDAYS", list(holidays), per_line=6)
+        + "SEASONAL_RRP = (\n" + "\n".join(lines) + "\n)\n"
+        "\n\n"
+        "def seasonal_price(when):\n"
+        "    \"\"\"Profile mean RRP for the 5-minute interval ending at datetime when.\"\"\"\n"
+        "    if when.strftime('%Y-%m-%d') in SEASONAL_PUBLIC_HOLIDAYS:\n"
+        "        kind = 2\n"
+        "    elif when.weekday() >= 5:\n"
+        "        kind = 1\n"
+        "    else:\n"
+        "        kind = 0\n"
+        "    i = (((when.month - 1) * 3 + kind) * 288 + (when.hour * 60 + when.minute) // 5) * "
+        f"{SLOT_WIDTH}\n"
+        f"    return int(SEASONAL_RRP[i:i + {SLOT_WIDTH}])\n"
+        f"{END_MARKER}\n"
+    )
+
+
+if __name__ == "__main__":
+    region = "QLD1"
+    profile = SeasonalProfile.from_cache(region=region)
+    profile.save(region_path(PROFILE_PATH, region))
+    block = profile_source(profile)
+    parse_us, exec_us = measure(block, repeats=20)
+    print(f"Profile of {int(profile.count.sum())} intervals; script block {len(block)} bytes, "
+          f"parse {parse_us:.0f} us, exec {exec_us:.1f} us.")
+    for name, kind in zip(DAY_TYPES, range(len(DAY_TYPES))):
+        peak = int(np.nanargmax(profile.mean[0, kind]))
+        print(f"January {name:>7}: peak slot {peak} ({peak * 5 // 60:02d}:{peak * 5 % 60:02d}) "
+              f"mean {profile.mean[0, kind, peak]:.2f}")
+    for script_path in sys.argv[1:]:
+        replace_block(script_path, block, BEGIN_MARKER, END_MARKER)
+        print(f"Updated {script_path}")
@@ -0,0 +1,530 @@
+import itertools
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from backtest import battery as battery_model
+from backtest.battery import Battery
+from backtest.benchmark import historical_fixtures, measure, regressions
+from backtest.cicd import mismatches, parse_annotations, validate
+from backtest.incremental import IncrementalReplay
+from backtest.optimiser import CMAES, Parameter, Study, apply_values, read_hour_table
+from backtest.planner import Planner, dispatch_action
+from backtest.replay import ReplayResult, build_inputs, interval_values, replay, tariff
+from backtest.runner import ScriptRunner, base_globals, compile_script
+from backtest.scenarios import DayLibrary, bill_distribution, noisy_forecasts, scenario_inputs
+from backtest.tuning import apply_tunables, extract_tunables, grid_configs, sweep
+from backtest.vector_rules import VectorLadder, literal_constants, random_inputs
+from historical_prices_qld.query import HistoricalIndex, to_epoch
+
+HOURS = battery_model.INTERVAL_HOURS
+
+
+def write_days(folder, days=2, rrp=None):
+    """Write a QLD1 file for January 2024 with one row per 5 minutes."""
+    rrp = rrp if rrp is not None else lambda i: 50.0 + (i % 288) / 2
+    path = os.path.join(folder, "PRICE_AND_DEMAND_202401_QLD1.csv")
+    start = np.datetime64("2024-01-01T00:05")
+    with open(path, "w", newline="") as f:
+        f.write("REGION,SETTLEMENTDATE,TOTALDEMAND,RRP,PERIODTYPE\r\n")
+        for i in range(days * 288):
+            settlement = (start + np.timedelta64(5 * i, "m")).astype(str).replace("-", "/").replace("T", " ")
+            f.write(f"QLD1,{settlement}:00,6000.0,{rrp(i)},TRADE\r\n")
+    return path
+
+
+class TestScriptRunner(unittest.TestCase):
+
+    def test_code_cached_by_content_and_namespace_reset(self):
+        folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder)
+        path = os.path.join(folder, "script.py")
+        with open(path, "w") as f:
+            f.write("if rrp > 100:\n    leftover = True\naction = 'export' if 'leftover' in globals() else 'auto'\n")
+        runner = ScriptRunner(path)
+        self.assertIs(compile_script(path)[1], runner.code)
+        with open(path) as f:
+            self.assertEqual(ScriptRunner(source=f.read()).digest, runner.digest)
+
+        self.assertEqual(runner.run({"rrp": 150.0})["action"], "export")
+        namespace = runner.run({"rrp": 50.0})
+        self.assertEqual(namespace["action"], "auto")
+        self.assertEqual(namespace["battery_capacity"], 25600)
+
+        with open(path, "w") as f:
+            f.write("action = 'stopped'\n")
+        os.utime(path, ns=(0, 1))
+        self.assertEqual(ScriptRunner(path).run()["action"], "stopped")
+
+    def test_mutable_snapshot_values_fresh_every_run(self):
+        runner = ScriptRunner(source="user_cache['runs'] = user_cache.get('runs', 0) + 1\n"
+                                     "history_buy_prices.append(0.0)\n")
+        for _ in range(2):
+            namespace = runner.run()
+            self.assertEqual(namespace["user_cache"], {"runs": 1})
+            self.assertEqual(len(namespace["history_buy_prices"]), 169)
+        self.assertEqual(runner.base["user_cache"], {})
+        user_cache = {}
+        runner.run({"user_cache": user_cache})
+        runner.run({"user_cache": user_cache})
+        self.assertEqual(user_cache, {"runs": 2})
+
+
+class TestBatteryStep(unittest.TestCase):
+
+    def setUp(self):
+        self.battery = Battery(battery_capacity=10000.0, max_charge_rate_kW=5.0, round_trip_efficiency=0.81,
+                               feed_in_power_limitation=3000.0)
+
+    def test_auto_charges_surplus_and_exports_the_rest(self):
+        soc, imported, exported = battery_model.step(5000.0, "auto", "maximize", 8.0, 1.0, self.battery)
+        self.assertAlmostEqual(soc, 5000.0 + 5.0 * 0.9 * HOURS * 1000)
+        self.assertEqual(imported, 0.0)
+        self.assertAlmostEqual(exported, 2.0 * HOURS)
+
+    def test_export_is_capped_by_feed_in_limit(self):
+        soc, imported, exported = battery_model.step(5000.0, "export", "maximize", 0.0, 1.0, self.battery)
+        self.assertAlmostEqual(exported, 3.0 * HOURS)
+        self.assertAlmostEqual(soc, 5000.0 - 4.0 / 0.9 * HOURS * 1000)
+
+    def test_limits_and_modes(self):
+        soc, imported, exported = battery_model.step(9990.0, "import", "maximize", 0.0, 1.0, self.battery)
+        self.assertAlmostEqual(soc, 10000.0)
+        self.assertAlmostEqual(imported, 1.0 * HOURS + 10.0 / 0.9 / 1000)
+        soc, imported, exported = battery_model.step(5000.0, "charge", "maximize", 0.0, 2.0, self.battery)
+        self.assertEqual((soc, imported), (5000.0, 2.0 * HOURS))
+        soc, imported, exported = battery_model.step(5000.0, "stopped", "curtail", 6.0, 2.0, self.battery)
+        self.assertEqual((soc, imported, exported), (5000.0, 0.0, 0.0))
+
+
+class TestSimulate(unittest.TestCase):
+
+    def test_matches_step_loop(self):
+        battery = Battery(battery_capacity=5000.0, max_charge_rate_kW=4.0, round_trip_efficiency=0.85,
+                          feed_in_power_limitation=2500.0)
+        rng = np.random.default_rng(1)
+        n = 3 * 288
+        actions = rng.choice(list(battery_model.ACTIONS) + ["bogus"], n)
+        solar = rng.choice(battery_model.SOLAR_MODES, n)
+        pv, load = 6 * rng.random(n), 3 * rng.random(n)
+        pv[288:576] = 0.0  # a dark day, so the battery also runs empty
+        buy, sell = 30 * rng.random(n), 10 * rng.random(n)
+        result = battery_model.simulate(actions, solar, buy, sell, load, pv, battery, initial_soc=20.0)
+
+        soc_wh = 1000.0
+        soc, imported, exported = np.zeros(n), np.zeros(n), np.zeros(n)
+        for i in range(n):
+            soc_wh, imported[i], exported[i] = battery_model.step(soc_wh, actions[i], solar[i], pv[i], load[i],
+                                                                  battery)
+            soc[i] = soc_wh
+        np.testing.assert_allclose(result["soc_wh"], soc, atol=1e-6)
+        np.testing.assert_allclose(result["imported"], imported, atol=1e-9)
+        np.testing.assert_allclose(result["exported"], exported, atol=1e-9)
+        self.assertAlmostEqual(result["bill"], float(np.sum(imported * buy - exported * sell) / 100))
+        self.assertTrue(np.any(soc < 1e-6) and np.any(soc > 5000.0 - 1e-6))
+
+
+class TestReplay(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder)
+        write_days(self.folder)
+        self.script = os.path.join(self.folder, "script.py")
+        with open(self.script, "w") as f:
+            f.write(
+                "if len(history_buy_prices) != 168 or len(buy_forecast) != 16 or sunrise.hour != 4:\n"
+                "    raise ValueError('bad inputs')\n"
+                "action = 'import' if rrp < 100 else 'export'\n"
+                "solar = 'maximize'\n"
+                "print('silenced')\n"
+            )
+
+    def test_script_drives_battery_and_bill(self):
+        index = HistoricalIndex(self.folder)
+        result = replay(self.script, "2024-01-01 12:00", "2024-01-02 12:00", index=index, initial_soc=50.0)
+        self.assertEqual(result.errors, 0)
+        self.assertEqual(len(result.cost), 288)
+        rrp = np.asarray(index.between("2024-01-01 12:00", "2024-01-02 12:00")["rrp"], dtype=np.float64)
+        np.testing.assert_array_equal(result.actions, np.where(rrp < 100, 3, 4))
+        buy, sell = tariff(rrp)
+        self.assertAlmostEqual(result.bill, float(np.sum(result.imported * buy - result.exported * sell) / 100))
+        self.assertAlmostEqual(sum(result.monthly_bills().values()), result.bill)
+        self.assertTrue(np.all((result.soc >= 0) & (result.soc <= 100)))
+
+    def test_monthly_bills_count_the_midnight_interval_in_the_month_it_ends(self):
+        def bills(settlements, buy):
+            n = len(buy)
+            minutes = np.array(settlements, dtype="datetime64[m]").astype(np.int64)
+            inputs = {"settlement": np.zeros(n), "minutes": minutes, "buy": np.array(buy), "sell": np.zeros(n)}
+            return ReplayResult(inputs, np.zeros(n, dtype=np.int64), np.zeros(n, dtype=np.int64), np.zeros(n),
+                                np.ones(n), np.zeros(n), 0, 0.0).monthly_bills()
+
+        # A window ending at midnight on the 1st has no row for the next month.
+        self.assertEqual(bills(["2024-01-31T23:55", "2024-02-01T00:00"], [10.0, 30.0]), {"2024-01": 0.4})
+        self.assertEqual(bills(["2024-02-01T00:00", "2024-02-01T00:05"], [10.0, 50.0]),
+                         {"2024-01": 0.1, "2024-02": 0.5})
+
+
+class TestBenchmark(unittest.TestCase):
+
+    def test_fixtures_figures_and_regressions(self):
+        folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder)
+        write_days(folder, days=16)
+        # Only January is on disk: the four fixture hours of the 15th.
+        fixtures = historical_fixtures(HistoricalIndex(folder), length=4)
+        self.assertEqual([values["interval_time"].strftime("%H:%M") for values in fixtures[0]],
+                         ["02:45", "02:50", "02:55", "03:00"])
+        self.assertEqual([intervals[-1]["interval_time"].hour for intervals in fixtures], [3, 9, 13, 18])
+        script = os.path.join(folder, "script.py")
+        with open(script, "w") as f:
+            f.write("action = 'export' if rrp > 100 else 'auto'\nreason = 'x' * int(battery_soc)\n")
+
+        figures = measure(script, fixtures, repeats=3)
+        self.assertEqual(figures["fixtures"], 5)
+        self.assertEqual(figures["errors"], 0)
+        self.assertEqual(figures["reason_chars"], max(int(intervals[0]["battery_soc"])
+                                                           for intervals in [[base_globals()]] + fixtures))
+        self.assertLessEqual(figures["p50_us"], figures["p95_us"])
+        self.assertLessEqual(figures["p95_us"], figures["p99_us"])
+
+        # The tail and compile time are too noisy to gate on.
+        baseline = {"script.py": dict(figures, p95_us=figures["p95_us"] / 2, p99_us=figures["p99_us"] / 10,
+                                      compile_ms=figures["compile_ms"] / 10, errors=0)}
+        worse = {"script.py": dict(figures, errors=1), "new.py": figures}
+        self.assertEqual([line.split(":")[1].split()[0] for line in regressions(worse, baseline)], ["p95_us", "errors"])
+        self.assertEqual(regressions({"script.py": figures}, {"script.py": figures}), [])
+        # Timings are not compared with a baseline taken over fixtures of another length.
+        baseline["script.py"]["repeats"] = 20
+        self.assertEqual(regressions({"script.py": figures}, baseline), [])
+
+
+class TestRollingPrices(unittest.TestCase):
+
+    def test_scripts_update_rolling_stats_one_price_at_a_time(self):
+        folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder)
+        write_days(folder, rrp=lambda i: 40.0 + (i * 37) % 101)
+        inputs = build_inputs(HistoricalIndex(folder), "2024-01-01 12:00", "2024-01-02 12:00")
+        for script in ("20250406_edit.py", "david_script.py"):
+            runner, user_cache = ScriptRunner(script), {}
+            # A skipped interval (a gap) forces a rebuild from the full list.
+            for i in [*range(40), *range(41, 60)]:
+                values = interval_values(inputs, i, 50.0, user_cache)
+                namespace = runner.run(values)
+                stats = user_cache["rolling_prices_v1"]
+                history = np.array(values["history_buy_prices"])
+                for k, window in enumerate((12, 24, 48)):
+                    mean, sd, low, high = namespace["rolling_window"](stats, k)
+                    self.assertAlmostEqual(mean, history[-window:].mean())
+                    self.assertAlmostEqual(sd, history[-window:].std())
+                    self.assertEqual((low, high), (history[-window:].min(), history[-window:].max()))
+            # Rebuilt with 48 prices after the gap, then one price per interval.
+            self.assertEqual(stats["n"], 48 + 18, script)
+
+
+class TestForecastFeatures(unittest.TestCase):
+
+    def test_one_pass_features_match_list_scans(self):
+        for script in ("david_edit_of_script.py", "20250307_refactor_script.py"):
+            user_cache = {}
+            namespace = ScriptRunner(script).run({"user_cache": user_cache})
+            features = namespace["features"]
+            buy, sell = namespace["discounted_buy_forecast"], namespace["discounted_sell_forecast"]
+            d = namespace["uncertainty_discount"]
+            self.assertEqual(buy, [price * (1 + d) ** i for i, price in enumerate(namespace["buy_forecast"][:8])])
+            self.assertEqual(sell, [price * (1 - d) ** i for i, price in enumerate(namespace["sell_forecast"][:8])])
+            self.assertEqual(user_cache["discount_powers_v1"]["key"], [d, 8])
+
+        forecast_features = namespace["forecast_features"]
+        buy = [30.0, 20.0, 25.0, 12.0, 9.0, 8.0]
+        sell = [40.0, 10.0, 60.0, 12.0, 70.0, 5.0]
+        features = forecast_features(buy, sell, 6)
+        dbuy, dsell = features["buy"], features["sell"]
+        self.assertEqual((features["buy_min"], features["buy_argmin"]), (min(dbuy), dbuy.index(min(dbuy))))
+        self.assertEqual((features["sell_max"], features["sell_argmax"]), (max(dsell), dsell.index(max(dsell))))
+        self.assertEqual(features["sell_suffix_max"], [max(dsell[i:]) for i in range(6)])
+        # A non-positive price anywhere falls back to flat forecasts.
+        fallback = forecast_features(buy, sell[:5] + [0.0], 6)
+        self.assertEqual((fallback["buy"], fallback["sell"]), ([100000] * 6, [1] * 6))
+
+    def test_round_trips_match_exhaustive_search(self):
+        namespace = ScriptRunner("david_edit_of_script.py").run({"user_cache": {}})
+        rng = np.random.default_rng(3)
+        for _ in range(200):
+            n = int(rng.integers(0, 8))
+            buy, sell = rng.integers(1, 20, n).astype(float).tolist(), rng.integers(1, 20, n).astype(float).tolist()
+            features = {"buy": buy, "sell": sell, "sell_suffix_max": [max(sell[i:]) for i in range(n)]}
+            pairs = [(i, j) for i in range(n) for j in range(i + 1, n)]
+
+            best = namespace["best_round_trip"](features)
+            margins = [sell[j] - buy[i] for i, j in pairs]
+            if not margins or max(margins) <= 0:
+                self.assertIsNone(best)
+            else:
+                self.assertEqual(best[2], max(margins))
+                self.assertEqual(best[2], sell[best[1]] - buy[best[0]])
+
+            def exhaustive(start, left):
+                options = [sell[j] - buy[i] + exhaustive(j + 1, left - 1) for i, j in pairs if i >= start] if left else []
+                return max([0.0] + options)
+
+            # With one step's worth of headroom a trip is one buy step and one sell step.
+            for k in (1, 2, 3):
+                trips = namespace["round_trips"](features, k, 1.0, 1.0)
+                self.assertLessEqual(len(trips), k)
+                self.assertTrue(all(len(buys) == len(sells) == 1 for buys, sells, _ in trips))
+                self.assertTrue(all(a[1][0] < b[0][0] for a, b in zip(trips, trips[1:])))
+                self.assertEqual(sum(value for _, _, value in trips), exhaustive(0, k))
+
+            # 2.5 kWh of headroom, 1 kWh a step: every buy/hold/sell sequence within the limits.
+            held = [0.0, 1.0, 2.0, 2.5]
+            best = {2: 0.0, 3: 0.0}
+            for moves in itertools.product((1, 0, -1), repeat=min(n, 6)):
+                level, started, charging, value = 0, 0, False, 0.0
+                for t, move in enumerate(moves):
+                    if move > 0 and level < 3:
+                        started += not charging
+                        value -= buy[t] * (held[level + 1] - held[level])
+                        level, charging = level + 1, True
+                    elif move < 0 and level > 0:
+                        value += sell[t] * (held[level] - held[level - 1])
+                        level, charging = level - 1, False
+                    elif move:
+                        break
+                else:
+                    for k in best:
+                        if started <= k:
+                            best[k] = max(best[k], value)
+            for k, expected in best.items():
+                trips = namespace["round_trips"]({"buy": buy[:6], "sell": sell[:6]}, k, 2.5, 1.0)
+                self.assertLessEqual(len(trips), k)
+                self.assertAlmostEqual(sum(value for _, _, value in trips), expected)
+
+
+class TestPlanner(unittest.TestCase):
+
+    def test_plan_matches_exhaustive_search_and_reuses_value_function(self):
+        # 1 kWh grid steps; half an hour at 4 kW stores 1 step or delivers 2.
+        battery = Battery(battery_capacity=4000.0, max_charge_rate_kW=4.0, round_trip_efficiency=0.81,
+                          feed_in_power_limitation=3000.0)
+        planner = Planner(battery, soc_steps=5)
+        self.assertEqual(planner.moves.tolist(), [-2, -1, 0, 1])
+        rng = np.random.default_rng(5)
+        for _ in range(20):
+            buy, sell = rng.uniform(-5, 60, 5), rng.uniform(-5, 40, 5)
+            pv, load = rng.uniform(0, 4, 5), rng.uniform(0, 3, 5)
+            start = int(rng.integers(0, 5))
+            best = np.inf
+            for moves in itertools.product((-2, -1, 0, 1), repeat=5):
+                soc, cost = start, 0.0
+                for t, move in enumerate(moves):
+                    if not 0 <= soc + move <= 4 or (move < 0 and soc + move < 1):
+                        break
+                    soc += move
+                    grid = (load[t] - pv[t]) / 2 + (move / 0.9 if move > 0 else move * 0.9)
+                    cost += max(grid, 0) * buy[t] - min(max(-grid, 0), 1.5) * sell[t]
+                else:
+                    best = min(best, cost - 7.0 * soc * 0.9)
+
+            plan = planner.plan(buy, sell, start * 25, pv, load, reserve_soc=25.0, terminal_price=7.0)
+            self.assertFalse(plan.cached)
+            self.assertAlmostEqual(plan.cost * 100 - 7.0 * plan.soc[-1] / 25 * 0.9, best)
+            self.assertEqual(len(plan.actions), 5)
+            self.assertEqual(plan.action, plan.actions[0])
+            self.assertTrue(all(soc >= 25.0 or later >= soc for soc, later in zip(plan.soc, plan.soc[1:])))
+            again = planner.plan(buy, sell, start * 25, pv, load, reserve_soc=25.0, terminal_price=7.0)
+            self.assertTrue(again.cached)
+            self.assertEqual(again.actions, plan.actions)
+
+        self.assertEqual(dispatch_action(2.0, -1.0), "import")
+        self.assertEqual(dispatch_action(1.0, -1.0), "charge")
+        self.assertEqual(dispatch_action(-2.0, 1.0), "export")
+        self.assertEqual(dispatch_action(-1.0, 1.0), "discharge")
+        self.assertEqual(dispatch_action(0.0, 1.0), "stopped")
+
+
+class TestCICD(unittest.TestCase):
+
+    def test_annotations_checked_at_their_intervals(self):
+        folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder)
+        write_days(folder, rrp=lambda i: 200.0 if i % 288 in range(200, 220) else 50.0)
+        source = ("# CICD: '2024-01-01 16:42:00+10', 'export'\n"
+                  "# CICD: '2024-01-01 06:50:00+09:00', 'export'\n"
+                  "# CICD: '2024-01-02 01:00:00', 'auto'\n"
+                  "# CICD: '2030-01-01 00:00:00+10', 'auto'\n"
+                  "action = 'export' if rrp > 150 else 'auto'\n")
+        annotations = parse_annotations(source)
+        self.assertEqual([annotation.line for annotation in annotations], [1, 2, 3, 4])
+        # 16:42 AEST is in the interval ending 16:45, the 201st of the day.
+        self.assertEqual(annotations[0].settlement, to_epoch("2024-01-01 16:45"))
+        # No offset means AEST, whatever the machine's timezone.
+        self.assertEqual(annotations[2].settlement, to_epoch("2024-01-02 01:00"))
+
+        results = validate(os.path.join(folder, "script.py"), source=source, index=HistoricalIndex(folder))
+        self.assertEqual([result["ok"] for result in results], [True, False, True, False])
+        self.assertEqual([result["line"] for result in mismatches(results)], [2, 4])
+        self.assertEqual(results[1]["action"], "auto")
+
+
+class TestIncrementalReplay(unittest.TestCase):
+
+    def test_rerun_matches_full_replay_and_skips_unchanged_days(self):
+        folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder)
+        write_days(folder, days=4, rrp=lambda i: 200.0 if 488 <= i < 500 else 30.0 + (i % 288) / 4)
+        source = ("sell_above = 150.0\nbuy_below = 10.0\nlow_soc = 20\n"
+                  "user_cache['runs'] = user_cache.get('runs', 0) + 1\n"
+                  "spare = battery_soc > low_soc\n"
+                  "if buy_price < buy_below and battery_soc < 100:\n    action = 'import'\n"
+                  "elif rrp > sell_above and spare:\n    action = 'export'\n"
+                  "else:\n    action = 'auto'\n"
+                  "solar = 'maximize'\n")
+        script = os.path.join(folder, "script.py")
+        inputs = build_inputs(HistoricalIndex(folder), "2024-01-01 00:00", "2024-01-04 00:00")
+        recording = IncrementalReplay(script, inputs, source=source)
+
+        for values, most in (({"sell_above": 250.0}, 576), ({"sell_above": 180.0}, 0), ({"low_soc": 90}, 864)):
+            result, simulated = recording.rerun(values)
+            full = replay(script, None, None, source=apply_tunables(source, values), inputs=inputs)
+            np.testing.assert_array_equal(result.soc, full.soc)
+            np.testing.assert_array_equal(result.actions, full.actions)
+            self.assertEqual((result.bill, result.errors), (full.bill, full.errors))
+            self.assertEqual(simulated, most)
+
+
+class TestScenarios(unittest.TestCase):
+
+    def test_block_bootstrap_and_noisy_forecasts(self):
+        folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder)
+        write_days(folder, days=10, rrp=lambda i: float(i // 288))
+        library = DayLibrary.from_index(HistoricalIndex(folder))
+        self.assertEqual(library.rrp.shape, (10, 288))
+
+        rows = library.sample(500, start="2024-01-01", days=9, block_days=3, seed=2)
+        self.assertEqual(rows.shape, (500, 9))
+        blocks = rows.reshape(500, 3, 3)
+        np.testing.assert_array_equal(np.diff(blocks, axis=2), 1)
+        self.assertEqual(set(np.unique(blocks[:, :, 0])), set(range(8)))
+        with self.assertRaises(ValueError):
+            library.sample(1, start="2024-02-01", days=3)
+
+        forecast = np.full((20000, 16), 100.0)
+        noisy = noisy_forecasts(forecast, error=0.2, seed=1)
+        self.assertAlmostEqual(noisy["forecast"][:, -1].std() / 100, 0.2, delta=0.01)
+        np.testing.assert_allclose(noisy["buy_forecast"], tariff(noisy["forecast"])[0])
+
+        inputs = scenario_inputs(library, rows[0], start="2024-01-01", error=0.0)
+        self.assertEqual(len(inputs["rrp"]), 9 * 288)
+        np.testing.assert_array_equal(inputs["rrp"][::288], rows[0])
+        script = os.path.join(folder, "script.py")
+        with open(script, "w") as f:
+            f.write("action = 'export' if rrp > 5 else 'import'\n")
+        bills = bill_distribution(script, 3, days=6, block_days=3, library=library, workers=1)
+        self.assertEqual(bills.shape, (3,))
+        self.assertAlmostEqual(bills[0], replay(script, None, None, inputs=scenario_inputs(
+            library, library.sample(3, days=6, block_days=3)[0])).bill)
+
+
+class TestTuning(unittest.TestCase):
+
+    def test_extract_apply_and_ranked_sweep(self):
+        source = "SELL_ABOVE = 150\nBUY_BELOW = 60.5\nlower = 1\naction = 'export' if rrp > SELL_ABOVE else 'auto'\n"
+        self.assertEqual(extract_tunables(source), {"SELL_ABOVE": 150, "BUY_BELOW": 60.5})
+        self.assertEqual(extract_tunables(apply_tunables(source, {"SELL_ABOVE": 75, "BUY_BELOW": 1.25})),
+                         {"SELL_ABOVE": 75, "BUY_BELOW": 1.25})
+        self.assertEqual(len(grid_configs(extract_tunables(source), ["SELL_ABOVE"])), 5)
+
+        folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder)
+        write_days(folder, rrp=lambda i: 200.0 if i % 288 in range(200, 220) else 50.0)
+        script = os.path.join(folder, "script.py")
+        with open(script, "w") as f:
+            f.write(source)
+        rows = sweep(script, [{"SELL_ABOVE": 100}, {"SELL_ABOVE": 300}], "2024-01-01 00:00", "2024-01-02 12:00",
+                     workers=2, index=HistoricalIndex(folder))
+        self.assertEqual([row["rank"] for row in rows], [1, 2, 3])
+        self.assertEqual(sorted(row["bill"] for row in rows), [row["bill"] for row in rows])
+        self.assertEqual(rows[-1]["SELL_ABOVE"], 300)
+        self.assertTrue(all(row["errors"] == 0 for row in rows))
+
+
+class TestOptimiser(unittest.TestCase):
+
+    def test_cmaes_minimises_a_quadratic(self):
+        cma = CMAES([0.9] * 4, sigma=0.3)
+        for _ in range(60):
+            candidates = cma.ask()
+            cma.tell(candidates, list(np.argsort(np.sum((candidates - 0.3) ** 2, axis=1))))
+        np.testing.assert_allclose(cma.mean, 0.3, atol=0.01)
+
+    def test_study_prunes_and_resumes(self):
+        source = "sell_above = 300.0\nreserve = {\n    0: 10,\n    1: 10,\n}\naction = 'export' if rrp > sell_above else 'auto'\n"
+        self.assertEqual(read_hour_table(apply_values(source, {"reserve[0-1]": 40}), "reserve"), {0: 40, 1: 40})
+
+        folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder)
+        write_days(folder, days=4, rrp=lambda i: 200.0 if i % 288 in range(200, 220) else 50.0)
+        script = os.path.join(folder, "script.py")
+        with open(script, "w") as f:
+            f.write(source)
+        periods = [(f"day{day}", f"2024-01-0{day} 00:00", f"2024-01-0{day + 1} 00:00") for day in (1, 2, 3)]
+        space = (Parameter("sell_above", 50.0, 400.0),)
+        path = os.path.join(folder, "study.json")
+
+        index = HistoricalIndex(folder)
+        study = Study(path, script, space, {"sell_above": 300.0}, periods, eta=2)
+        best = study.run(1, workers=1, index=index)
+        self.assertLessEqual(best["total"], study.trials['{"sell_above": 300.0}']["total"])
+        self.assertLess(study.evaluations, len(study.trials) * len(periods))
+        self.assertIn("pruned", {trial["status"] for trial in study.trials.values()})
+
+        resumed = Study(path, script, space, {"sell_above": 300.0}, periods, eta=2)
+        self.assertEqual((resumed.cma.generation, resumed.incumbent), (1, study.incumbent))
+        resumed.run(1, workers=1, index=index)
+        self.assertEqual(resumed.cma.generation, 2)
+
+
+class TestVectorRules(unittest.TestCase):
+
+    def test_matches_scalar_ladder_of_edit_script(self):
+        with open("20250406_edit.py") as f:
+            source = f.read()
+        ladder = VectorLadder(source)
+        self.assertEqual(ladder.outputs, ["action", "solar"])
+        constants = dict(literal_constants(source), threshold_1=0.0, threshold_2=20.0)
+        env = random_inputs(ladder, constants, 2000, seed=3)
+        vector, scalar = ladder.evaluate(env), ladder.scalar(env)
+        for name in ladder.outputs:
+            np.testing.assert_array_equal(vector[name], scalar[name])
+        self.assertGreaterEqual(len(set(vector["action"])), 3)
+
+        # The script may hold its hour lists as sets; np.isin alone would match none of them.
+        env.update(night=frozenset(env["night"]), day=frozenset(env["day"]))
+        vector, scalar = ladder.evaluate(env), ladder.scalar(env)
+        for name in ladder.outputs:
+            np.testing.assert_array_equal(vector[name], scalar[name])
+
+    def test_operators_and_parameter_broadcast(self):
+        source = ("if 10 < rrp <= 50 and hour not in peak:\n    action = 'charge'\n"
+                  "elif not cheap or rrp > limit:\n    action = 'export'\n    reason += 'x'\n"
+                  "elif hour in peak:\n    action = 'stopped'\n")
+        ladder = VectorLadder(source)
+        env = {"rrp": np.array([20.0, 60.0, 5.0, 5.0]), "hour": np.array([3, 3, 17, 3]), "peak": [17],
+               "cheap": np.array([True, True, True, False]), "limit": np.array([[100.0], [0.0]])}
+        actions = ladder.evaluate(env)["action"]
+        self.assertEqual(actions.tolist(), [["charge", "auto", "stopped", "export"],
+                                            ["charge", "export", "export", "export"]])
+        np.testing.assert_array_equal(actions, ladder.scalar(env)["action"])
+        with self.assertRaises(ValueError):
+            VectorLadder("if max(rrp) > 1:\n    action = 'a'\nelse:\n    action = 'b'\n")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,359 @@
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import date, datetime, timedelta, timezone
+
+import numpy as np
+
+from historical_prices_qld import cache, ingest, make_dictionary, pipeline, query, settlement_time
+from historical_prices_qld.month_hour_stats import MonthHourStats, fold_new_sources
+from historical_prices_qld.quantile_stats import QUANTILES, MonthHourQuantiles, TDigest
+from historical_prices_qld.seasonal_profile import HOLIDAY, WEEKDAY, WEEKEND, SeasonalProfile, day_type, profile_source
+
+
+def write_month(folder, month, region="QLD1", rows=None):
+    """Write a small PRICE_AND_DEMAND file with one row per 5 minutes."""
+    year, mon = int(month[:4]), int(month[4:])
+    rows = rows if rows is not None else [
+        (f"{year}/{mon:02d}/01 00:{m:02d}:00", 5000.0 + m, 50.0 + m) for m in range(5, 60, 5)
+    ]
+    path = os.path.join(folder, f"PRICE_AND_DEMAND_{month}_{region}.csv")
+    with open(path, "w", newline="") as f:
+        f.write("REGION,SETTLEMENTDATE,TOTALDEMAND,RRP,PERIODTYPE\r\n")
+        for settlement, demand, rrp in rows:
+            f.write(f"{region},{settlement},{demand},{rrp},TRADE\r\n")
+    return path
+
+
+class TestIngest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.store = os.path.join(self.folder, "combined_output.csv")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def _store_lines(self):
+        with open(self.store) as f:
+            return f.read().splitlines()
+
+    def test_only_new_months_are_appended(self):
+        write_month(self.folder, "202301")
+        write_month(self.folder, "202302")
+        self.assertEqual(len(ingest.ingest(self.folder, chunk_rows=4)), 2)
+        self.assertEqual(len(self._store_lines()), 1 + 2 * 11)
+
+        self.assertEqual(ingest.ingest(self.folder), [])
+        write_month(self.folder, "202303")
+        self.assertEqual(ingest.ingest(self.folder), ["PRICE_AND_DEMAND_202303_QLD1.csv"])
+        lines = self._store_lines()
+        self.assertEqual(len(lines), 1 + 3 * 11)
+        self.assertTrue(lines[-1].startswith("QLD1,2023/03/01 00:55:00"))
+
+    def test_changed_file_triggers_rebuild(self):
+        write_month(self.folder, "202301")
+        write_month(self.folder, "202302")
+        ingest.ingest(self.folder)
+        write_month(self.folder, "202301", rows=[("2023/01/01 00:05:00", 1.0, 2.0)])
+        self.assertEqual(len(ingest.ingest(self.folder)), 2)
+        self.assertEqual(len(self._store_lines()), 1 + 1 + 11)
+
+    def test_interrupted_append_is_discarded(self):
+        write_month(self.folder, "202301")
+        ingest.ingest(self.folder)
+        with open(self.store, "a") as f:
+            f.write("QLD1,2023/02/01 00:05:00,1,1,TRADE\r\n")
+        ingest.ingest(self.folder)
+        self.assertEqual(len(self._store_lines()), 1 + 11)
+
+
+class TestIntervalValidation(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder)
+        write_month(self.folder, "202301", rows=[
+            ("2023/01/31 23:50:00", 1.0, 10.0),
+            ("2023/01/31 23:55:00", 1.0, 20.0),
+            ("2023/01/31 23:55:00", 1.0, 21.0),
+            ("2023/02/01 00:00:00", 1.0, 30.0),
+        ])
+        path = write_month(self.folder, "202302", rows=[
+            ("2023/02/01 00:00:00", 1.0, 31.0),
+            ("2023/02/01 00:05:00", 1.0, 40.0),
+            ("2023/02/01 00:20:00", 1.0, 70.0),
+        ])
+        with open(path, "a", newline="") as f:
+            f.write("QLD1,2023/02/01 00:25:00,1,1,PRE-DISPATCH\r\n")
+
+    def _store_rows(self):
+        with open(os.path.join(self.folder, "combined_output.csv")) as f:
+            return [line.split(",") for line in f.read().splitlines()[1:]]
+
+    def test_duplicates_dropped_and_gaps_reported_across_months(self):
+        ingest.ingest(self.folder)
+        self.assertEqual([row[3] for row in self._store_rows()], ["10.0", "20.0", "30.0", "40.0", "70.0"])
+        files = ingest.load_manifest(os.path.join(self.folder, "ingest_manifest.json"))["files"]
+        january, february = files["PRICE_AND_DEMAND_202301_QLD1.csv"], files["PRICE_AND_DEMAND_202302_QLD1.csv"]
+        self.assertEqual(january["quality"]["duplicates"], 1)
+        self.assertEqual(february["quality"]["duplicates"], 1)
+        self.assertEqual(february["quality"]["non_trade"], {"PRE-DISPATCH": 1})
+        self.assertEqual(february["quality"]["first_gaps"], [["2023/02/01 00:05:00", 2]])
+        self.assertEqual(february["rows"], 2)
+
+    def test_month_stats_count_boundary_duplicate_once(self):
+        january = "PRICE_AND_DEMAND_202301_QLD1.csv"
+        folded = fold_new_sources(MonthHourStats(), self.folder)
+        self.assertEqual(int(folded.count.sum()), 5)
+        self.assertAlmostEqual(folded.mean[24], (30.0 + 40.0 + 70.0) / 3)
+        # February folded on its own, after January was saved, still starts from January's last row.
+        incremental = MonthHourStats()
+        incremental.sources[january] = folded.sources[january]
+        incremental = fold_new_sources(incremental, self.folder)
+        self.assertEqual(int(incremental.count[24]), 2)
+
+    def test_fill_policy_change_rebuilds_store(self):
+        ingest.ingest(self.folder)
+        ingest.ingest(self.folder, fill="ffill")
+        rows = self._store_rows()
+        self.assertEqual([(row[1][11:16], row[3], row[4]) for row in rows[3:]],
+                         [("00:05", "40.0", "TRADE"), ("00:10", "40.0", "FFILL"),
+                          ("00:15", "40.0", "FFILL"), ("00:20", "70.0", "TRADE")])
+        ingest.ingest(self.folder, fill="mark")
+        self.assertEqual([row[3] for row in self._store_rows()[4:6]], ["nan", "nan"])
+        self.assertTrue(np.isnan(cache.load_cache(self.folder)["rrp"][4]))
+
+
+class TestCache(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_columns_are_memory_mapped_and_sorted(self):
+        write_month(self.folder, "202301", region="NSW1")
+        write_month(self.folder, "202301")
+        columns = cache.load_cache(self.folder)
+        self.assertIsInstance(columns["rrp"], np.memmap)
+        self.assertEqual(columns["rrp"].dtype, np.float32)
+        self.assertEqual(list(columns["region"][:2]), [cache.REGION_CODES["QLD1"]] * 2)
+        # 2023/01/01 00:05:00 market time is 2022-12-31 14:05:00 UTC
+        self.assertEqual(int(columns["settlement"][0]), 1672495500)
+        self.assertEqual(float(columns["demand"][0]), 5005.0)
+
+    def test_changed_source_invalidates_cache(self):
+        write_month(self.folder, "202301")
+        self.assertEqual(len(cache.load_cache(self.folder)["rrp"]), 11)
+        write_month(self.folder, "202302")
+        self.assertEqual(len(cache.load_cache(self.folder)["rrp"]), 22)
+        write_month(self.folder, "202301", rows=[("2023/01/01 00:05:00", 1.0, -12.5)])
+        columns = cache.load_cache(self.folder)
+        self.assertEqual(len(columns["rrp"]), 12)
+        self.assertEqual(float(columns["rrp"][0]), -12.5)
+
+
+class TestMonthHourStats(unittest.TestCase):
+
+    def test_chunked_and_merged_updates_match_numpy(self):
+        rng = np.random.default_rng(1)
+        month = rng.integers(1, 13, 5000)
+        hour = rng.integers(0, 24, 5000)
+        values = rng.lognormal(4, 1.5, 5000)
+        first, second = MonthHourStats(), MonthHourStats()
+        for start in range(0, 3000, 750):
+            first.update(month[start:start + 750], hour[start:start + 750], values[start:start + 750])
+        second.update(month[3000:], hour[3000:], values[3000:])
+        merged = first.merge(second)
+        bucket = (month - 1) * 24 + hour
+        for b in (0, 17, 287):
+            self.assertAlmostEqual(merged.mean[b], values[bucket == b].mean(), places=9)
+            self.assertAlmostEqual(merged.std()[b], values[bucket == b].std(ddof=1), places=9)
+
+    def test_new_months_fold_into_saved_state(self):
+        folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder)
+        state = os.path.join(folder, "state.npz")
+        write_month(folder, "202301")
+        fold_new_sources(MonthHourStats(), folder).save(state)
+        write_month(folder, "202302", rows=[("2023/02/01 00:05:00", 1.0, 10.0), ("2023/02/01 00:10:00", 1.0, 20.0)])
+        stats = fold_new_sources(MonthHourStats.load(state), folder)
+        self.assertEqual(len(stats.sources), 2)
+        self.assertEqual(stats.count[0], 11)
+        self.assertEqual(stats.mean[24], 15.0)
+        table = os.path.join(folder, "table.csv")
+        stats.write_table(table)
+        with open(table) as f:
+            self.assertEqual(f.read().splitlines()[1:], ["1,0,80.0,16.58", "2,0,15.0,7.07"])
+
+
+class TestQuantileStats(unittest.TestCase):
+
+    def test_merged_digest_tracks_exact_quantiles(self):
+        rng = np.random.default_rng(2)
+        values = np.concatenate([rng.normal(90, 20, 20000), rng.lognormal(7, 1, 300)])
+        rng.shuffle(values)
+        digest = TDigest()
+        for part in np.array_split(values[:15000], 7):
+            digest.update(part)
+        other = TDigest()
+        other.update(values[15000:])
+        digest.merge(other)
+        median = np.median(values)
+        mad = np.median(np.abs(values - median))
+        self.assertEqual(digest.count, len(values))
+        self.assertAlmostEqual(float(digest.quantile(0.5)), median, delta=0.02 * mad)
+        self.assertAlmostEqual(digest.mad(), mad, delta=0.02 * mad)
+        for q in (0.05, 0.95):
+            self.assertAlmostEqual(float(digest.quantile(q)), np.quantile(values, q), delta=0.05 * mad)
+
+    def test_spiky_bucket_tail_is_exact(self):
+        rng = np.random.default_rng(4)
+        values = np.concatenate([rng.normal(90, 20, 730), rng.uniform(300, 15000, 14)])
+        rng.shuffle(values)
+        digest = TDigest()
+        for part in np.array_split(values[:500], 3):
+            digest.update(part)
+        other = TDigest()
+        other.update(values[500:])
+        digest.merge(other)
+        self.assertTrue(digest.exact)
+        for q in QUANTILES:
+            self.assertAlmostEqual(float(digest.quantile(q)), np.percentile(values, q * 100), places=9)
+        median = np.median(values)
+        self.assertAlmostEqual(digest.mad(), np.median(np.abs(values - median)), places=9)
+
+    def test_state_round_trips(self):
+        rng = np.random.default_rng(3)
+        quantiles = MonthHourQuantiles()
+        quantiles.update(rng.integers(1, 13, 3000), rng.integers(0, 24, 3000), rng.normal(50, 10, 3000))
+        quantiles.sources["a.csv"] = "abc"
+        path = os.path.join(tempfile.mkdtemp(), "state.npz")
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        quantiles.save(path)
+        loaded = MonthHourQuantiles.load(path)
+        np.testing.assert_allclose(loaded.summary(), quantiles.summary())
+        self.assertEqual(loaded.sources, {"a.csv": "abc"})
+
+
+class TestFlatPriceTable(unittest.TestCase):
+
+    def test_flat_table_matches_nested_lookup(self):
+        table = make_dictionary.load_table()
+        nested, flat = {}, {}
+        exec(make_dictionary.nested_dict_source(table), nested)
+        flat["state"] = "QLD"
+        exec(make_dictionary.flat_table_source({"QLD": (table, None)}), flat)
+        for month, hour in ((1, 0), (1, 18), (7, 12), (12, 23)):
+            expected = nested["QLD_HISTORICAL_PRICES"][month][hour]
+            self.assertEqual(flat["historical_price"](month, hour), (expected["Average_RRP"], expected["SD_RRP"]))
+        with self.assertRaises(KeyError):
+            flat["historical_price"](0, 25)
+
+
+class TestMultiRegionPipeline(unittest.TestCase):
+
+    def test_regions_processed_in_parallel_and_selected_by_state(self):
+        folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder)
+        for region, price in (("QLD1", 80.0), ("NSW1", 200.0)):
+            for mon in range(1, 13):
+                write_month(folder, f"2023{mon:02d}", region, rows=[
+                    (f"2023/{mon:02d}/01 {hour:02d}:{minute}:00", 1.0, price)
+                    for hour in range(24) for minute in ("10", "40")
+                ])
+        summaries = pipeline.run_pipeline(folder, workers=2)
+        self.assertEqual([s["region"] for s in summaries], ["NSW1", "QLD1"])
+        self.assertTrue(os.path.exists(os.path.join(folder, "average_rrp_with_sd_NSW1.csv")))
+        self.assertTrue(os.path.exists(os.path.join(folder, "robust_rrp_stats.csv")))
+
+        tables = make_dictionary.load_region_tables(folder)
+        self.assertEqual(sorted(tables), ["NSW", "QLD"])
+        for state, expected in (("NSW", 200.0), ("QLD", 80.0), ("VIC", 80.0)):
+            namespace = {"state": state}
+            exec(make_dictionary.flat_table_source(tables), namespace)
+            self.assertEqual(namespace["historical_price"](1, 0)[0], expected)
+
+
+class TestSettlementTime(unittest.TestCase):
+
+    def test_parsers_and_calendar_match_datetime(self):
+        rng = np.random.default_rng(3)
+        moments = [datetime(1999, 12, 31, 23, 55), datetime(2024, 2, 29, 0, 0), datetime(2101, 3, 1, 12, 30)]
+        moments += [datetime(2023, 1, 1) + timedelta(minutes=5 * int(n)) for n in rng.integers(0, 300000, 200)]
+        values = [moment.strftime("%Y/%m/%d %H:%M:%S") for moment in moments]
+        expected = [int(moment.replace(tzinfo=timezone.utc).timestamp()) // 60 for moment in moments]
+
+        minutes = settlement_time.parse_settlement(values)
+        self.assertEqual(minutes.tolist(), expected)
+        calendar = settlement_time.calendar_columns(minutes)
+        self.assertEqual(calendar["month"].tolist(), [moment.month for moment in moments])
+        self.assertEqual(calendar["hour"].tolist(), [moment.hour for moment in moments])
+        self.assertEqual(calendar["weekday"].tolist(), [moment.weekday() for moment in moments])
+        self.assertEqual(calendar["slot"].tolist(), [(moment.hour * 60 + moment.minute) // 5 for moment in moments])
+
+        csv_text = "REGION,SETTLEMENTDATE,TOTALDEMAND,RRP,PERIODTYPE\r\n" + "".join(
+            f"{'SA1' if i % 3 else 'QLD1'},{value},123.4,-5.6,TRADE\r\n" for i, value in enumerate(values))
+        self.assertEqual(settlement_time.parse_csv_settlements(csv_text.encode()).tolist(), expected)
+        self.assertEqual(cache.parse_settlement_dates(values[:1]).tolist(), [expected[0] * 60 - 36000])
+
+
+class TestRangeQuery(unittest.TestCase):
+
+    def test_window_is_a_view_of_intervals_inside_it(self):
+        folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder)
+        write_month(folder, "202301")
+        write_month(folder, "202301", region="NSW1")
+        index = query.HistoricalIndex(folder)
+
+        window = index.between("2023-01-01 00:10", "2023-01-01 00:25")
+        self.assertEqual(window["rrp"].tolist(), [65.0, 70.0, 75.0])
+        self.assertIsInstance(window["rrp"].base, np.memmap)
+        self.assertEqual(query.to_epoch(datetime(2023, 1, 1, 0, 15)), int(window["settlement"][0]))
+
+        nsw = index.between("2023/01/01 00:00:00", "2023/01/01 00:05:00", region="NSW1")
+        self.assertEqual(len(nsw["rrp"]), 1)
+        self.assertEqual(index.at("2023-01-01 00:55")["rrp"], 105.0)
+        with self.assertRaises(KeyError):
+            index.at("2023-01-01 01:00")
+
+
+class TestSeasonalProfile(unittest.TestCase):
+
+    def test_slots_and_day_types_match_scalar_bucketing(self):
+        # Two weeks of 2024-03-25.. spanning Good Friday to Easter Monday.
+        start = np.datetime64("2024-03-25T00:05").astype("datetime64[s]").astype(np.int64) - 36000
+        settlement = start + 300 * np.arange(14 * 288)
+        rrp = np.random.default_rng(2).normal(80, 20, len(settlement))
+        profile = SeasonalProfile.build(settlement, rrp)
+
+        expected = {}
+        for when, price in zip(settlement, rrp):
+            moment = datetime.fromtimestamp(int(when) + 36000, tz=timezone.utc)
+            key = (moment.month, day_type(moment.date()), (moment.hour * 60 + moment.minute) // 5)
+            expected.setdefault(key, []).append(price)
+        for (month, kind, slot), prices in expected.items():
+            if kind == HOLIDAY and len(prices) < 2:
+                continue  # Easter Monday alone in April: sparse, filled from weekends
+            mean, _ = profile.price(month, kind, slot)
+            self.assertAlmostEqual(mean, np.mean(prices), places=3)
+        self.assertEqual(day_type(date(2024, 3, 29)), HOLIDAY)
+        self.assertEqual(day_type(date(2024, 3, 27)), WEEKDAY)
+        self.assertEqual(day_type(date(2024, 4, 6)), WEEKEND)
+
+        # May has no holidays in this data, so it falls back to the weekend profile.
+        self.assertTrue(np.all(profile.count[4, HOLIDAY] == 0))
+        np.testing.assert_array_equal(profile.mean[4, HOLIDAY], profile.mean[4, WEEKEND])
+
+        namespace = {}
+        exec(profile_source(profile), namespace)
+        when = datetime(2024, 3, 29, 17, 30)
+        self.assertEqual(namespace["seasonal_price"](when), round(profile.price(3, HOLIDAY, 210)[0]))
+
+
+if __name__ == '__main__':
+    unittest.main()